@@ -5,11 +5,28 @@ and voice transcription service. It contains only UI glue and event
 handlers; core logic lives in `rag_pipeline.py` and `services/`.
 """
 
-import gradio as gr
-from rag_pipeline import rag_stream
-from services.voice_service import transcribe_audio
+from services import startup
+from contextlib import aclosing, asynccontextmanager
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from rag_pipeline import rag_stream, prefetch_context, stop_request, _STOPPED_MSG
+from services.voice_service import transcribe_audio, warm_deepgram
+from services import live_transcription, metrics, workers
+from services.embedding_provider import warm_cohere
+from services.model_providers import warm_gemini, warm_groq, warm_openrouter
+from services.search_provider import close_search_client, warm_local_index, warm_weaviate
+from services.session_store import get_session_store
+from services.tts import SpeechPipeline, get_tts_provider
+from config import settings
 from pathlib import Path
+import asyncio
 import os
+import uvicorn
+
+# Provider SDKs are imported lazily; gradio is timed on its own as the
+# largest import left on the startup path
+startup.mark("import app modules")
+gr = startup.lazy_import("gradio")
 
 
 # --- UI Helpers ---
@@ -51,29 +68,135 @@ speak_js = """
 """
 
 
-async def process_voice_input(audio_path):
+async def process_voice_input(audio_path, request: gr.Request):
     """Transcribes audio and returns it to the textbox."""
     if audio_path is None:
         return ""
     text = await transcribe_audio(audio_path)
+    # Start retrieval while the user reviews the transcript
+    prefetch_context(request.session_hash, text)
+    return text
+
+
+async def start_voice_stream(request: gr.Request):
+    """Open the live transcription connection as soon as recording starts."""
+    live_transcription.start_session(request.session_hash)
+
+
+async def stream_voice_chunk(chunk, request: gr.Request):
+    """Forwards a microphone chunk and shows the transcript so far."""
+    if chunk is None:
+        return gr.skip()
+    sample_rate, samples = chunk
+    text = await live_transcription.feed(request.session_hash, sample_rate, samples)
+    return gr.skip() if text is None else text
+
+
+async def finish_voice_stream(request: gr.Request):
+    """Returns the final transcript once the user stops recording."""
+    text = await live_transcription.finish_session(request.session_hash)
+    prefetch_context(request.session_hash, text)
     return text
 
 
-async def chat_wrapper(query, hist_a, hist_b, hist_c):
+async def prefetch_input(text, request: gr.Request):
+    """Speculatively retrieve context while the user is typing."""
+    prefetch_context(request.session_hash, text)
+
+
+async def chat_wrapper(query, request: gr.Request):
+    """Streams the three answers to `query`.
+
+    Only the new question comes from the browser; the histories are
+    loaded from the session store and the finished turn is saved back.
+    """
+    no_audio = (gr.skip(),) * 3 if settings.TTS_ENABLED else ()
     if not query or query.strip() == "":
-        yield hist_a, hist_b, hist_c
+        yield (gr.skip(),) * 3 + no_audio
         return
-    async for updated_a, updated_b, updated_c in rag_stream(query, hist_a, hist_b, hist_c):
-        yield updated_a, updated_b, updated_c
+    sessions = get_session_store()
+    session_id = request.session_hash
+    hist_a, hist_b, hist_c = await sessions.histories(session_id)
+    turn_start = len(hist_a)
+    frames = rag_stream(query, hist_a, hist_b, hist_c, session_id=session_id)
+    if settings.TTS_ENABLED:
+        frames = speak_frames(frames, [hist_a, hist_b, hist_c])
+    # rag_stream yields None for columns that did not change in a frame;
+    # skipping them keeps Gradio from re-sending untouched chats.
+    # Closing the stream when this event is cancelled or the client goes
+    # away cancels the provider streams behind it.
+    try:
+        async with aclosing(frames):
+            async for frame in frames:
+                yield tuple(gr.skip() if value is None else value for value in frame)
+    finally:
+        # Stopped or interrupted turns are kept with what was streamed so far
+        if len(hist_a) > turn_start:
+            sessions.record(session_id, query, [hist[-1]["content"] for hist in (hist_a, hist_b, hist_c)])
+
+
+async def stop_all(request: gr.Request):
+    """Stops every model of the session's in-flight request."""
+    stop_request(request.session_hash)
+
+
+def stop_column(label):
+    """Handler stopping one model column of the in-flight request."""
+    async def stop(request: gr.Request):
+        stop_request(request.session_hash, label)
+    return stop
+
+
+async def speak_frames(frames, hists):
+    """Adds an audio slot per column to each frame.
+
+    New answer text is read from the histories rag_stream updates in
+    place, split into sentences and synthesized while the models are
+    still writing; segments are streamed to the hidden players in order.
+    """
+    pipelines = [SpeechPipeline(get_tts_provider(), settings.TTS_CONCURRENCY) for _ in hists]
+    spoken = [0] * len(hists)
+    next_frame = asyncio.ensure_future(anext(frames))
+    try:
+        while next_frame is not None or not all(p.finished for p in pipelines):
+            if not any(p.ready for p in pipelines):
+                waits = [asyncio.ensure_future(p.wait()) for p in pipelines if not p.finished]
+                await asyncio.wait(waits + ([next_frame] if next_frame else []), return_when=asyncio.FIRST_COMPLETED)
+                for waiter in waits:
+                    waiter.cancel()
+
+            frame = (None,) * len(hists)
+            if next_frame is not None and next_frame.done():
+                try:
+                    frame = next_frame.result()
+                    next_frame = asyncio.ensure_future(anext(frames))
+                except StopAsyncIteration:
+                    next_frame = None
+                for index, (hist, pipeline) in enumerate(zip(hists, pipelines)):
+                    text = hist[-1]["content"] if hist and hist[-1]["role"] == "assistant" else ""
+                    if text.endswith(_STOPPED_MSG):
+                        # A stopped model goes quiet too
+                        pipeline.cancel()
+                    elif len(text) > spoken[index]:
+                        pipeline.feed(text[spoken[index]:])
+                    spoken[index] = len(text)
+                    if next_frame is None:
+                        pipeline.close()
+
+            audio = tuple(p.take() for p in pipelines)
+            if any(value is not None for value in frame + audio):
+                yield frame + audio
+    finally:
+        if next_frame is not None:
+            next_frame.cancel()
+            await asyncio.gather(next_frame, return_exceptions=True)
+        for pipeline in pipelines:
+            pipeline.cancel()
+        await frames.aclose()
 
 
 # --- Layout ---
 with gr.Blocks() as demo:
-    # State for History
-    history_a = gr.State([])
-    history_b = gr.State([])
-    history_c = gr.State([])
-
     gr.Markdown("## SUNMARKE SCHOOL ASSISTANT")
 
     with gr.Row():
@@ -81,55 +204,158 @@ with gr.Blocks() as demo:
         with gr.Column(elem_classes="model-column"):
             gr.Markdown("### DEEPSEEK")
             chat_a = gr.Chatbot(label=None, height=450)
-            audio_a = gr.Audio(visible=False, autoplay=True)
-            speak_a = gr.Button("🔊 Speak Response")
+            audio_a = gr.Audio(visible=False, autoplay=True, streaming=settings.TTS_ENABLED)
+            with gr.Row():
+                speak_a = gr.Button("🔊 Speak Response")
+                stop_a = gr.Button("⏹ Stop", variant="stop")
             speak_a.click(fn=None, inputs=[chat_a], outputs=None, js=speak_js)
+            stop_a.click(stop_column("a"), outputs=None, queue=False)
 
         # Column B: Kimi
         with gr.Column(elem_classes="model-column"):
             gr.Markdown("### KIMI")
             chat_b = gr.Chatbot(label=None, height=450)
-            audio_b = gr.Audio(visible=False, autoplay=True)
-            speak_b = gr.Button("🔊 Speak Response")
+            audio_b = gr.Audio(visible=False, autoplay=True, streaming=settings.TTS_ENABLED)
+            with gr.Row():
+                speak_b = gr.Button("🔊 Speak Response")
+                stop_b = gr.Button("⏹ Stop", variant="stop")
             speak_b.click(fn=None, inputs=[chat_b], outputs=None, js=speak_js)
+            stop_b.click(stop_column("b"), outputs=None, queue=False)
 
         # Column C: Gemini
         with gr.Column(elem_classes="model-column"):
             gr.Markdown("### GEMINI")
             chat_c = gr.Chatbot(label=None, height=450)
-            audio_c = gr.Audio(visible=False, autoplay=True)
-            speak_c = gr.Button("🔊 Speak Response")
+            audio_c = gr.Audio(visible=False, autoplay=True, streaming=settings.TTS_ENABLED)
+            with gr.Row():
+                speak_c = gr.Button("🔊 Speak Response")
+                stop_c = gr.Button("⏹ Stop", variant="stop")
             speak_c.click(fn=None, inputs=[chat_c], outputs=None, js=speak_js)
+            stop_c.click(stop_column("c"), outputs=None, queue=False)
 
     # Bottom Fixed Input Bar
     with gr.Row(elem_id="bottom-bar"):
         with gr.Column(scale=4):
             user_input = gr.Textbox(show_label=False, placeholder="Ask something...", container=False)
         with gr.Column(scale=1):
-            # Mic Button
-            mic_btn = gr.Audio(sources=["microphone"], type="filepath", label="Mic", container=False)
+            # Mic Button (streams chunks for live transcription when enabled)
+            if settings.VOICE_STREAMING:
+                mic_btn = gr.Audio(sources=["microphone"], type="numpy", streaming=True, label="Mic", container=False)
+            else:
+                mic_btn = gr.Audio(sources=["microphone"], type="filepath", label="Mic", container=False)
         with gr.Column(scale=1):
             submit_btn = gr.Button("Send", variant="primary")
+            stop_btn = gr.Button("Stop", variant="stop")
 
     # --- Event Logic ---
-    # Voice-to-Text: Triggered when user stops recording
-    mic_btn.stop_recording(process_voice_input, inputs=[mic_btn], outputs=[user_input])
+    # Voice-to-Text: live partial transcripts while recording, final one on stop.
+    # No Gradio concurrency limit: each speaker has their own transcription
+    # connection, and a final flush can take seconds
+    if settings.VOICE_STREAMING:
+        mic_btn.start_recording(start_voice_stream, outputs=None, queue=False)
+        mic_btn.stream(stream_voice_chunk, inputs=[mic_btn], outputs=[user_input],
+                       stream_every=settings.VOICE_STREAM_EVERY, show_progress="hidden", concurrency_limit=None)
+        mic_btn.stop_recording(finish_voice_stream, outputs=[user_input], concurrency_limit=None)
+    else:
+        # Triggered when user stops recording
+        mic_btn.stop_recording(process_voice_input, inputs=[mic_btn], outputs=[user_input], concurrency_limit=None)
+
+    # Prefetch: retrieval starts while the user is still typing
+    user_input.change(prefetch_input, inputs=[user_input], outputs=None,
+                      queue=False, trigger_mode="always_last", show_progress="hidden")
 
-    # Submission Logic
+    # Submission Logic: only the question is sent, histories live in the session store
+    # (server-side speech streams into the hidden players)
+    chat_outputs = [chat_a, chat_b, chat_c] + ([audio_a, audio_b, audio_c] if settings.TTS_ENABLED else [])
+    # No Gradio concurrency limit (its default is 1 run at a time across all users):
+    # the provider schedulers do the admission control
     submit_click = submit_btn.click(lock_input, outputs=[user_input, submit_btn])\
-        .then(chat_wrapper, inputs=[user_input, chat_a, chat_b, chat_c], outputs=[chat_a, chat_b, chat_c])\
+        .then(chat_wrapper, inputs=[user_input], outputs=chat_outputs, concurrency_limit=None)\
         .then(lambda: "", outputs=[user_input])\
         .then(unlock_input, outputs=[user_input, submit_btn])
 
     user_input.submit(lock_input, outputs=[user_input, submit_btn])\
-        .then(chat_wrapper, inputs=[user_input, chat_a, chat_b, chat_c], outputs=[chat_a, chat_b, chat_c])\
+        .then(chat_wrapper, inputs=[user_input], outputs=chat_outputs, concurrency_limit=None)\
         .then(lambda: "", outputs=[user_input])\
         .then(unlock_input, outputs=[user_input, submit_btn])
 
+    # Stop ends the streams gracefully, so the chains above still unlock the input
+    stop_btn.click(stop_all, outputs=None, queue=False)
+
 CSS = Path("assets/styles.css").read_text()
+startup.mark("build UI")
 
-if __name__ == "__main__":
-    demo.launch(server_name="0.0.0.0",
-    server_port=int(os.getenv("PORT", default=5000)),
-    css=CSS
+
+# --- Server ---
+def warmers():
+    """Warm-up coroutine of every configured provider."""
+    targets = {}
+    if settings.OPEN_ROUTER_API_KEY:
+        targets["openrouter"] = warm_openrouter
+    if settings.GROQ_API_KEY:
+        targets["groq"] = warm_groq
+    if settings.GEMINI_API_KEY:
+        targets["gemini"] = warm_gemini
+    if settings.COHERE_API_KEY:
+        targets["cohere"] = warm_cohere
+    if settings.DEEPGRAM_API_KEY:
+        targets["deepgram"] = warm_deepgram
+    if settings.SEARCH_BACKEND != "local" and settings.SUNMARKE_WEAVIATE_URL:
+        targets["weaviate"] = warm_weaviate
+    if settings.SEARCH_BACKEND == "local" or settings.SEARCH_LOCAL_FALLBACK:
+        targets["local_index"] = warm_local_index
+    return targets
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    metrics.start_loop_monitor()
+    # Connections open in the background; the UI serves straight away
+    targets = warmers() if settings.WARMUP_ENABLED else {}
+    startup.start_warmup(targets, settings.WARMUP_TIMEOUT)
+    # Re-run the provider warmers so pooled connections never sit idle past their expiry
+    startup.keep_warm(
+        {name: fn for name, fn in targets.items() if name in ("openrouter", "groq", "gemini", "cohere", "deepgram")},
+        settings.KEEPWARM_INTERVAL,
+        settings.WARMUP_TIMEOUT,
     )
+    yield
+    startup.stop_warmup()
+    await close_search_client()
+
+
+def healthz():
+    """Liveness: the process is up and its event loop is serving."""
+    return JSONResponse({"status": "ok", "uptime": round(startup.uptime(), 3)})
+
+
+def readyz():
+    """Readiness: 503 until every warm-up target has finished."""
+    status = startup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+
+def metrics_endpoint():
+    """Prometheus text exposition of pipeline metrics."""
+    if not metrics.ENABLED:
+        return PlainTextResponse("metrics disabled; set METRICS_ENABLED=true\n", status_code=404)
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def create_server() -> FastAPI:
+    """FastAPI app serving the Gradio UI at / next to /metrics, /healthz and /readyz."""
+    server = FastAPI(lifespan=lifespan)
+    server.add_api_route("/metrics", metrics_endpoint, methods=["GET"])
+    server.add_api_route("/healthz", healthz, methods=["GET"])
+    server.add_api_route("/readyz", readyz, methods=["GET"])
+    with startup.timed("mount UI"):
+        return gr.mount_gradio_app(server, demo, path="/", css=CSS)
+
+
+if __name__ == "__main__":
+    host, port = os.getenv("HOST", "0.0.0.0"), int(os.getenv("PORT", default=5000))
+    if workers.is_supervisor():
+        # WORKERS > 1: this process only supervises; the workers run this file again
+        workers.serve(host, port, settings.WORKERS)
+    else:
+        uvicorn.run(create_server(), host=host, port=port)
@@ -0,0 +1,207 @@
+"""Recall and latency benchmark for the IVF index in `services.ann_index`.
+
+Scales the real chunk embeddings up to synthetic corpora of the given
+sizes: each synthetic vector interpolates between two real chunk
+vectors and adds Gaussian noise, so the data keeps the shape of the
+embedding space. Vectors are generated in deterministic batches and
+never held as one float32 matrix, so 1M x 1536 fits in a few GB.
+
+For every size the index is trained on a sample, filled through
+incremental `add` calls, saved and reloaded, and compared with an
+exact scan:
+
+- build: k-means training time and insert throughput
+- recall@k of the approximate top k, and of the top `--candidates`
+  (what `local_search` re-scores exactly) for each `nprobe`
+- p50/p95 query latency of the index and of a single-query exact scan
+- index memory against the float32 matrix, file size and load time
+
+Usage:
+    python -m benchmarks.ann_benchmark --sizes 10000 100000
+    python -m benchmarks.ann_benchmark --sizes 1000000 --nprobe 8 16 32 64
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from benchmarks.load_test import RESULTS_DIR, _commit, _peak_rss_mb, summarize
+from services.ann_index import BATCH_SIZE, TRAIN_POINTS_PER_LIST, IVFIndex, default_lists, normalize, train_centroids
+from services.corpus_store import is_store, load_store
+
+
+def load_base(path: str) -> np.ndarray:
+    """Unit-length embeddings of the real corpus (JSON file or corpus store)."""
+    if is_store(path):
+        return normalize(load_store(path).dense())
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    return normalize(np.array([item["embedding"] for item in data], dtype=np.float32))
+
+
+def synthetic(base: np.ndarray, start: int, size: int, noise: float, seed: int) -> np.ndarray:
+    """Rows `start..start+size` of a synthetic corpus; the same rows every call."""
+    rng = np.random.default_rng([seed, start])
+    first = base[rng.integers(0, len(base), size)]
+    second = base[rng.integers(0, len(base), size)]
+    mix = rng.uniform(0, 0.5, (size, 1)).astype(np.float32)
+    jitter = rng.standard_normal((size, base.shape[1]), dtype=np.float32) * (noise / np.sqrt(base.shape[1]))
+    return normalize(first * (1 - mix) + second * mix + jitter)
+
+
+def batches(base: np.ndarray, count: int, noise: float, seed: int) -> Iterator[np.ndarray]:
+    for start in range(0, count, BATCH_SIZE):
+        yield synthetic(base, start, min(BATCH_SIZE, count - start), noise, seed)
+
+
+def exact_search(base: np.ndarray, count: int, queries: np.ndarray, k: int, noise: float, seed: int, timed: int):
+    """Exact top-k ids of every query by streaming the corpus, plus the
+    single-query scan time of the first `timed` queries."""
+    best_ids = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    scan = np.zeros(timed)
+    for offset, batch in zip(range(0, count, BATCH_SIZE), batches(base, count, noise, seed)):
+        for i in range(timed):
+            start = time.perf_counter()
+            scores = batch @ queries[i]
+            np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            scan[i] += time.perf_counter() - start
+        scores = queries @ batch.T
+        ids = np.broadcast_to(np.arange(offset, offset + len(batch)), scores.shape)
+        best_scores = np.concatenate([best_scores, scores], axis=1)
+        best_ids = np.concatenate([best_ids, ids], axis=1)
+        if best_scores.shape[1] > k:
+            top = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(best_scores, top, axis=1)
+            best_ids = np.take_along_axis(best_ids, top, axis=1)
+    return best_ids, list(scan)
+
+
+def recall(found: List[np.ndarray], truth: np.ndarray) -> float:
+    return float(np.mean([len(set(ids.tolist()) & set(row.tolist())) / len(row) for ids, row in zip(found, truth)]))
+
+
+def run_size(args, base: np.ndarray, queries: np.ndarray, count: int) -> Dict:
+    dim = base.shape[1]
+    n_lists = min(args.lists or default_lists(count), count)
+    result: Dict = {"size": count, "n_lists": n_lists}
+
+    # The synthetic rows are i.i.d., so the first rows are a fair training sample
+    started = time.perf_counter()
+    sample = synthetic(base, 0, min(count, n_lists * TRAIN_POINTS_PER_LIST), args.noise, args.seed + 1)
+    index = IVFIndex(train_centroids(sample, n_lists, seed=args.seed), nprobe=args.nprobe[0])
+    result["train_seconds"] = time.perf_counter() - started
+    del sample
+
+    started = time.perf_counter()
+    for batch in batches(base, count, args.noise, args.seed):
+        index.add(batch)
+    added = time.perf_counter() - started
+    result["add_seconds"] = added
+    result["inserts_per_second"] = count / added if added else None
+
+    truth, scan = exact_search(base, count, queries, args.k, args.noise, args.seed, min(args.timed, len(queries)))
+    result["exact_ms"] = summarize(scan)
+
+    result["nprobe"] = {}
+    depth = max(args.k, args.candidates)
+    for nprobe in args.nprobe:
+        latencies, top_k, top_candidates = [], [], []
+        for query in queries:
+            start = time.perf_counter()
+            ids, _ = index.search(query, depth, nprobe)
+            latencies.append(time.perf_counter() - start)
+            top_k.append(ids[:args.k])
+            top_candidates.append(ids)
+        result["nprobe"][nprobe] = {
+            "recall": recall(top_k, truth),
+            "candidate_recall": recall(top_candidates, truth),
+            "latency_ms": summarize(latencies),
+        }
+
+    result["index_mb"] = index.nbytes / 2**20
+    result["float32_mb"] = count * dim * 4 / 2**20
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "ann_index.npz")
+        started = time.perf_counter()
+        index.save(path)
+        result["save_seconds"] = time.perf_counter() - started
+        result["file_mb"] = os.path.getsize(path) / 2**20
+        del index
+        started = time.perf_counter()
+        loaded = IVFIndex.load(path)
+        result["load_seconds"] = time.perf_counter() - started
+        result["loaded_index_mb"] = loaded.nbytes / 2**20
+    result["peak_rss_mb"] = _peak_rss_mb()
+    return result
+
+
+def _fmt(value, digits: int = 1) -> str:
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def report(results: List[Dict], k: int, candidates: int) -> str:
+    lines = []
+    for result in results:
+        exact = result["exact_ms"]
+        lines.append(
+            f"size={result['size']} lists={result['n_lists']}  train={result['train_seconds']:.1f}s "
+            f"add={result['add_seconds']:.1f}s ({result['inserts_per_second']:.0f}/s)  "
+            f"index={result['loaded_index_mb']:.1f}MB vs float32={result['float32_mb']:.1f}MB  "
+            f"file={result['file_mb']:.1f}MB load={result['load_seconds']:.2f}s  peak_rss={result['peak_rss_mb']:.0f}MB"
+        )
+        lines.append(f"  {'nprobe':<10}{f'recall@{k}':>12}{f'in top {candidates}':>14}{'p50 ms':>10}{'p95 ms':>10}")
+        lines.append(f"  {'exact':<10}{'1.000':>12}{'1.000':>14}{_fmt(exact['p50'], 2):>10}{_fmt(exact['p95'], 2):>10}")
+        for nprobe, stats in result["nprobe"].items():
+            latency = stats["latency_ms"]
+            lines.append(
+                f"  {nprobe:<10}{stats['recall']:>12.3f}{stats['candidate_recall']:>14.3f}"
+                f"{_fmt(latency['p50'], 2):>10}{_fmt(latency['p95'], 2):>10}"
+            )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="IVF index recall/latency against exact search on synthetic corpora")
+    parser.add_argument("--corpus", default="data/chunks_embeddings.json", help="Real embeddings to scale up (JSON or corpus store)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="Synthetic corpus sizes")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64], help="Cells probed per query")
+    parser.add_argument("--lists", type=int, default=0, help="Cells per index (0 = about sqrt(size))")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared for recall")
+    parser.add_argument("--candidates", type=int, default=100, help="Candidates re-scored exactly (local_search fusion_limit)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--timed", type=int, default=20, help="Queries timed for the exact scan")
+    parser.add_argument("--noise", type=float, default=0.6, help="Norm of the Gaussian noise added to synthetic vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/ann-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    base = load_base(args.corpus)
+    # Queries come from the same distribution but are not corpus rows
+    queries = synthetic(base, 0, args.queries, args.noise, args.seed + 2)
+    results = []
+    for count in args.sizes:
+        results.append(run_size(args, base, queries, count))
+        print(report(results[-1:], args.k, args.candidates), flush=True)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"ann-{_commit()}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump({
+            "commit": _commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "params": {key: value for key, value in vars(args).items() if key != "output"},
+            "base_vectors": len(base),
+            "results": results,
+        }, file, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
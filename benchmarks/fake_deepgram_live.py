@@ -0,0 +1,123 @@
+"""Local stand-in for Deepgram's live transcription websocket.
+
+Accepts the same connection as `wss://api.deepgram.com/v1/listen`
+(raw 16 kHz mono `linear16` audio frames plus `Finalize` /
+`CloseStream` control messages) and "recognizes" a scripted
+transcript: words are revealed in proportion to the seconds of audio
+received, as interim results every `interim_every` seconds of audio and
+as final results every `final_every` seconds. On `CloseStream` the
+remaining words are sent as a final result after `finalize_latency`,
+followed by a `Metadata` message, and the socket is closed.
+
+Usage:
+    python -m benchmarks.fake_deepgram_live --port 8765 --transcript "What are the school fees?"
+    DEEPGRAM_LIVE_URL=ws://127.0.0.1:8765/v1/listen python app.py
+"""
+
+import argparse
+import asyncio
+import json
+from typing import List, Optional
+
+from websockets.asyncio.server import Server, ServerConnection, serve
+
+BYTES_PER_SECOND = 16000 * 2
+
+
+class FakeDeepgramLive:
+    def __init__(
+        self,
+        transcript: str = "What are the school fees for Year 7?",
+        words_per_second: float = 2.5,
+        interim_every: float = 0.25,
+        final_every: float = 2.0,
+        finalize_latency: float = 0.05,
+    ) -> None:
+        self.words = transcript.split()
+        self.words_per_second = words_per_second
+        self.interim_every = interim_every
+        self.final_every = final_every
+        self.finalize_latency = finalize_latency
+        self.connections = 0
+        self.bytes_received = 0
+
+    def _spoken(self, seconds: float) -> int:
+        return min(len(self.words), int(seconds * self.words_per_second))
+
+    @staticmethod
+    def _result(words: List[str], is_final: bool, start: float, duration: float) -> str:
+        return json.dumps({
+            "type": "Results",
+            "is_final": is_final,
+            "speech_final": is_final,
+            "start": start,
+            "duration": duration,
+            "channel": {"alternatives": [{"transcript": " ".join(words), "confidence": 0.99}]},
+        })
+
+    async def handler(self, connection: ServerConnection) -> None:
+        self.connections += 1
+        received = 0
+        finalized_words = 0
+        finalized_at = 0.0
+        last_interim = 0.0
+
+        async def flush_final(seconds: float) -> None:
+            nonlocal finalized_words, finalized_at
+            spoken = self._spoken(seconds)
+            await connection.send(self._result(self.words[finalized_words:spoken], True, finalized_at, seconds - finalized_at))
+            finalized_words, finalized_at = spoken, seconds
+
+        async for message in connection:
+            seconds = received / BYTES_PER_SECOND
+            if isinstance(message, bytes):
+                received += len(message)
+                self.bytes_received += len(message)
+                seconds = received / BYTES_PER_SECOND
+                if seconds - finalized_at >= self.final_every:
+                    await flush_final(seconds)
+                    last_interim = seconds
+                elif seconds - last_interim >= self.interim_every:
+                    words = self.words[finalized_words:self._spoken(seconds)]
+                    await connection.send(self._result(words, False, finalized_at, seconds - finalized_at))
+                    last_interim = seconds
+                continue
+
+            control = json.loads(message).get("type")
+            if control in ("Finalize", "CloseStream"):
+                await asyncio.sleep(self.finalize_latency)
+                # Whatever was said is recognized once the speaker stops
+                await connection.send(self._result(self.words[finalized_words:], True, finalized_at, seconds - finalized_at))
+                finalized_words, finalized_at = len(self.words), seconds
+            if control == "CloseStream":
+                await connection.send(json.dumps({"type": "Metadata", "duration": seconds}))
+                await connection.close()
+                return
+
+
+async def start_server(fake: FakeDeepgramLive, host: str = "127.0.0.1", port: int = 0) -> Server:
+    """Start serving `fake`; the bound port is `server.sockets[0].getsockname()[1]`."""
+    return await serve(fake.handler, host, port)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Local Deepgram live transcription stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--transcript", default="What are the school fees for Year 7?")
+    parser.add_argument("--words-per-second", type=float, default=2.5)
+    parser.add_argument("--finalize-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+
+    fake = FakeDeepgramLive(args.transcript, args.words_per_second, finalize_latency=args.finalize_latency)
+
+    async def run() -> None:
+        server = await start_server(fake, args.host, args.port)
+        print(f"Fake Deepgram live endpoint at ws://{args.host}:{args.port}/v1/listen")
+        await server.serve_forever()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""Local stand-ins for the external services used on the request path.
+
+Each fake mimics just the slice of the SDK surface the adapters in
+`services/` call (Cohere `embed`, Weaviate `collections.get().query.
+hybrid`, OpenAI/Groq `chat.completions.create(stream=True)`, Gemini
+`models.generate_content_stream` and Deepgram `listen.v1.media.
+transcribe_file`) and simulates it from a `ServiceProfile`: a
+log-normal latency distribution, an output token rate and a failure
+rate. Nothing leaves the process, so load tests spend no quota.
+
+`install_fakes` swaps the clients into the already-imported service
+modules.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import random
+from dataclasses import asdict, dataclass
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional
+
+SERVICES = ("cohere", "weaviate", "openrouter", "groq", "gemini", "deepgram")
+
+_WORDS = (
+    "Sunmarke offers a broad curriculum with dedicated teachers, modern facilities "
+    "and a wide range of co-curricular activities for every student"
+).split()
+_Z95 = 1.6449
+
+
+class FakeServiceError(RuntimeError):
+    """Injected failure raised by a fake service."""
+
+
+@dataclass
+class LatencyModel:
+    """Log-normal latency described by its median and 95th percentile (ms)."""
+
+    median_ms: float
+    p95_ms: float
+
+    def sample(self, rng: random.Random) -> float:
+        """One latency draw in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95_ms, self.median_ms) / self.median_ms) / _Z95
+        return rng.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+@dataclass
+class ServiceProfile:
+    """Simulated behaviour of one external service.
+
+    `latency` is the response time (time to first token for streaming
+    models); `tokens_per_second` and `output_tokens` shape the rest of
+    a stream. `failure_rate` is the chance a call raises.
+    """
+
+    latency: LatencyModel
+    failure_rate: float = 0.0
+    tokens_per_second: float = 0.0
+    output_tokens: int = 0
+
+
+def default_profiles() -> Dict[str, ServiceProfile]:
+    """Rough production-like numbers for every service."""
+    return {
+        "cohere": ServiceProfile(LatencyModel(120, 300)),
+        "weaviate": ServiceProfile(LatencyModel(80, 250)),
+        "openrouter": ServiceProfile(LatencyModel(1500, 4000), failure_rate=0.02, tokens_per_second=40, output_tokens=300),
+        "groq": ServiceProfile(LatencyModel(300, 700), failure_rate=0.01, tokens_per_second=250, output_tokens=300),
+        "gemini": ServiceProfile(LatencyModel(600, 1500), failure_rate=0.01, tokens_per_second=120, output_tokens=300),
+        "deepgram": ServiceProfile(LatencyModel(400, 900)),
+    }
+
+
+def load_profiles(path: Optional[str] = None) -> Dict[str, ServiceProfile]:
+    """Default profiles, with per-service overrides from a JSON file.
+
+    The file maps service name to any `ServiceProfile` fields, e.g.
+    `{"groq": {"latency": {"median_ms": 200, "p95_ms": 500}, "failure_rate": 0.1}}`.
+    """
+    profiles = default_profiles()
+    if not path:
+        return profiles
+    with open(path, "r", encoding="utf-8") as file:
+        overrides = json.load(file)
+    for name, values in overrides.items():
+        if name not in profiles:
+            raise ValueError(f"Unknown service {name!r}; expected one of {SERVICES}")
+        merged = {**asdict(profiles[name]), **values}
+        merged["latency"] = LatencyModel(**{**asdict(profiles[name].latency), **values.get("latency", {})})
+        profiles[name] = ServiceProfile(**merged)
+    return profiles
+
+
+@dataclass
+class FakeStats:
+    calls: int = 0
+    failures: int = 0
+
+
+class _FakeService:
+    def __init__(self, name: str, profile: ServiceProfile, rng: random.Random) -> None:
+        self.name = name
+        self.profile = profile
+        self.rng = rng
+        self.stats = FakeStats()
+
+    async def _respond(self) -> None:
+        """Wait one latency draw, then fail with the configured probability."""
+        self.stats.calls += 1
+        await asyncio.sleep(self.profile.latency.sample(self.rng))
+        if self.rng.random() < self.profile.failure_rate:
+            self.stats.failures += 1
+            raise FakeServiceError(f"{self.name}: injected failure")
+
+    async def _tokens(self) -> AsyncIterator[str]:
+        """Words paced at `tokens_per_second`, flushed in small bursts."""
+        profile = self.profile
+        rate = profile.tokens_per_second or float("inf")
+        burst = max(1, int(rate // 50)) if rate != float("inf") else profile.output_tokens or 1
+        for start in range(0, profile.output_tokens, burst):
+            count = min(burst, profile.output_tokens - start)
+            if rate != float("inf"):
+                await asyncio.sleep(count / rate)
+            yield "".join(_WORDS[(start + i) % len(_WORDS)] + " " for i in range(count))
+
+
+# --- Cohere ---
+class FakeCohereClient(_FakeService):
+    """`cohere.AsyncClientV2` stand-in returning deterministic unit vectors."""
+
+    def __init__(self, profile: ServiceProfile, rng: random.Random, dimension: int = 1536) -> None:
+        super().__init__("cohere", profile, rng)
+        self.dimension = dimension
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha1(text.encode("utf-8")).digest()[:8], "big")
+        local = random.Random(seed)
+        values = [local.gauss(0, 1) for _ in range(self.dimension)]
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    async def embed(self, texts: List[str], **_kwargs):
+        await self._respond()
+        return SimpleNamespace(embeddings=SimpleNamespace(float_=[self._vector(text) for text in texts]))
+
+
+# --- Weaviate ---
+class _FakeQuery:
+    def __init__(self, service: "FakeWeaviateClient") -> None:
+        self.service = service
+
+    async def hybrid(self, query: str, limit: int = 3, **_kwargs):
+        await self.service._respond()
+        docs = self.service.documents
+        offset = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16) % len(docs)
+        picked = [docs[(offset + i) % len(docs)] for i in range(min(limit, len(docs)))]
+        return SimpleNamespace(objects=[SimpleNamespace(properties=dict(doc)) for doc in picked])
+
+
+class FakeWeaviateClient(_FakeService):
+    """`WeaviateAsyncClient` stand-in serving documents from `data/chunks.json`."""
+
+    def __init__(self, profile: ServiceProfile, rng: random.Random, documents: List[Dict]) -> None:
+        super().__init__("weaviate", profile, rng)
+        self.documents = documents
+        self.collections = SimpleNamespace(get=lambda _name: SimpleNamespace(query=_FakeQuery(self)))
+
+    def is_connected(self) -> bool:
+        return True
+
+    async def connect(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+
+def load_documents(path: str = "data/chunks.json") -> List[Dict]:
+    """Chunk records to serve from the fake Weaviate (synthetic if missing)."""
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    text = " ".join(_WORDS)
+    return [{"url": f"https://example.com/page-{i}/", "content": "\n".join([text] * 40)} for i in range(20)]
+
+
+# --- OpenRouter / Groq ---
+class FakeChatClient(_FakeService):
+    """OpenAI-compatible `AsyncOpenAI`/`AsyncGroq` streaming stand-in."""
+
+    def __init__(self, name: str, profile: ServiceProfile, rng: random.Random) -> None:
+        super().__init__(name, profile, rng)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model: str, messages: List[Dict], stream: bool = False, **_kwargs):
+        await self._respond()
+        return self._chunks()
+
+    async def _chunks(self):
+        async for text in self._tokens():
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+
+# --- Gemini ---
+class FakeGeminiClient(_FakeService):
+    """`genai.Client(...).aio` streaming stand-in."""
+
+    def __init__(self, profile: ServiceProfile, rng: random.Random) -> None:
+        super().__init__("gemini", profile, rng)
+        self.models = SimpleNamespace(generate_content_stream=self._generate)
+
+    async def _generate(self, model: str, contents, config=None, **_kwargs):
+        await self._respond()
+        return self._chunks()
+
+    async def _chunks(self):
+        async for text in self._tokens():
+            yield SimpleNamespace(text=text)
+
+
+# --- Deepgram ---
+class FakeDeepgramClient(_FakeService):
+    """`AsyncDeepgramClient` stand-in.
+
+    The "audio" is UTF-8 text: the uploaded bytes are decoded and
+    returned as the transcript, so load tests control what was said.
+    """
+
+    def __init__(self, profile: ServiceProfile, rng: random.Random) -> None:
+        super().__init__("deepgram", profile, rng)
+        media = SimpleNamespace(transcribe_file=self._transcribe)
+        self.listen = SimpleNamespace(v1=SimpleNamespace(media=media))
+
+    async def _transcribe(self, request: bytes, **_kwargs):
+        await self._respond()
+        transcript = request.decode("utf-8", errors="ignore")
+        alternative = SimpleNamespace(transcript=transcript)
+        return SimpleNamespace(results=SimpleNamespace(channels=[SimpleNamespace(alternatives=[alternative])]))
+
+
+@dataclass
+class FakeServices:
+    cohere: FakeCohereClient
+    weaviate: FakeWeaviateClient
+    openrouter: FakeChatClient
+    groq: FakeChatClient
+    gemini: FakeGeminiClient
+    deepgram: FakeDeepgramClient
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {name: asdict(getattr(self, name).stats) for name in SERVICES}
+
+
+def build_fakes(profiles: Dict[str, ServiceProfile], seed: int = 0, documents: Optional[List[Dict]] = None) -> FakeServices:
+    rng = random.Random(seed)
+    return FakeServices(
+        cohere=FakeCohereClient(profiles["cohere"], rng),
+        weaviate=FakeWeaviateClient(profiles["weaviate"], rng, documents or load_documents()),
+        openrouter=FakeChatClient("openrouter", profiles["openrouter"], rng),
+        groq=FakeChatClient("groq", profiles["groq"], rng),
+        gemini=FakeGeminiClient(profiles["gemini"], rng),
+        deepgram=FakeDeepgramClient(profiles["deepgram"], rng),
+    )
+
+
+def install_fakes(fakes: FakeServices) -> None:
+    """Point the imported service modules at the fakes."""
+    from services import embedding_provider, model_providers, search_provider, voice_service
+
+    embedding_provider.get_async_embedder().client = fakes.cohere
+    search_provider._async_client = fakes.weaviate
+    model_providers.open_router = fakes.openrouter
+    model_providers.groq_client = fakes.groq
+    model_providers.google_client = fakes.gemini
+    voice_service.dg_client = fakes.deepgram
@@ -0,0 +1,337 @@
+"""Offline load test for the chat pipeline.
+
+Drives N concurrent simulated sessions through `app.chat_wrapper` (or
+`rag_pipeline.rag_stream` directly) with every external service
+replaced by the fakes in `benchmarks.fakes`, and reports p50/p95/p99
+time to first token, end-to-end latency, transcription latency and
+event-loop lag, plus CPU time and peak memory per session.
+
+With `--workers N` the sessions are split across N processes that
+share caches and sessions through SQLite files in a temporary
+`SHARED_STATE_DIR`, as the workers of a multi-worker deployment do.
+
+Results are written to `benchmarks/results/<commit>.json` so a run can
+be compared with an earlier commit via `--compare`.
+
+Usage:
+    python -m benchmarks.load_test --sessions 50 --turns 3
+    python -m benchmarks.load_test --sessions 40 --warm-caches --workers 4
+    python -m benchmarks.load_test --profiles slow_groq.json --compare results/abc1234.json
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+QUESTIONS = [
+    "What curriculum does Sunmarke follow?",
+    "How do I apply for admission?",
+    "What are the school fees for Year 7?",
+    "Which sports and activities are offered after school?",
+    "Tell me about the principal's message.",
+    "Is there a school bus service?",
+    "What facilities does the campus have?",
+    "How does the school support students with learning needs?",
+]
+
+# Dummy credentials so the SDK clients can be constructed before the fakes replace them
+_DUMMY_ENV = ("OPEN_ROUTER_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "COHERE_API_KEY", "DEEPGRAM_API_KEY")
+
+
+@dataclass
+class TurnResult:
+    ttft: Optional[float] = None
+    ttft_all: Optional[float] = None
+    e2e: float = 0.0
+    transcription: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class LoopLagMonitor:
+    interval: float = 0.01
+    samples: List[float] = field(default_factory=list)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(loop.time() - start - self.interval, 0))
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Linear-interpolated percentile (q in 0-100) of `values`."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """p50/p95/p99/max in milliseconds."""
+    ms = [v * 1000 for v in values]
+    return {
+        "count": len(ms),
+        "p50": percentile(ms, 50),
+        "p95": percentile(ms, 95),
+        "p99": percentile(ms, 99),
+        "max": max(ms) if ms else None,
+    }
+
+
+def _assistant_text(hist: List[Dict]) -> str:
+    return hist[-1]["content"] if hist and hist[-1]["role"] == "assistant" else ""
+
+
+async def _run_turn(entry: str, app, rag_pipeline, query: str, hists: List[List[Dict]], request, voice: bool) -> TurnResult:
+    result = TurnResult()
+    start = time.perf_counter()
+
+    if voice:
+        # The fake Deepgram "transcribes" by decoding the uploaded bytes
+        with tempfile.NamedTemporaryFile("wb", suffix=".wav", delete=False) as audio:
+            audio.write(query.encode("utf-8"))
+        try:
+            query = await app.process_voice_input(audio.name, request)
+        finally:
+            os.unlink(audio.name)
+        result.transcription = time.perf_counter() - start
+        start = time.perf_counter()
+
+    if entry == "chat_wrapper":
+        # Histories live in the app's session store; only the question is sent
+        stream = app.chat_wrapper(query, request)
+    else:
+        stream = rag_pipeline.rag_stream(query, *hists, session_id=request.session_hash)
+
+    # Progress is read from the latest value of each column; unchanged
+    # columns come as None (rag_stream) or a skip update (chat_wrapper).
+    # The first frame of a turn carries all three columns.
+    latest: List[Optional[List[Dict]]] = [None, None, None]
+    try:
+        async for frame in stream:
+            now = time.perf_counter() - start
+            for index, value in enumerate(frame[:3]):
+                if isinstance(value, list):
+                    latest[index] = value
+            started = [value is not None and _assistant_text(value) for value in latest]
+            if result.ttft is None and any(started):
+                result.ttft = now
+            if result.ttft_all is None and all(started):
+                result.ttft_all = now
+    except Exception as e:
+        result.error = repr(e)
+    result.e2e = time.perf_counter() - start
+    return result
+
+
+async def _run_session(index: int, args, app, rag_pipeline, results: List[TurnResult]) -> None:
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    request = SimpleNamespace(session_hash=f"bench-{index}")
+    hists: List[List[Dict]] = [[], [], []]
+    for _ in range(args.turns):
+        query = rng.choice(QUESTIONS)
+        voice = rng.random() < args.voice_ratio
+        results.append(await _run_turn(args.entry, app, rag_pipeline, query, hists, request, voice))
+        await asyncio.sleep(rng.uniform(0, args.think_time))
+
+
+def _configure_env(args) -> None:
+    """Environment for the run; must happen before the app is imported."""
+    for name in _DUMMY_ENV:
+        os.environ.setdefault(name, "benchmark")
+    os.environ["SEARCH_BACKEND"] = args.search
+    os.environ["WORKERS"] = str(args.workers)
+    if not args.warm_caches:
+        os.environ.update(
+            ANSWER_CACHE_ENABLED="false",
+            PREFETCH_ENABLED="false",
+            RETRIEVAL_CACHE_SIZE="0",
+            RETRIEVAL_CACHE_PATH="",
+        )
+
+
+def _commit() -> str:
+    try:
+        sha = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+async def _drive(args, worker: int) -> Dict:
+    """Run this process's share of the sessions; raw samples for `run`."""
+    _configure_env(args)
+    import app
+    import rag_pipeline
+    from benchmarks.fakes import build_fakes, install_fakes, load_profiles
+
+    fakes = build_fakes(load_profiles(args.profiles), seed=args.seed + worker)
+    install_fakes(fakes)
+
+    monitor = LoopLagMonitor()
+    monitor_task = asyncio.create_task(monitor.run())
+    results: List[TurnResult] = []
+    rss_before, cpu_before = _peak_rss_mb(), _cpu_seconds()
+    started = time.perf_counter()
+    try:
+        sessions = range(worker, args.sessions, args.workers)
+        await asyncio.gather(*(_run_session(i, args, app, rag_pipeline, results) for i in sessions))
+    finally:
+        monitor_task.cancel()
+    return {
+        "results": results,
+        "lag": monitor.samples,
+        "wall": time.perf_counter() - started,
+        "cpu": _cpu_seconds() - cpu_before,
+        "rss_before": rss_before,
+        "rss_after": _peak_rss_mb(),
+        "fakes": fakes.stats(),
+    }
+
+
+def _drive_worker(args, worker: int) -> Dict:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+    return asyncio.run(_drive(args, worker))
+
+
+async def run(args) -> Dict:
+    if args.workers > 1:
+        with tempfile.TemporaryDirectory() as state_dir:
+            # Inherited by the worker processes, which share these SQLite files
+            os.environ["SHARED_STATE_DIR"] = state_dir
+            loop = asyncio.get_running_loop()
+            with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                runs = await asyncio.gather(*(loop.run_in_executor(pool, _drive_worker, args, worker) for worker in range(args.workers)))
+    else:
+        runs = [await _drive(args, 0)]
+
+    results = [result for worker_run in runs for result in worker_run["results"]]
+    lag = [sample for worker_run in runs for sample in worker_run["lag"]]
+    wall = max(worker_run["wall"] for worker_run in runs)
+    cpu = sum(worker_run["cpu"] for worker_run in runs)
+    rss_before = max(worker_run["rss_before"] for worker_run in runs)
+    rss_after = max(worker_run["rss_after"] for worker_run in runs)
+    fakes: Dict[str, Counter] = {}
+    for worker_run in runs:
+        for name, counts in worker_run["fakes"].items():
+            fakes.setdefault(name, Counter()).update(counts)
+
+    return {
+        "commit": _commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "params": {k: v for k, v in vars(args).items() if k not in ("compare", "output", "verbose")},
+        "turns": len(results),
+        "errors": sum(1 for r in results if r.error),
+        "wall_seconds": wall,
+        "throughput_turns_per_second": len(results) / wall if wall else None,
+        "ttft_ms": summarize([r.ttft for r in results if r.ttft is not None]),
+        "ttft_all_ms": summarize([r.ttft_all for r in results if r.ttft_all is not None]),
+        "e2e_ms": summarize([r.e2e for r in results]),
+        "transcription_ms": summarize([r.transcription for r in results if r.transcription is not None]),
+        "loop_lag_ms": summarize(lag),
+        "cpu_ms_per_session": cpu * 1000 / args.sessions,
+        "peak_rss_mb": rss_after,
+        "rss_growth_mb_per_session": (rss_after - rss_before) / args.sessions,
+        "fakes": {name: dict(counts) for name, counts in fakes.items()},
+    }
+
+
+def _fmt(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def report(result: Dict, baseline: Optional[Dict] = None) -> str:
+    lines = [
+        f"commit {result['commit']}  sessions={result['params']['sessions']} workers={result['params'].get('workers', 1)} turns={result['turns']} "
+        f"errors={result['errors']} wall={result['wall_seconds']:.1f}s",
+        f"{'metric':<18}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}" + ("   p95 vs baseline" if baseline else ""),
+    ]
+    for key in ("ttft_ms", "ttft_all_ms", "e2e_ms", "transcription_ms", "loop_lag_ms"):
+        stats = result[key]
+        row = f"{key:<18}" + "".join(f"{_fmt(stats[q]):>10}" for q in ("p50", "p95", "p99", "max"))
+        base = (baseline or {}).get(key, {}).get("p95")
+        if base and stats["p95"] is not None:
+            row += f"   {(stats['p95'] - base) / base * 100:+.1f}% ({base:.1f})"
+        lines.append(row)
+    for key in ("cpu_ms_per_session", "rss_growth_mb_per_session", "peak_rss_mb", "throughput_turns_per_second"):
+        row = f"{key:<30}{_fmt(result[key]):>10}"
+        base = (baseline or {}).get(key)
+        if base and result[key] is not None:
+            row += f"   {(result[key] - base) / base * 100:+.1f}% ({base:.1f})"
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Offline load test with fake providers")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=2, help="Questions asked per session")
+    parser.add_argument("--ramp", type=float, default=1.0, help="Seconds over which sessions start")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Max pause between turns (s)")
+    parser.add_argument("--voice-ratio", type=float, default=0.0, help="Share of turns asked by voice")
+    parser.add_argument("--entry", choices=["chat_wrapper", "rag_stream"], default="chat_wrapper")
+    parser.add_argument("--search", choices=["weaviate", "local"], default="weaviate")
+    parser.add_argument("--profiles", default=None, help="JSON file overriding fake service profiles")
+    parser.add_argument("--warm-caches", action="store_true", help="Keep retrieval/answer caches and prefetch on")
+    parser.add_argument("--workers", type=int, default=1, help="Processes sharing state through SQLite, like WORKERS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="Show application logs (injected failures are logged)")
+    parser.add_argument("--output", default=None, help="Result file (default: benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier result file to compare against")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL)
+
+    result = asyncio.run(run(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    print(report(result, baseline))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{result['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(result, file, indent=2)
+    print(f"Saved results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -17,7 +17,61 @@ class Settings:
     SUNMARKE_WEAVIATE_URL: str | None = os.getenv('SUNMARKE_WEAVIATE_URL')
     SUNMARKE_COLLECTION: str | None = os.getenv('SUNMARKE_COLLECTION')
 
+    # Retrieval backend: "weaviate" (default) or "local" (in-process index)
+    SEARCH_BACKEND: str = os.getenv('SEARCH_BACKEND', 'weaviate').lower()
+    LOCAL_CORPUS_PATH: str = os.getenv('LOCAL_CORPUS_PATH', 'data/chunks_embeddings.json')
+    # Serve from the local index when Weaviate is unreachable or errors
+    SEARCH_LOCAL_FALLBACK: bool = os.getenv('SEARCH_LOCAL_FALLBACK', 'true').lower() == 'true'
+    # Overrides the corpus version derived from LOCAL_CORPUS_PATH
+    CORPUS_VERSION: str | None = os.getenv('CORPUS_VERSION')
+    # Retrieval mode: "single" (top 3 chunks) or "two_stage" (candidate pool reranked into a token budget)
+    RETRIEVAL_MODE: str = os.getenv('RETRIEVAL_MODE', 'single').lower()
+    CANDIDATE_LIMIT: int = int(os.getenv('CANDIDATE_LIMIT', '20'))
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1500'))
+    PASSAGE_TOKENS: int = int(os.getenv('PASSAGE_TOKENS', '200'))
+    # Local vector search: "exact" (full scan) or "ivf" (approximate index, used from ANN_MIN_VECTORS chunks)
+    VECTOR_INDEX: str = os.getenv('VECTOR_INDEX', 'exact').lower()
+    ANN_MIN_VECTORS: int = int(os.getenv('ANN_MIN_VECTORS', '20000'))
+    ANN_LISTS: int = int(os.getenv('ANN_LISTS', '0'))
+    ANN_NPROBE: int = int(os.getenv('ANN_NPROBE', '16'))
+    # Optional .npz file the index is saved to and reloaded from (shared by workers by default)
+    ANN_INDEX_PATH: str | None = os.getenv('ANN_INDEX_PATH')
+
+    # Retrieval cache (query embeddings + search results)
+    RETRIEVAL_CACHE_SIZE: int = int(os.getenv('RETRIEVAL_CACHE_SIZE', '1024'))
+    RETRIEVAL_CACHE_TTL: float = float(os.getenv('RETRIEVAL_CACHE_TTL', '3600'))
+    # Optional SQLite file so cache entries survive a restart
+    RETRIEVAL_CACHE_PATH: str | None = os.getenv('RETRIEVAL_CACHE_PATH')
+
+    # Multi-worker mode: app processes behind a sticky-session proxy on PORT,
+    # sharing caches and sessions through SQLite files in SHARED_STATE_DIR
+    WORKERS: int = int(os.getenv('WORKERS', '1'))
+    SHARED_STATE_DIR: str = os.getenv('SHARED_STATE_DIR', 'state')
+
+    # Speculative retrieval while the user is typing or speaking
+    PREFETCH_ENABLED: bool = os.getenv('PREFETCH_ENABLED', 'true').lower() == 'true'
+    PREFETCH_DEBOUNCE_MS: float = float(os.getenv('PREFETCH_DEBOUNCE_MS', '300'))
+    PREFETCH_MIN_CHARS: int = int(os.getenv('PREFETCH_MIN_CHARS', '8'))
+    PREFETCH_TTL: float = float(os.getenv('PREFETCH_TTL', '120'))
+
+    # Maximum UI frames per second while streaming (0 = every token)
+    STREAM_MAX_FPS: float = float(os.getenv('STREAM_MAX_FPS', '20'))
+
+    # Semantic answer cache (first-turn questions only)
+    ANSWER_CACHE_ENABLED: bool = os.getenv('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+    ANSWER_CACHE_THRESHOLD: float = float(os.getenv('ANSWER_CACHE_THRESHOLD', '0.95'))
+    ANSWER_CACHE_SIZE: int = int(os.getenv('ANSWER_CACHE_SIZE', '512'))
+    ANSWER_CACHE_TTL: float = float(os.getenv('ANSWER_CACHE_TTL', '86400'))
+    # Optional SQLite file shared by workers (used automatically with several workers)
+    ANSWER_CACHE_PATH: str | None = os.getenv('ANSWER_CACHE_PATH')
+    # 0 replays a cached answer instantly; otherwise characters per chunk
+    ANSWER_REPLAY_CHUNK_CHARS: int = int(os.getenv('ANSWER_REPLAY_CHUNK_CHARS', '0'))
+    ANSWER_REPLAY_DELAY_MS: float = float(os.getenv('ANSWER_REPLAY_DELAY_MS', '15'))
+
     COHERE_API_KEY: str | None = os.getenv('COHERE_API_KEY')
+    # Query embedding micro-batching
+    EMBED_BATCH_SIZE: int = int(os.getenv('EMBED_BATCH_SIZE', '16'))
+    EMBED_BATCH_MAX_WAIT_MS: float = float(os.getenv('EMBED_BATCH_MAX_WAIT_MS', '10'))
     GEMINI_API_KEY: str | None = os.getenv('GEMINI_API_KEY')
     OPEN_ROUTER_URL: str | None = os.getenv('OPEN_ROUTER_URL')
     OPEN_ROUTER_API_KEY: str | None = os.getenv('OPEN_ROUTER_API_KEY')
@@ -25,6 +79,73 @@ class Settings:
     GROQ_BASE_URL: str | None = os.getenv('GROQ_BASE_URL')
 
     DEEPGRAM_API_KEY: str | None = os.getenv("DEEPGRAM_API_KEY")
+    # Streaming voice input: live transcription while the user speaks
+    VOICE_STREAMING: bool = os.getenv('VOICE_STREAMING', 'true').lower() == 'true'
+    DEEPGRAM_LIVE_URL: str = os.getenv('DEEPGRAM_LIVE_URL', 'wss://api.deepgram.com/v1/listen')
+    VOICE_STREAM_EVERY: float = float(os.getenv('VOICE_STREAM_EVERY', '0.25'))
+    VOICE_FINALIZE_TIMEOUT: float = float(os.getenv('VOICE_FINALIZE_TIMEOUT', '3'))
+    # Server-side text-to-speech of streamed answers ("deepgram" or "offline")
+    TTS_ENABLED: bool = os.getenv('TTS_ENABLED', 'false').lower() == 'true'
+    TTS_PROVIDER: str = os.getenv('TTS_PROVIDER', 'deepgram')
+    TTS_URL: str = os.getenv('TTS_URL', 'https://api.deepgram.com/v1/speak')
+    TTS_VOICE: str = os.getenv('TTS_VOICE', 'aura-2-thalia-en')
+    TTS_CONCURRENCY: int = int(os.getenv('TTS_CONCURRENCY', '2'))
+
+    # Server-side chat sessions: "memory" or "sqlite" (default: sqlite with several workers), size caps in bytes, idle eviction in seconds
+    SESSION_STORE_BACKEND: str = os.getenv('SESSION_STORE_BACKEND', '').lower()
+    SESSION_STORE_PATH: str | None = os.getenv('SESSION_STORE_PATH')
+    SESSION_MAX_BYTES: int = int(os.getenv('SESSION_MAX_BYTES', '65536'))
+    SESSION_STORE_MAX_BYTES: int = int(os.getenv('SESSION_STORE_MAX_BYTES', '268435456'))
+    SESSION_IDLE_TTL: float = float(os.getenv('SESSION_IDLE_TTL', '3600'))
+
+    # Share identical in-flight retrievals and first-turn answer streams across sessions
+    SINGLE_FLIGHT_ENABLED: bool = os.getenv('SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+
+    # Background warm-up of provider clients and connections at launch (seconds per provider)
+    WARMUP_ENABLED: bool = os.getenv('WARMUP_ENABLED', 'true').lower() == 'true'
+    WARMUP_TIMEOUT: float = float(os.getenv('WARMUP_TIMEOUT', '15'))
+    # Seconds idle provider connections stay pooled, and between keep-warm requests (0 = off)
+    KEEPALIVE_EXPIRY: float = float(os.getenv('KEEPALIVE_EXPIRY', '300'))
+    KEEPWARM_INTERVAL: float = float(os.getenv('KEEPWARM_INTERVAL', '60'))
+
+    # Instrumentation: Prometheus metrics at /metrics and optional OpenTelemetry spans
+    METRICS_ENABLED: bool = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+    TRACING_ENABLED: bool = os.getenv('TRACING_ENABLED', 'false').lower() == 'true'
+
+    # Prompt assembly: input token budget per model and history windowing
+    # (Kimi's is small enough for several questions a minute within KIMI_TPM)
+    DEEPSEEK_INPUT_TOKENS: int = int(os.getenv('DEEPSEEK_INPUT_TOKENS', '8000'))
+    KIMI_INPUT_TOKENS: int = int(os.getenv('KIMI_INPUT_TOKENS', '3000'))
+    GEMINI_INPUT_TOKENS: int = int(os.getenv('GEMINI_INPUT_TOKENS', '8000'))
+    HISTORY_MAX_TURNS: int = int(os.getenv('HISTORY_MAX_TURNS', '10'))
+    HISTORY_DROP_BLOCK: int = int(os.getenv('HISTORY_DROP_BLOCK', '4'))
+
+    # Provider resilience: time-to-first-token deadlines in seconds (0 = off)
+    DEEPSEEK_TTFT_TIMEOUT: float = float(os.getenv('DEEPSEEK_TTFT_TIMEOUT', '20'))
+    KIMI_TTFT_TIMEOUT: float = float(os.getenv('KIMI_TTFT_TIMEOUT', '10'))
+    GEMINI_TTFT_TIMEOUT: float = float(os.getenv('GEMINI_TTFT_TIMEOUT', '10'))
+    # Optional backup models (same provider) raced when the first token is late
+    DEEPSEEK_BACKUP_MODEL: str | None = os.getenv('DEEPSEEK_BACKUP_MODEL')
+    KIMI_BACKUP_MODEL: str | None = os.getenv('KIMI_BACKUP_MODEL')
+    GEMINI_BACKUP_MODEL: str | None = os.getenv('GEMINI_BACKUP_MODEL')
+    HEDGE_DELAY: float = float(os.getenv('HEDGE_DELAY', '3'))
+    # Circuit breaker: consecutive failures before skipping, seconds before a probe
+    CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '3'))
+    CIRCUIT_RESET_TIMEOUT: float = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+    # Admission control: concurrent streams and requests/tokens per minute per provider (0 = unlimited)
+    SCHEDULER_ENABLED: bool = os.getenv('SCHEDULER_ENABLED', 'true').lower() == 'true'
+    SCHEDULER_MAX_QUEUE: int = int(os.getenv('SCHEDULER_MAX_QUEUE', '50'))
+    SCHEDULER_MAX_WAIT: float = float(os.getenv('SCHEDULER_MAX_WAIT', '10'))
+    DEEPSEEK_MAX_CONCURRENCY: int = int(os.getenv('DEEPSEEK_MAX_CONCURRENCY', '8'))
+    DEEPSEEK_RPM: int = int(os.getenv('DEEPSEEK_RPM', '20'))
+    DEEPSEEK_TPM: int = int(os.getenv('DEEPSEEK_TPM', '0'))
+    KIMI_MAX_CONCURRENCY: int = int(os.getenv('KIMI_MAX_CONCURRENCY', '8'))
+    KIMI_RPM: int = int(os.getenv('KIMI_RPM', '60'))
+    KIMI_TPM: int = int(os.getenv('KIMI_TPM', '10000'))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv('GEMINI_MAX_CONCURRENCY', '16'))
+    GEMINI_RPM: int = int(os.getenv('GEMINI_RPM', '0'))
+    GEMINI_TPM: int = int(os.getenv('GEMINI_TPM', '0'))
 
 
 settings = Settings()
@@ -2,51 +2,246 @@
 
 This module is responsible for constructing the retrieval context
 for a user query and streaming model responses in parallel for the
-three configured providers. It yields incremental updates used by
-the UI to display streaming assistant responses.
+three configured providers. Provider deltas are coalesced into
+frame-rate limited updates used by the UI to display streaming
+assistant responses.
 """
 
 import asyncio
-from typing import AsyncGenerator, List, Dict, Tuple
-from services.embedding_provider import CohereEmbeddingProvider
+from contextlib import aclosing
+from typing import AsyncGenerator, List, Dict, Optional, Tuple
+from config import settings
+from services.embedding_provider import AsyncCohereEmbeddingProvider, async_embedder
 from services.search_provider import hybrid_search
-from services.model_providers import call_deepseek, call_kimi, call_gemini
+from services.cache import embedding_cache, search_cache, embedding_key, search_key, normalize_query
+from services.local_search import SearchResult
+from services.prompt_builder import format_context
+from services.reranker import rerank_context
+from services.prefetch import ContextPrefetcher
+from services.request_scope import RequestScope, ScopeRegistry
+from services.resilience import StreamOutcome
+from services.single_flight import SingleFlight, StreamFanout, flight_key
+from services import metrics
+from services.answer_cache import answer_cache, replay_answer
+from services.model_providers import (
+    call_deepseek, call_kimi, call_gemini,
+    DEEPSEEK_MODEL, KIMI_MODEL, GEMINI_MODEL, _UNAVAILABLE_MSG, _BUSY_MSG,
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Identical in-flight retrievals and first-turn answer streams are shared
+_retrievals = SingleFlight("retrieval")
+_answer_flights = StreamFanout("answer")
 
-async def get_context(query: str) -> str:
-    """Internal helper: Embeds query and performs hybrid search."""
+# The in-flight request of each session, for Stop and supersession
+_scopes = ScopeRegistry()
+_STOPPED_MSG = "_(stopped)_"
+
+
+async def _get_embedder() -> AsyncCohereEmbeddingProvider:
+    return await async_embedder()
+
+
+async def _cached_search(query: str, alpha: float = 0.5, limit: int = 3) -> Tuple[List, Optional[List[float]]]:
+    """Hybrid search behind the query-embedding and search-result caches.
+
+    Returns the search results and the query vector (None if unknown).
+    """
+    embedder = await _get_embedder()
+    e_key = embedding_key(query, embedder.model)
+
+    s_key = search_key(query, alpha, limit)
+    cached = await search_cache.get(s_key)
+    if cached is not None:
+        return [SearchResult(properties=props) for props in cached], await embedding_cache.get(e_key)
+
+    query_vector = await embedding_cache.get(e_key)
+    if query_vector is None:
+        with metrics.STAGE_SECONDS.time("embedding"), metrics.span("embedding"):
+            query_vector = await embedder.embed(query)
+        if query_vector:
+            embedding_cache.set(e_key, query_vector)
+
+    with metrics.STAGE_SECONDS.time("hybrid_search"), metrics.span("hybrid_search"):
+        results = await hybrid_search(query, query_vector, alpha=alpha, limit=limit)
+    # Only cache complete retrievals; failures should be retried next time
+    if results and query_vector:
+        search_cache.set(s_key, [dict(item.properties) for item in results])
+    return results, query_vector
+
+
+async def _retrieve(query: str) -> Tuple[str, Optional[List[float]]]:
+    """Embeds query, performs hybrid search and formats the context.
+
+    Also returns the query vector so it can key the answer cache.
+    """
     try:
-        # 1. Generate Embedding
-        embedder = CohereEmbeddingProvider()
-        query_vector = embedder.embed(query)
+        if settings.RETRIEVAL_MODE == "two_stage":
+            # 1-2. Larger candidate pool, then 3. rerank passages into the token budget
+            candidates, query_vector = await _cached_search(query, limit=settings.CANDIDATE_LIMIT)
+            with metrics.STAGE_SECONDS.time("rerank"):
+                context = await rerank_context(
+                    query, candidates, settings.CONTEXT_TOKEN_BUDGET, settings.PASSAGE_TOKENS
+                )
+            return context, query_vector
 
-        # 2. Hybrid Search
-        relevant_docs = await hybrid_search(query, query_vector)
+        # 1-2. Embed + Hybrid Search (served from cache for repeated questions)
+        relevant_docs, query_vector = await _cached_search(query)
 
         # 3. Format Context
-        context = "\n\n".join(str(item.properties) for item in relevant_docs)
-        return context
+        with metrics.STAGE_SECONDS.time("context_formatting"):
+            context = format_context(relevant_docs)
+        return context, query_vector
     except Exception:
         logger.exception("Context retrieval failed")
-        return ""
+        return "", None
+
+
+async def _shared_retrieve(query: str) -> Tuple[str, Optional[List[float]]]:
+    """`_retrieve`, shared by concurrent requests for the same normalized query."""
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return await _retrieve(query)
+    return await _retrievals.do(normalize_query(query), lambda: _retrieve(query))
+
+
+async def get_context(query: str) -> str:
+    """Internal helper: Embeds query and performs hybrid search."""
+    context, _ = await _retrieve(query)
+    return context
+
+
+_prefetcher = ContextPrefetcher(
+    _shared_retrieve,
+    debounce=settings.PREFETCH_DEBOUNCE_MS / 1000,
+    ttl=settings.PREFETCH_TTL,
+    min_chars=settings.PREFETCH_MIN_CHARS,
+    # A prefetched result is as fresh as a cached one may be
+    max_age=settings.RETRIEVAL_CACHE_TTL,
+)
+
+
+def prefetch_context(session_id: str, text: str) -> None:
+    """Speculatively retrieve context for text the user is still typing."""
+    if settings.PREFETCH_ENABLED and session_id:
+        _prefetcher.schedule(session_id, text)
+
+
+async def _record_answer(
+    stream: AsyncGenerator[str, None],
+    model: str,
+    query_vector: List[float],
+    context: str,
+    outcome: StreamOutcome,
+) -> AsyncGenerator[str, None]:
+    """Pass a provider stream through and cache the completed answer.
+
+    Answers served by a backup model are not cached under `model`.
+    """
+    parts = []
+    async with aclosing(stream):
+        async for delta in stream:
+            parts.append(delta)
+            yield delta
+    content = "".join(parts)
+    if content and not outcome.backup_served and not content.endswith((_UNAVAILABLE_MSG, _BUSY_MSG)):
+        answer_cache.store(model, query_vector, context, content)
+
+
+def _cacheable(history, context, query_vector) -> bool:
+    return bool(settings.ANSWER_CACHE_ENABLED and not history and query_vector and context)
+
+
+async def _cached_answer(model, context, history, query_vector) -> Optional[str]:
+    """The semantic answer cache's answer to a first-turn question, if any."""
+    if not _cacheable(history, context, query_vector):
+        return None
+    return await answer_cache.lookup(model, query_vector, context)
+
+
+def _answer_stream(call, model, query, context, history, query_vector, cached) -> AsyncGenerator[str, None]:
+    """Serve a first-turn question from the answer cache when possible.
+
+    `cached` is the answer found by `_cached_answer`. Otherwise identical
+    first-turn questions in flight at the same time share one upstream
+    stream per provider.
+    """
+    if history:
+        return call(query, context, history)
+    if cached is not None:
+        return replay_answer(cached)
+
+    cacheable = _cacheable(history, context, query_vector)
+
+    def upstream() -> AsyncGenerator[str, None]:
+        outcome = StreamOutcome()
+        stream = call(query, context, history, outcome)
+        return _record_answer(stream, model, query_vector, context, outcome) if cacheable else stream
+
+    if not settings.SINGLE_FLIGHT_ENABLED:
+        return upstream()
+    return _answer_flights.subscribe(flight_key(model, query, context), upstream)
 
 
 async def rag_stream(
     query: str,
     hist_a: List[Dict],
     hist_b: List[Dict],
-    hist_c: List[Dict]
-) -> AsyncGenerator[Tuple[List[Dict], List[Dict], List[Dict]], None]:
+    hist_c: List[Dict],
+    session_id: Optional[str] = None,
+) -> AsyncGenerator[Tuple[Optional[List[Dict]], Optional[List[Dict]], Optional[List[Dict]]], None]:
     """
     Orchestrates parallel streaming from three models.
-    Yields updated history lists for [Model A, Model B, Model C].
+    Yields updated history lists for [Model A, Model B, Model C];
+    a column that did not change since the previous frame is None.
     """
+    with metrics.in_flight("rag_stream"), metrics.span("rag_stream"):
+        async for frame in _stream_answers(query, hist_a, hist_b, hist_c, session_id):
+            yield frame
+
+
+async def _stream_answers(
+    query: str,
+    hist_a: List[Dict],
+    hist_b: List[Dict],
+    hist_c: List[Dict],
+    session_id: Optional[str],
+) -> AsyncGenerator[Tuple[Optional[List[Dict]], Optional[List[Dict]], Optional[List[Dict]]], None]:
+    """Body of `rag_stream`: retrieval, then the parallel consumption loop."""
+
+    # A new request cancels whatever this session still has in flight
+    scope = _scopes.open(session_id)
+    try:
+        async for frame in _consume(query, hist_a, hist_b, hist_c, session_id, scope):
+            yield frame
+    finally:
+        _scopes.close(session_id, scope)
+
 
+async def _consume(
+    query: str,
+    hist_a: List[Dict],
+    hist_b: List[Dict],
+    hist_c: List[Dict],
+    session_id: Optional[str],
+    scope: RequestScope,
+) -> AsyncGenerator[Tuple[Optional[List[Dict]], Optional[List[Dict]], Optional[List[Dict]]], None]:
     # Step 1: Get Context (Shared for all models)
-    context = await get_context(query)
+    # Reuse a matching prefetch started while the user was typing
+    with metrics.STAGE_SECONDS.time("retrieval"):
+        prefetched = await _prefetcher.take(session_id, query)
+        context, query_vector = prefetched if prefetched is not None else await _shared_retrieve(query)
+    if scope.cancelled:
+        return
+
+    # First-turn questions may be replayed from the semantic answer cache
+    cached = await asyncio.gather(*(
+        _cached_answer(model, context, hist, query_vector)
+        for model, hist in ((DEEPSEEK_MODEL, hist_a), (KIMI_MODEL, hist_b), (GEMINI_MODEL, hist_c))
+    ))
+    if scope.cancelled:
+        return
 
     # Step 2: Prepare History
     # Add the user query to all histories immediately
@@ -59,54 +254,128 @@ async def rag_stream(
     hist_b.append({"role": "assistant", "content": ""})
     hist_c.append({"role": "assistant", "content": ""})
 
-    # Step 3: Initialize Async Generators for each model
-    # Note: We pass the history EXCLUDING the latest placeholder we just added
-    gen_a = call_deepseek(query, context, hist_a[:-2])
-    gen_b = call_kimi(query, context, hist_b[:-2])
-    gen_c = call_gemini(query, context, hist_c[:-2])
-
-    # Step 4: Parallel Consumption Loop
-    # We use a set of tasks to monitor which generator has a new token
-    tasks = {
-        asyncio.create_task(gen_a.__anext__()): 'a',
-        asyncio.create_task(gen_b.__anext__()): 'b',
-        asyncio.create_task(gen_c.__anext__()): 'c'
-    }
-
-    while tasks:
-        done, pending = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
-
-        for task in done:
-            label = tasks.pop(task)
-            try:
-                content = task.result()
-
-                # Update the content in the respective history
-                if label == 'a':
-                    hist_a[-1]["content"] = content
+    # Step 3: Parallel Consumption Loop
+    # Generators emit text deltas; they are buffered per column and flushed
+    # as frames of at most STREAM_MAX_FPS per second. A frame only carries
+    # the columns that changed (None for the others).
+    hists = {'a': hist_a, 'b': hist_b, 'c': hist_c}
+    gens: Dict[str, AsyncGenerator[str, None]] = {}
+    parts: Dict[str, List[str]] = {'a': [], 'b': [], 'c': []}
+    dirty = set()
+    tasks: Dict[asyncio.Task, str] = {}
+    stop_signal: Optional[asyncio.Task] = None
+
+    loop = asyncio.get_running_loop()
+    interval = 1 / settings.STREAM_MAX_FPS if settings.STREAM_MAX_FPS > 0 else 0
+    next_frame = loop.time()
+
+    # Shared answer streams start pumping as soon as they are subscribed,
+    # so everything from here on runs under the finally that closes them
+    try:
+        # Note: We pass the history EXCLUDING the latest placeholder we just added
+        gens['a'] = _answer_stream(call_deepseek, DEEPSEEK_MODEL, query, context, hist_a[:-2], query_vector, cached[0])
+        gens['b'] = _answer_stream(call_kimi, KIMI_MODEL, query, context, hist_b[:-2], query_vector, cached[1])
+        gens['c'] = _answer_stream(call_gemini, GEMINI_MODEL, query, context, hist_c[:-2], query_vector, cached[2])
+
+        # Show the user message and empty placeholders straight away
+        yield hist_a, hist_b, hist_c
+
+        # We use a set of tasks to monitor which generator has a new token
+        tasks = {asyncio.create_task(gen.__anext__()): label for label, gen in gens.items()}
+        stop_signal = asyncio.create_task(scope.wait())
+
+        while tasks:
+            timeout = max(next_frame - loop.time(), 0) if dirty else None
+            done, pending = await asyncio.wait(
+                [*tasks, stop_signal], timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+
+            if stop_signal in done:
+                for task, label in list(tasks.items()):
+                    if scope.cancelled or label in scope.stopped:
+                        del tasks[task]
+                        await _abandon(task, gens.pop(label))
+                        _mark_stopped(hists[label], parts[label])
+                        dirty.add(label)
+                stop_signal = asyncio.create_task(scope.wait())
+
+            for task in done:
+                label = tasks.pop(task, None)
+                if label is None:
+                    continue
+                try:
+                    parts[label].append(task.result())
+                    dirty.add(label)
                     # Re-schedule the next iteration for this generator
-                    tasks[asyncio.create_task(gen_a.__anext__())] = 'a'
-                elif label == 'b':
-                    hist_b[-1]["content"] = content
-                    tasks[asyncio.create_task(gen_b.__anext__())] = 'b'
-                elif label == 'c':
-                    hist_c[-1]["content"] = content
-                    tasks[asyncio.create_task(gen_c.__anext__())] = 'c'
-
-                # Yield the current state of all histories to update UI bubbles
-                yield hist_a, hist_b, hist_c
-
-            except StopAsyncIteration:
-                # Generator finished normally
-                pass
-            except Exception:
-                logger.exception(f"Error in generator {label}")
-                # Set error message in history if it failed
-                msg = "Model error occurred."
-                if label == 'a':
-                    hist_a[-1]["content"] = msg
-                elif label == 'b':
-                    hist_b[-1]["content"] = msg
-                elif label == 'c':
-                    hist_c[-1]["content"] = msg
-                yield hist_a, hist_b, hist_c
+                    tasks[asyncio.create_task(gens[label].__anext__())] = label
+                except StopAsyncIteration:
+                    # Generator finished normally
+                    pass
+                except Exception:
+                    logger.exception(f"Error in generator {label}")
+                    # Replace whatever was streamed with an error message
+                    parts[label] = []
+                    hists[label][-1]["content"] = "Model error occurred."
+                    dirty.add(label)
+
+            if dirty and (not tasks or scope.cancelled or loop.time() >= next_frame):
+                yield _flush_frame(hists, parts, dirty)
+                next_frame = loop.time() + interval
+    finally:
+        # Runs on normal completion, Stop, a newer request, or the consumer
+        # going away: no provider stream may outlive the request
+        if stop_signal is not None:
+            stop_signal.cancel()
+        for task, label in tasks.items():
+            await _abandon(task, gens.pop(label))
+        for gen in gens.values():
+            await gen.aclose()
+
+
+async def _abandon(task: asyncio.Task, gen: AsyncGenerator[str, None]) -> None:
+    """Cancel a pending `__anext__` and close its generator (and HTTP stream)."""
+    task.cancel()
+    try:
+        await task
+    except (asyncio.CancelledError, StopAsyncIteration):
+        pass
+    except Exception:
+        logger.exception("Error while cancelling a model stream")
+    await gen.aclose()
+
+
+def _mark_stopped(hist: List[Dict], parts: List[str]) -> None:
+    """Keep what a stopped column streamed so far and note the stop."""
+    content = hist[-1]["content"] + "".join(parts)
+    parts.clear()
+    hist[-1]["content"] = f"{content}\n\n{_STOPPED_MSG}" if content else _STOPPED_MSG
+
+
+def stop_request(session_id: Optional[str], label: Optional[str] = None) -> bool:
+    """Stop the session's in-flight request, or only column `label` of it.
+
+    Returns False when the session has nothing in flight.
+    """
+    scope = _scopes.get(session_id)
+    if scope is None:
+        return False
+    if label is None:
+        scope.cancel()
+    else:
+        scope.stop(label)
+    return True
+
+
+def _flush_frame(
+    hists: Dict[str, List[Dict]],
+    parts: Dict[str, List[str]],
+    dirty: set,
+) -> Tuple[Optional[List[Dict]], Optional[List[Dict]], Optional[List[Dict]]]:
+    """Append buffered deltas to their assistant messages and build a frame."""
+    for label in dirty:
+        if parts[label]:
+            hists[label][-1]["content"] += "".join(parts[label])
+            parts[label].clear()
+    frame = tuple(hists[label] if label in dirty else None for label in ('a', 'b', 'c'))
+    dirty.clear()
+    return frame
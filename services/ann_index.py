@@ -0,0 +1,252 @@
+"""Approximate nearest-neighbour index for the local vector search.
+
+An IVF (inverted file) index with int8 residual quantization, written
+in NumPy only:
+
+- spherical k-means splits the unit-length vectors into `n_lists`
+  cells, and every vector is filed under its nearest centroid
+- a vector is stored as its residual from that centroid, quantized to
+  int8 with one float32 scale per vector (`dim + 12` bytes per vector
+  with its id, instead of `4 * dim` for float32)
+- a query only scores the members of the `nprobe` cells whose
+  centroids are closest to it, estimating `q·x` as
+  `q·centroid + scale * (q·codes)`
+
+`nprobe` trades recall for speed: probing every cell scans the whole
+index. The scores are approximate, so callers that need exact ranking
+re-score the returned candidates against the original vectors, as
+`local_search` does. Vectors added after training are filed under the
+existing centroids, and an index is saved to and loaded from a single
+`.npz` file.
+"""
+
+import json
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+# Training sample per cell for k-means, and rows scored per matmul
+TRAIN_POINTS_PER_LIST = 64
+BATCH_SIZE = 8192
+
+
+def default_lists(count: int) -> int:
+    """Number of cells for `count` vectors (about sqrt(count))."""
+    return max(1, int(round(math.sqrt(count))))
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def nearest_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the closest centroid (by inner product) of every row."""
+    assign = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), BATCH_SIZE):
+        batch = vectors[start:start + BATCH_SIZE]
+        assign[start:start + len(batch)] = np.argmax(batch @ centroids.T, axis=1)
+    return assign
+
+
+def train_centroids(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over a sample of `vectors`."""
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(vectors), n_lists * TRAIN_POINTS_PER_LIST)
+    sample = np.sort(rng.choice(len(vectors), sample_size, replace=False))
+    data = normalize(vectors[sample])
+    centroids = data[rng.choice(len(data), n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assign = nearest_centroids(data, centroids)
+        counts = np.bincount(assign, minlength=n_lists)
+        order = np.argsort(assign, kind="stable")
+        filled = np.flatnonzero(counts)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+        centroids[filled] = normalize(np.add.reduceat(data[order], starts, axis=0))
+        # Reseed empty cells from random training points
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def quantize(residuals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row symmetric int8 quantization: `codes * scales[:, None] ≈ residuals`."""
+    scales = np.abs(residuals).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.round(residuals / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class InvertedList:
+    """Members of one cell, in arrays that grow by doubling."""
+
+    def __init__(self, dim: int, codes=None, scales=None, ids=None) -> None:
+        self.codes = np.empty((0, dim), dtype=np.int8) if codes is None else codes
+        self.scales = np.empty(0, dtype=np.float32) if scales is None else scales
+        self.ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self.size = len(self.ids)
+
+    def append(self, codes: np.ndarray, scales: np.ndarray, ids: np.ndarray) -> None:
+        needed = self.size + len(ids)
+        if needed > len(self.ids):
+            capacity = max(needed, 2 * len(self.ids), 16)
+            self.codes = _grow(self.codes, capacity)
+            self.scales = _grow(self.scales, capacity)
+            self.ids = _grow(self.ids, capacity)
+        self.codes[self.size:needed] = codes
+        self.scales[self.size:needed] = scales
+        self.ids[self.size:needed] = ids
+        self.size = needed
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + self.scales.nbytes + self.ids.nbytes
+
+
+def _grow(array: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.empty((capacity,) + array.shape[1:], dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+class IVFIndex:
+    """Inverted-file index over unit-length vectors with int8 residuals."""
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 16, fingerprint: str = "") -> None:
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        # Identifies the vectors the index was built from (e.g. the corpus version)
+        self.fingerprint = fingerprint
+        self.lists = [InvertedList(self.dim) for _ in range(len(self.centroids))]
+        self.count = 0
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: int = 0,
+        nprobe: int = 16,
+        iterations: int = 10,
+        seed: int = 0,
+        fingerprint: str = "",
+    ) -> "IVFIndex":
+        """Train on `vectors` and add them with ids 0..n-1 (`n_lists` 0 = auto).
+
+        Rows are normalized batch by batch, so `vectors` may be a
+        float16 or int8 memory map (a positive per-row scale does not
+        change a row's direction).
+        """
+        n_lists = min(n_lists or default_lists(len(vectors)), len(vectors))
+        index = cls(train_centroids(vectors, n_lists, iterations, seed), nprobe, fingerprint)
+        index.add(vectors)
+        return index
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.lists)
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + sum(inverted.nbytes for inverted in self.lists)
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None) -> None:
+        """File new vectors under their nearest existing centroid.
+
+        Ids default to consecutive numbers after the current count.
+        """
+        if ids is None:
+            ids = np.arange(self.count, self.count + len(vectors), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        for start in range(0, len(vectors), BATCH_SIZE):
+            batch = normalize(vectors[start:start + BATCH_SIZE])
+            batch_ids = ids[start:start + len(batch)]
+            assign = nearest_centroids(batch, self.centroids)
+            codes, scales = quantize(batch - self.centroids[assign])
+            order = np.argsort(assign, kind="stable")
+            cells, starts = np.unique(assign[order], return_index=True)
+            ends = np.append(starts[1:], len(order))
+            for cell, begin, end in zip(cells, starts, ends):
+                rows = order[begin:end]
+                self.lists[cell].append(codes[rows], scales[rows], batch_ids[rows])
+        self.count += len(ids)
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top `k` (ids, scores) by inner product, best first."""
+        query = normalize(query)
+        coarse = self.centroids @ query
+        nprobe = min(nprobe or self.nprobe, self.n_lists)
+        probe = np.argpartition(-coarse, nprobe - 1)[:nprobe] if nprobe < self.n_lists else range(self.n_lists)
+
+        ids, scores = [], []
+        for cell in probe:
+            inverted = self.lists[cell]
+            if not inverted.size:
+                continue
+            size = inverted.size
+            scores.append(coarse[cell] + inverted.scales[:size] * (inverted.codes[:size] @ query))
+            ids.append(inverted.ids[:size])
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ids, scores = np.concatenate(ids), np.concatenate(scores)
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order].astype(np.float32, copy=False)
+
+    # --- Persistence ---
+    def save(self, path: str) -> None:
+        """Write the index to `path` through a temporary file."""
+        sizes = np.array([inverted.size for inverted in self.lists], dtype=np.int64)
+        header = {
+            "format_version": FORMAT_VERSION,
+            "dim": self.dim,
+            "n_lists": self.n_lists,
+            "nprobe": self.nprobe,
+            "count": self.count,
+            "fingerprint": self.fingerprint,
+        }
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Per process, so concurrent writers never share a temporary file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as file:
+            np.savez(
+                file,
+                header=np.array(json.dumps(header)),
+                centroids=self.centroids,
+                sizes=sizes,
+                codes=np.concatenate([inverted.codes[:inverted.size] for inverted in self.lists]),
+                scales=np.concatenate([inverted.scales[:inverted.size] for inverted in self.lists]),
+                ids=np.concatenate([inverted.ids[:inverted.size] for inverted in self.lists]),
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "IVFIndex":
+        with np.load(path) as data:
+            header = json.loads(str(data["header"]))
+            if header.get("format_version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported ANN index format version {header.get('format_version')}")
+            index = cls(data["centroids"], header["nprobe"], header["fingerprint"])
+            codes, scales, ids = data["codes"], data["scales"], data["ids"]
+            offsets = np.concatenate(([0], np.cumsum(data["sizes"])))
+        index.lists = [
+            InvertedList(index.dim, codes[start:end], scales[start:end], ids[start:end])
+            for start, end in zip(offsets[:-1], offsets[1:])
+        ]
+        index.count = header["count"]
+        return index
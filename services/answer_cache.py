@@ -0,0 +1,226 @@
+"""Semantic answer cache for first-turn questions.
+
+Answers are stored per model and per retrieved context, and matched by
+cosine similarity between query embeddings, so near-identical FAQs
+("what are the fees" / "what are the school fees?") reuse a previous
+answer instead of calling the provider again. Entries are size-bounded
+(LRU), expire after a TTL and are scoped to the corpus version.
+
+With `ANSWER_CACHE_PATH` (or several workers) answers are also written
+to a SQLite file, so an answer generated by one worker is replayed by
+the others; a local miss falls back to the newest `SHARED_CANDIDATES`
+entries of the same bucket, read on the store's thread.
+"""
+
+import asyncio
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncGenerator, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from config import settings
+from services.cache import SQLiteBacked, corpus_version, shared_state_path
+
+logger = logging.getLogger(__name__)
+
+# Shared entries scored on a local miss, newest first
+SHARED_CANDIDATES = 256
+
+
+@dataclass
+class _Entry:
+    bucket: str
+    vector: np.ndarray
+    answer: str
+    expires: float
+
+
+def context_hash(context: str) -> str:
+    return hashlib.sha256(context.encode("utf-8")).hexdigest()[:16]
+
+
+class SQLiteAnswerStore(SQLiteBacked):
+    """Answers with their unit query vectors in a SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path, "answer-store")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, bucket TEXT, vector BLOB, answer TEXT, expires REAL)"
+            )
+            # Serves the newest-first scan of one bucket without a sort
+            self._conn.execute("DROP INDEX IF EXISTS answers_bucket")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS answers_bucket_id ON answers (bucket, id)")
+
+    def candidates(self, bucket: str, now: float, limit: int = SHARED_CANDIDATES) -> List[Tuple[np.ndarray, str, float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT vector, answer, expires FROM answers WHERE bucket = ? AND expires >= ? ORDER BY id DESC LIMIT ?",
+                (bucket, now, limit),
+            ).fetchall()
+        return [(np.frombuffer(vector, dtype=np.float32), answer, expires) for vector, answer, expires in rows]
+
+    def add(self, bucket: str, vector: np.ndarray, answer: str, expires: float, maxsize: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO answers (bucket, vector, answer, expires) VALUES (?, ?, ?, ?)",
+                (bucket, vector.astype(np.float32).tobytes(), answer, expires),
+            )
+            # Oldest entries beyond maxsize, and expired ones, are dropped
+            self._conn.execute(
+                "DELETE FROM answers WHERE expires < ? OR id <= "
+                "(SELECT id FROM answers ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (time.time(), maxsize),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM answers")
+
+
+class SemanticAnswerCache:
+    """Cosine-similarity answer cache bucketed by model, context and corpus."""
+
+    def __init__(self, threshold: float, maxsize: int, ttl: float, shared: Optional[SQLiteAnswerStore] = None) -> None:
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._buckets: Dict[str, Set[int]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _bucket(model: str, context: str) -> str:
+        return f"{corpus_version()}:{model}:{context_hash(context)}"
+
+    @staticmethod
+    def _normalise(vector: List[float]) -> Optional[np.ndarray]:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else None
+
+    async def lookup(self, model: str, query_vector: List[float], context: str) -> Optional[str]:
+        """Return the best stored answer above the similarity threshold."""
+        query = self._normalise(query_vector) if query_vector else None
+        if query is None:
+            return None
+
+        now = time.time()
+        bucket = self._bucket(model, context)
+        with self._lock:
+            ids = [i for i in self._buckets.get(bucket, ()) if self._entries[i].expires >= now]
+            if ids:
+                scores = np.stack([self._entries[i].vector for i in ids]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    return self._entries[ids[best]].answer
+
+        if self.shared is not None:
+            # Answers stored by other workers
+            try:
+                candidates = await self.shared.run(self.shared.candidates, bucket, now)
+            except Exception:
+                logger.exception("Answer cache store read failed")
+                candidates = []
+            if candidates:
+                scores = np.stack([vector for vector, _answer, _expires in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    vector, answer, expires = candidates[best]
+                    with self._lock:
+                        self._insert(bucket, vector, answer, expires)
+                        self.hits += 1
+                    return answer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def store(self, model: str, query_vector: List[float], context: str, answer: str) -> None:
+        vector = self._normalise(query_vector) if query_vector else None
+        if vector is None or not answer:
+            return
+
+        bucket = self._bucket(model, context)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._insert(bucket, vector, answer, expires)
+        if self.shared is not None:
+            self.shared.defer(self.shared.add, bucket, vector, answer, expires, self.maxsize)
+
+    def _insert(self, bucket: str, vector: np.ndarray, answer: str, expires: float) -> None:
+        entry_id = next(self._ids)
+        self._entries[entry_id] = _Entry(bucket, vector, answer, expires)
+        self._buckets.setdefault(bucket, set()).add(entry_id)
+        while len(self._entries) > self.maxsize:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        bucket = self._buckets.get(entry.bucket)
+        if bucket is not None:
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._buckets[entry.bucket]
+
+    def invalidate(self) -> None:
+        """Drop every entry, e.g. after the corpus has been re-ingested."""
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+        if self.shared is not None:
+            self.shared.defer(self.shared.clear)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+def _make_store() -> Optional[SQLiteAnswerStore]:
+    path = settings.ANSWER_CACHE_PATH or (shared_state_path("answer_cache.sqlite3") if settings.WORKERS > 1 else None)
+    if not path:
+        return None
+    try:
+        return SQLiteAnswerStore(path)
+    except Exception:
+        logger.exception("Failed to open answer cache store; using memory only")
+        return None
+
+
+answer_cache = SemanticAnswerCache(
+    threshold=settings.ANSWER_CACHE_THRESHOLD,
+    maxsize=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    shared=_make_store(),
+)
+
+
+async def replay_answer(answer: str) -> AsyncGenerator[str, None]:
+    """Replay a cached answer through the provider streaming interface.
+
+    Yields the whole answer as one delta, or deltas of
+    `ANSWER_REPLAY_CHUNK_CHARS` characters spaced by
+    `ANSWER_REPLAY_DELAY_MS` when chunked replay is configured.
+    """
+    step = settings.ANSWER_REPLAY_CHUNK_CHARS
+    if step <= 0:
+        yield answer
+        return
+
+    delay = settings.ANSWER_REPLAY_DELAY_MS / 1000
+    for start in range(0, len(answer), step):
+        yield answer[start:start + step]
+        if delay and start + step < len(answer):
+            await asyncio.sleep(delay)
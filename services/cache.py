@@ -0,0 +1,297 @@
+"""Retrieval caches for query embeddings and hybrid search results.
+
+Each cache is a bounded in-memory LRU with a TTL, optionally backed by
+a SQLite file so entries survive a restart and are shared by the
+workers of a multi-worker deployment. Keys are built from the
+normalized query text; search entries also carry the corpus version so
+a re-ingestion invalidates them. Values must be JSON-serializable.
+
+The corpus version is cached in memory and re-read every
+`VERSION_CHECK_INTERVAL` seconds. `services.ingestion` bumps it through
+a marker file in `SHARED_STATE_DIR`, which also covers the Weaviate
+backend, whose collection changes without any local file changing.
+
+Store queries run on the store's own thread (`SQLiteBacked`): reads are
+awaited and writes are queued, so the event loop never waits on the
+disk or on another worker's write lock.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+from config import settings
+from services import metrics
+from services.corpus_store import is_store, read_header
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Seconds between sweeps of expired entries from a persistent tier
+PRUNE_INTERVAL = 60.0
+
+# Seconds a worker keeps using its cached corpus version
+VERSION_CHECK_INTERVAL = 5.0
+# Marker in SHARED_STATE_DIR rewritten by every ingestion run that changed the corpus
+VERSION_FILE = "corpus_version"
+
+CACHE_STATS = metrics.Gauge(
+    "sunmarke_retrieval_cache", "Retrieval cache hits, misses and size", ["cache", "stat"]
+)
+
+_version: Optional[str] = None
+_version_checked = 0.0
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form of a query used as a cache key."""
+    return _WHITESPACE_RE.sub(" ", text).strip().lower().rstrip("?!. ")
+
+
+def corpus_version() -> str:
+    """Identifier of the currently indexed corpus.
+
+    Uses `settings.CORPUS_VERSION` when set. Otherwise combines the
+    marker written by the last ingestion run with the version recorded
+    in a binary corpus header, or the size and modification time of a
+    JSON corpus file. The result is cached for `VERSION_CHECK_INTERVAL`
+    seconds so building a cache key costs no file system calls.
+    """
+    global _version, _version_checked
+    if settings.CORPUS_VERSION:
+        return settings.CORPUS_VERSION
+    now = time.monotonic()
+    if _version is None or now - _version_checked >= VERSION_CHECK_INTERVAL:
+        _version = _read_version()
+        _version_checked = now
+    return _version
+
+
+def _read_version() -> str:
+    try:
+        with open(os.path.join(settings.SHARED_STATE_DIR, VERSION_FILE), "r", encoding="utf-8") as file:
+            ingested = file.read().strip()
+    except OSError:
+        ingested = ""
+    try:
+        if is_store(settings.LOCAL_CORPUS_PATH):
+            local = read_header(settings.LOCAL_CORPUS_PATH)["corpus_version"]
+        else:
+            stat = os.stat(settings.LOCAL_CORPUS_PATH)
+            local = f"{stat.st_size}-{int(stat.st_mtime)}"
+    except (OSError, ValueError, KeyError):
+        local = "unversioned"
+    return f"{ingested}:{local}" if ingested else local
+
+
+def bump_corpus_version() -> None:
+    """Give the corpus a new version, invalidating every worker's cached searches."""
+    global _version
+    path = shared_state_path(VERSION_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        file.write(uuid.uuid4().hex[:16])
+    os.replace(f"{path}.tmp", path)
+    _version = None
+
+
+def shared_state_path(name: str) -> str:
+    """Path of a SQLite file shared by all workers, under `SHARED_STATE_DIR`."""
+    os.makedirs(settings.SHARED_STATE_DIR, exist_ok=True)
+    return os.path.join(settings.SHARED_STATE_DIR, name)
+
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """Connection usable from several threads and processes at once.
+
+    WAL lets readers in other workers proceed during a write, and
+    writers wait for the lock instead of failing with "database is locked".
+    """
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteBacked:
+    """Base of the SQLite stores: one connection and one thread for its queries.
+
+    The thread runs queries in submission order, so a read awaited with
+    `run` sees every write queued with `defer` before it.
+    """
+
+    def __init__(self, path: str, name: str) -> None:
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        """Run `fn(*args)` on the store thread and await its result."""
+        return await asyncio.wrap_future(self._executor.submit(fn, *args))
+
+    def defer(self, fn: Callable[..., Any], *args) -> None:
+        """Queue `fn(*args)` on the store thread; failures are logged."""
+        self._executor.submit(fn, *args).add_done_callback(_log_failure)
+
+
+def _log_failure(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Store write failed", exc_info=future.exception())
+
+
+class SQLiteStore(SQLiteBacked):
+    """Small persistent key/value table with per-entry expiry."""
+
+    def __init__(self, path: str, table: str) -> None:
+        super().__init__(path, f"store-{table}")
+        self.table = table
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, expires REAL)"
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_expires ON {table} (expires)")
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def set(self, key: str, value: Any, expires: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def prune(self) -> None:
+        """Drop every expired entry."""
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE expires < ?", (time.time(),))
+
+
+class TTLCache:
+    """Bounded LRU cache with TTL and an optional persistent tier."""
+
+    def __init__(self, maxsize: int, ttl: float, store: Optional[SQLiteStore] = None) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.store = store
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._next_prune = 0.0
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Return the cached value or None on a miss or expiry."""
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] >= now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._data[key]
+
+        if self.store is not None:
+            try:
+                stored = await self.store.run(self.store.get, key)
+            except Exception:
+                logger.exception("Cache store read failed")
+                stored = None
+            if stored is not None and stored[1] >= now:
+                with self._lock:
+                    self._insert(key, stored[0], stored[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return stored[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        expires = now + self.ttl
+        with self._lock:
+            self._insert(key, value, expires)
+            prune = now >= self._next_prune
+            if prune:
+                self._next_prune = now + PRUNE_INTERVAL
+        if self.store is not None:
+            self.store.defer(self.store.set, key, value, expires)
+            # Expired rows are otherwise only replaced, never removed
+            if prune:
+                self.store.defer(self.store.prune)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _insert(self, key: str, value: Any, expires: float) -> None:
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "size": len(self._data),
+        }
+
+
+def _make_cache(table: str, maxsize: int, ttl: float) -> TTLCache:
+    store = None
+    # Workers share one file so an entry cached by one serves them all
+    path = settings.RETRIEVAL_CACHE_PATH or (shared_state_path("retrieval_cache.sqlite3") if settings.WORKERS > 1 else None)
+    if path:
+        try:
+            store = SQLiteStore(path, table)
+        except Exception:
+            logger.exception("Failed to open retrieval cache store; using memory only")
+    return TTLCache(maxsize=maxsize, ttl=ttl, store=store)
+
+
+embedding_cache = _make_cache("query_embeddings", settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL)
+search_cache = _make_cache("search_results", settings.RETRIEVAL_CACHE_SIZE, settings.RETRIEVAL_CACHE_TTL)
+
+
+def embedding_key(query: str, model: str) -> str:
+    return f"{model}:{normalize_query(query)}"
+
+
+def search_key(query: str, alpha: float, limit: int) -> str:
+    return f"{corpus_version()}:{settings.SEARCH_BACKEND}:{alpha}:{limit}:{normalize_query(query)}"
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters for every retrieval cache."""
+    return {"embeddings": embedding_cache.stats(), "search": search_cache.stats()}
+
+
+@metrics.collector
+def _collect() -> None:
+    for name, stats in cache_stats().items():
+        for stat, value in stats.items():
+            CACHE_STATS.set(value, name, stat)
@@ -0,0 +1,259 @@
+"""Offline, boundary-aware document chunking.
+
+Replaces the Cohere tokenize/detokenize round trips in
+`data/chunking.ipynb`. Documents are segmented on heading, line and
+sentence boundaries, token counts come from a local pluggable
+estimator, and segments are packed greedily into chunks of at most
+`max_tokens` with `overlap_tokens` carried over between neighbours.
+Chunk text is always a slice of the source document, so character
+offsets are exact. Output uses the `chunks.json` schema.
+
+Usage:
+    python -m services.chunking --input data/data.json --output data/chunks.json
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+MAX_TOKENS = 2048
+OVERLAP_TOKENS = 150
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_LINE_RE = re.compile(r"[^\n]+")
+
+
+# --- Token estimators ---
+class RegexTokenEstimator:
+    """Approximates subword tokenizers: one token per punctuation mark and
+    per `chars_per_piece` characters of every word."""
+
+    def __init__(self, chars_per_piece: int = 6) -> None:
+        self.chars_per_piece = chars_per_piece
+
+    def __call__(self, text: str) -> int:
+        return sum(math.ceil(len(piece) / self.chars_per_piece) for piece in _WORD_RE.findall(text))
+
+
+class CharRatioEstimator:
+    """Cheapest estimate: a fixed number of characters per token."""
+
+    def __init__(self, chars_per_token: float = 4.0) -> None:
+        self.chars_per_token = chars_per_token
+
+    def __call__(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+
+TokenEstimator = Callable[[str], int]
+
+ESTIMATORS: Dict[str, Callable[[], TokenEstimator]] = {
+    "regex": RegexTokenEstimator,
+    "chars": CharRatioEstimator,
+}
+
+
+def get_estimator(name: str = "regex") -> TokenEstimator:
+    """Return a registered token estimator by name."""
+    try:
+        return ESTIMATORS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown token estimator {name!r}; expected one of {sorted(ESTIMATORS)}")
+
+
+# --- Segmentation ---
+@dataclass
+class Segment:
+    start: int
+    end: int
+    tokens: int
+    heading: bool = False
+
+
+@dataclass
+class Chunk:
+    content: str
+    start: int
+    end: int
+    tokens: int
+
+
+def _is_heading(line: str) -> bool:
+    """Scraped pages put headings on their own short, unpunctuated line."""
+    stripped = line.strip()
+    return 0 < len(stripped) <= 80 and stripped[-1] not in ".!?,;:" and len(stripped.split()) <= 10
+
+
+def _split_long(text: str, start: int, end: int, max_tokens: int, estimate: TokenEstimator) -> Iterable[Segment]:
+    """Hard-split a segment that alone exceeds the budget on word boundaries."""
+    piece_start = start
+    last_break = start
+    for match in re.finditer(r"\S+", text[start:end]):
+        word_end = start + match.end()
+        if estimate(text[piece_start:word_end]) > max_tokens and last_break > piece_start:
+            yield Segment(piece_start, last_break, estimate(text[piece_start:last_break]))
+            piece_start = start + match.start()
+        last_break = word_end
+    if piece_start < end:
+        yield Segment(piece_start, end, estimate(text[piece_start:end]))
+
+
+def segment(text: str, max_tokens: int, estimate: TokenEstimator) -> List[Segment]:
+    """Split `text` into heading/sentence segments with character offsets."""
+    segments: List[Segment] = []
+    for line in _LINE_RE.finditer(text):
+        if not line.group().strip():
+            continue
+        if _is_heading(line.group()):
+            segments.append(Segment(line.start(), line.end(), estimate(line.group()), heading=True))
+            continue
+
+        sentence_start = line.start()
+        bounds = [line.start() + m.start() for m in _SENTENCE_END_RE.finditer(line.group())] + [line.end()]
+        for bound in bounds:
+            sentence = text[sentence_start:bound]
+            tokens = estimate(sentence)
+            if tokens > max_tokens:
+                segments.extend(_split_long(text, sentence_start, bound, max_tokens, estimate))
+            else:
+                segments.append(Segment(sentence_start, bound, tokens))
+            sentence_start = bound
+            while sentence_start < line.end() and text[sentence_start].isspace():
+                sentence_start += 1
+    return segments
+
+
+def chunk_text(
+    text: str,
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+    estimate: Optional[TokenEstimator] = None,
+) -> List[Chunk]:
+    """Pack segments into chunks of at most `max_tokens` tokens.
+
+    A new chunk starts early at a heading once the current one is at
+    least half full, and begins with trailing segments of the previous
+    chunk worth up to `overlap_tokens` tokens.
+    """
+    estimate = estimate or get_estimator()
+    segments = segment(text, max_tokens, estimate)
+    chunks: List[Chunk] = []
+    current: List[Segment] = []
+    used = 0
+
+    def emit() -> None:
+        start, end = current[0].start, current[-1].end
+        chunks.append(Chunk(text[start:end], start, end, used))
+
+    for seg in segments:
+        overflow = used + seg.tokens > max_tokens
+        heading_break = seg.heading and used >= max_tokens // 2
+        if current and (overflow or heading_break):
+            emit()
+            # Carry the tail of the previous chunk over as overlap
+            carried: List[Segment] = []
+            carried_tokens = 0
+            for prev in reversed(current):
+                if carried_tokens + prev.tokens > overlap_tokens or carried_tokens + prev.tokens + seg.tokens > max_tokens:
+                    break
+                carried.insert(0, prev)
+                carried_tokens += prev.tokens
+            current, used = carried, carried_tokens
+        current.append(seg)
+        used += seg.tokens
+
+    if current and (not chunks or current[-1].end > chunks[-1].end):
+        emit()
+    return chunks
+
+
+# --- Documents ---
+def parse_url(url: str) -> Dict[str, Optional[str]]:
+    """Derive category/page/subpage from a page URL path."""
+    path = urlparse(url).path.strip("/")
+    parts = path.split("/")
+
+    if len(parts) == 0:
+        return {"category": None, "page_name": None, "subpage": None, "url": url}
+
+    return {
+        "category": parts[0],
+        "subpage": "/".join(parts[1:-1]) if len(parts) > 2 else None,
+        "page_name": parts[-1],
+        "url": url,
+    }
+
+
+def chunk_document(
+    document: Dict,
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+    estimator: str = "regex",
+    include_offsets: bool = False,
+) -> List[Dict]:
+    """Chunk one scraped document into `chunks.json` records."""
+    metadata = parse_url(document["url"])
+    records = []
+    for idx, chunk in enumerate(chunk_text(document["content"], max_tokens, overlap_tokens, get_estimator(estimator)), 1):
+        record = {**metadata, "chunk_id": f"{metadata['page_name']}_{idx}", "content": chunk.content}
+        if include_offsets:
+            record.update(char_start=chunk.start, char_end=chunk.end, tokens=chunk.tokens)
+        records.append(record)
+    return records
+
+
+def _chunk_document_args(args: Tuple) -> List[Dict]:
+    return chunk_document(*args)
+
+
+def chunk_documents(
+    documents: List[Dict],
+    max_tokens: int = MAX_TOKENS,
+    overlap_tokens: int = OVERLAP_TOKENS,
+    estimator: str = "regex",
+    include_offsets: bool = False,
+    workers: Optional[int] = None,
+) -> List[Dict]:
+    """Chunk many documents in parallel across processes, preserving order."""
+    jobs = [(doc, max_tokens, overlap_tokens, estimator, include_offsets) for doc in documents]
+    if workers == 1 or len(jobs) < 2:
+        results = map(_chunk_document_args, jobs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            results = list(pool.map(_chunk_document_args, jobs, chunksize=8))
+    return [record for records in results for record in records]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Chunk scraped documents into chunks.json")
+    parser.add_argument("--input", default="data/data.json")
+    parser.add_argument("--output", default="data/chunks.json")
+    parser.add_argument("--max-tokens", type=int, default=MAX_TOKENS)
+    parser.add_argument("--overlap", type=int, default=OVERLAP_TOKENS)
+    parser.add_argument("--estimator", choices=sorted(ESTIMATORS), default="regex")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--offsets", action="store_true", help="Also write char_start/char_end/tokens")
+    args = parser.parse_args(argv)
+
+    with open(args.input, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    # data.json groups documents by top-level menu label
+    documents = [document for items in data.values() for document in items]
+
+    chunks = chunk_documents(
+        documents, args.max_tokens, args.overlap, args.estimator, args.offsets, args.workers
+    )
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(chunks, file, indent=4)
+    print(f"Wrote {len(chunks)} chunks from {len(documents)} documents to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
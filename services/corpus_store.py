@@ -0,0 +1,185 @@
+"""Compact binary corpus store.
+
+A corpus directory holds:
+
+- `header.json`: dimension, count, vector dtype, embedding model and
+  corpus version.
+- `vectors.bin`: a raw (count, dim) matrix of L2-normalised vectors in
+  float32, float16 or int8; loaded with `np.memmap` so it is zero-copy
+  and shared between processes through the page cache.
+- `scales.bin`: per-vector float32 scales (int8 only); the stored row
+  times its scale reconstructs the normalised vector.
+- `metadata.json`: the chunk fields stored column by column.
+
+Converters to and from the `chunks_embeddings.json` format are
+exposed both as functions and as a small CLI:
+
+    python -m services.corpus_store to-binary data/chunks_embeddings.json data/corpus --dtype float16
+    python -m services.corpus_store to-json data/corpus data/chunks_embeddings.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Chunk fields stored alongside each vector (the chunks.json schema)
+PROPERTY_FIELDS = ("chunk_id", "category", "page_name", "subpage", "url", "content")
+
+FORMAT_VERSION = 1
+DTYPES = ("float32", "float16", "int8")
+
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.bin"
+SCALES_FILE = "scales.bin"
+METADATA_FILE = "metadata.json"
+
+
+@dataclass
+class CorpusStore:
+    """A loaded corpus: metadata records plus (memory-mapped) vectors."""
+
+    header: Dict
+    records: List[Dict]
+    vectors: np.ndarray
+    scales: Optional[np.ndarray] = None
+
+    def dense(self) -> np.ndarray:
+        """Reconstruct the float32 vector matrix (copies for float16/int8)."""
+        if self.scales is not None:
+            return self.vectors.astype(np.float32) * self.scales[:, None]
+        return np.asarray(self.vectors, dtype=np.float32)
+
+
+def is_store(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, HEADER_FILE))
+
+
+def read_header(path: str) -> Dict:
+    with open(os.path.join(path, HEADER_FILE), "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _replace(path: str, name: str, write) -> None:
+    """Write `name` through a temporary file so readers never see a partial file."""
+    target = os.path.join(path, name)
+    tmp_path = f"{target}.tmp"
+    with open(tmp_path, "wb") as file:
+        write(file)
+    os.replace(tmp_path, target)
+
+
+def write_store(
+    path: str,
+    records: List[Dict],
+    vectors: np.ndarray,
+    dtype: str = "float32",
+    model: str = "embed-v4.0",
+) -> Dict:
+    """Write records and vectors as a binary corpus directory; returns the header."""
+    if dtype not in DTYPES:
+        raise ValueError(f"Unsupported dtype {dtype!r}; expected one of {DTYPES}")
+
+    matrix = np.asarray(vectors, dtype=np.float32).reshape(len(records), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+
+    scales = None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        stored = np.round(matrix / scales[:, None]).astype(np.int8)
+        scales = scales.astype(np.float32)
+    else:
+        stored = matrix.astype(dtype)
+
+    metadata = {key: [record.get(key) for record in records] for key in PROPERTY_FIELDS}
+    metadata_bytes = json.dumps(metadata, ensure_ascii=False).encode("utf-8")
+
+    digest = hashlib.sha256(metadata_bytes)
+    digest.update(stored.tobytes())
+    header = {
+        "format_version": FORMAT_VERSION,
+        "dim": int(matrix.shape[1]) if len(records) else 0,
+        "count": len(records),
+        "dtype": dtype,
+        "model": model,
+        "corpus_version": digest.hexdigest()[:16],
+    }
+
+    os.makedirs(path, exist_ok=True)
+    _replace(path, VECTORS_FILE, lambda file: file.write(np.ascontiguousarray(stored).tobytes()))
+    if scales is not None:
+        _replace(path, SCALES_FILE, lambda file: file.write(scales.tobytes()))
+    _replace(path, METADATA_FILE, lambda file: file.write(metadata_bytes))
+    # Header last: it is what readers use to detect a new version
+    _replace(path, HEADER_FILE, lambda file: file.write(json.dumps(header, indent=2).encode("utf-8")))
+    return header
+
+
+def load_store(path: str) -> CorpusStore:
+    """Open a corpus directory; vectors and scales are memory-mapped read-only."""
+    header = read_header(path)
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported corpus format version {header.get('format_version')}")
+
+    count, dim = header["count"], header["dim"]
+    vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=header["dtype"], mode="r", shape=(count, dim)) \
+        if count else np.zeros((0, dim), dtype=header["dtype"])
+    scales = None
+    if header["dtype"] == "int8" and count:
+        scales = np.memmap(os.path.join(path, SCALES_FILE), dtype=np.float32, mode="r", shape=(count,))
+
+    with open(os.path.join(path, METADATA_FILE), "r", encoding="utf-8") as file:
+        columns = json.load(file)
+    records = [{key: columns[key][i] for key in PROPERTY_FIELDS} for i in range(count)]
+    return CorpusStore(header=header, records=records, vectors=vectors, scales=scales)
+
+
+def json_to_store(json_path: str, store_path: str, dtype: str = "float32", model: str = "embed-v4.0") -> Dict:
+    """Convert a `chunks_embeddings.json` file into a binary corpus directory."""
+    with open(json_path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+    records = [{key: item.get(key) for key in PROPERTY_FIELDS} for item in data]
+    vectors = np.array([item["embedding"] for item in data], dtype=np.float32)
+    return write_store(store_path, records, vectors, dtype=dtype, model=model)
+
+
+def store_to_json(store_path: str, json_path: str) -> None:
+    """Convert a binary corpus directory back to `chunks_embeddings.json` format."""
+    store = load_store(store_path)
+    dense = store.dense()
+    data = [{**record, "embedding": dense[i].tolist()} for i, record in enumerate(store.records)]
+    with open(json_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Convert between JSON and binary corpus formats")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    to_binary = subparsers.add_parser("to-binary", help="chunks_embeddings.json -> corpus directory")
+    to_binary.add_argument("source")
+    to_binary.add_argument("target")
+    to_binary.add_argument("--dtype", choices=DTYPES, default="float32")
+    to_binary.add_argument("--model", default="embed-v4.0")
+
+    to_json = subparsers.add_parser("to-json", help="corpus directory -> chunks_embeddings.json")
+    to_json.add_argument("source")
+    to_json.add_argument("target")
+
+    args = parser.parse_args(argv)
+    if args.command == "to-binary":
+        header = json_to_store(args.source, args.target, dtype=args.dtype, model=args.model)
+        print(json.dumps(header, indent=2))
+    else:
+        store_to_json(args.source, args.target)
+
+
+if __name__ == "__main__":
+    main()
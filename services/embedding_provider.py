@@ -1,12 +1,17 @@
 """Embedding provider adapters.
 
-This file contains a small adapter around the Cohere embeddings API
+This file contains small adapters around the Cohere embeddings API
 used to convert text queries into vector representations for search.
+`AsyncCohereEmbeddingProvider` is the one used on the request path: it
+shares a single async client and coalesces concurrent queries into
+batched embed requests so the event loop is never blocked. The Cohere
+SDK is imported when the first provider is created.
 """
 
-from typing import List
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
 from config import settings
-import cohere
+from services import startup
 import logging
 
 
@@ -16,8 +21,10 @@ logger = logging.getLogger(__name__)
 class CohereEmbeddingProvider:
     """Adapter around Cohere embeddings API."""
 
+    model = "embed-v4.0"
+
     def __init__(self) -> None:
-        self.client = cohere.ClientV2(settings.COHERE_API_KEY)
+        self.client = startup.lazy_import("cohere").ClientV2(settings.COHERE_API_KEY)
 
     def embed(self, text: str) -> List[float]:
         """Return embedding vector for `text`.
@@ -28,7 +35,7 @@ class CohereEmbeddingProvider:
         try:
             resp = self.client.embed(
                 texts=[text],
-                model="embed-v4.0",
+                model=self.model,
                 input_type="search_query",
                 embedding_types=["float"],
             )
@@ -36,3 +43,100 @@ class CohereEmbeddingProvider:
         except Exception as e:  # minimal, graceful handling
             logger.exception(f"Cohere embedding error: {e}")
             return []
+
+
+# Cohere accepts at most 96 texts per embed request
+_MAX_BATCH_SIZE = 96
+
+
+class AsyncCohereEmbeddingProvider:
+    """Async, micro-batching adapter around Cohere embeddings API.
+
+    Calls to `embed` that arrive within `max_wait` seconds of each other
+    are sent as one `embed(texts=[...])` request of up to `batch_size`
+    texts; each caller receives its own vector.
+    """
+
+    model = "embed-v4.0"
+
+    def __init__(self, batch_size: Optional[int] = None, max_wait: Optional[float] = None) -> None:
+        cohere = startup.lazy_import("cohere")
+        with startup.timed("client cohere"):
+            self.client = cohere.AsyncClientV2(settings.COHERE_API_KEY, httpx_client=startup.http_client())
+        self.batch_size = min(batch_size or settings.EMBED_BATCH_SIZE, _MAX_BATCH_SIZE)
+        self.max_wait = settings.EMBED_BATCH_MAX_WAIT_MS / 1000 if max_wait is None else max_wait
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.requests = 0
+        self.texts = 0
+
+    async def embed(self, text: str) -> List[float]:
+        """Return embedding vector for `text`, or an empty list on error."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # Identical texts in the same window share one slot in the request
+        positions: Dict[str, int] = {}
+        for text, _ in batch:
+            positions.setdefault(text, len(positions))
+
+        try:
+            self.requests += 1
+            self.texts += len(positions)
+            resp = await self.client.embed(
+                texts=list(positions),
+                model=self.model,
+                input_type="search_query",
+                embedding_types=["float"],
+            )
+            vectors = resp.embeddings.float_
+            results = {text: vectors[index] for text, index in positions.items()}
+        except Exception as e:  # minimal, graceful handling
+            logger.exception(f"Cohere batch embedding error: {e}")
+            results = {}
+
+        for text, future in batch:
+            if not future.done():
+                future.set_result(results.get(text, []))
+
+
+# Shared embedder so one Cohere client (and batching window) serves every session
+_async_embedder: Optional[AsyncCohereEmbeddingProvider] = None
+
+
+def get_async_embedder() -> AsyncCohereEmbeddingProvider:
+    global _async_embedder
+    with startup.client_lock("cohere"):
+        if _async_embedder is None:
+            _async_embedder = AsyncCohereEmbeddingProvider()
+    return _async_embedder
+
+
+async def async_embedder() -> AsyncCohereEmbeddingProvider:
+    """The shared embedder, built in a thread on first use so the SDK import never blocks the loop."""
+    return _async_embedder or await asyncio.to_thread(get_async_embedder)
+
+
+async def warm_cohere() -> None:
+    """Create the shared embedder and open a keep-alive connection to Cohere."""
+    embedder = await async_embedder()
+    await embedder.client.models.list(page_size=1)
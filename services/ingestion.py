@@ -0,0 +1,340 @@
+"""Incremental, batched ingestion pipeline.
+
+Replaces the `embeddings.ipynb` / `ingestion.ipynb` notebooks. Reads
+`chunks.json` as a stream, hashes every chunk, embeds only new or
+changed chunks in bounded concurrent batches and upserts them with
+deterministic UUIDs derived from `chunk_id`. Chunks that disappeared
+from the source are deleted. Progress is recorded in a state file
+after every batch, so an interrupted run resumes where it stopped. The
+local corpus is rewritten only every `flush_every` batches and at the
+end; on resume, chunks the state file lists but the local corpus lacks
+are embedded again.
+
+The local corpus (`settings.LOCAL_CORPUS_PATH`) is always kept in
+sync; with the Weaviate backend the collection is updated as well. A run
+that changed anything bumps the corpus version, so running workers stop
+serving cached search results within `cache.VERSION_CHECK_INTERVAL`,
+and empties the shared answer cache, whose answers came from the old
+corpus.
+
+Usage:
+    python -m services.ingestion --chunks data/chunks.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional
+
+import cohere
+import numpy as np
+
+from config import settings
+from services.answer_cache import answer_cache
+from services.cache import bump_corpus_version
+from services.corpus_store import PROPERTY_FIELDS, is_store, load_store, read_header, write_store
+
+logger = logging.getLogger(__name__)
+
+_UUID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "https://www.sunmarke.com/")
+_MAX_BATCH_SIZE = 96
+# Batches between rewrites of the local corpus file
+_FLUSH_EVERY = 20
+
+
+def iter_json_array(path: str, buffer_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the items of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as file:
+        buffer = file.read(buffer_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(f"{path} does not contain a JSON array")
+        buffer = buffer[1:]
+        eof = False
+
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                more = file.read(buffer_size)
+                eof = not more
+                buffer += more
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+def chunk_uuid(chunk_id: str) -> str:
+    """Deterministic object UUID for a chunk."""
+    return str(uuid.uuid5(_UUID_NAMESPACE, chunk_id))
+
+
+def chunk_hash(chunk: Dict) -> str:
+    """Content hash over every stored property of a chunk."""
+    payload = json.dumps([chunk.get(key) for key in PROPERTY_FIELDS], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _write_json_atomic(path: str, data) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+class LocalSink:
+    """Keeps the local corpus in sync.
+
+    Writes `chunks_embeddings.json` style JSON, or a binary corpus
+    directory (keeping its vector dtype) when `path` already is one.
+    Every write is a full rewrite, so changes are buffered and written
+    every `flush_every` upserts and on `flush` / `close`.
+    """
+
+    def __init__(self, path: str, flush_every: int = _FLUSH_EVERY) -> None:
+        self.path = path
+        self.flush_every = max(1, flush_every)
+        self.records: Dict[str, Dict] = {}
+        self.dtype = None
+        self._pending = 0
+        self._dirty = False
+        if is_store(path):
+            self.dtype = read_header(path)["dtype"]
+            store = load_store(path)
+            dense = store.dense()
+            for i, record in enumerate(store.records):
+                self.records[record["chunk_id"]] = {**record, "embedding": dense[i].tolist()}
+        elif os.path.exists(path):
+            for item in iter_json_array(path):
+                self.records[item["chunk_id"]] = item
+
+    def known_hashes(self) -> Dict[str, str]:
+        """Hashes of chunks already embedded in the corpus file."""
+        return {chunk_id: chunk_hash(item) for chunk_id, item in self.records.items()}
+
+    def upsert(self, chunks: List[Dict], vectors: List[List[float]]) -> None:
+        for chunk, vector in zip(chunks, vectors):
+            self.records[chunk["chunk_id"]] = {**{key: chunk.get(key) for key in PROPERTY_FIELDS}, "embedding": vector}
+        self._dirty = True
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def delete(self, chunk_ids: List[str]) -> None:
+        for chunk_id in chunk_ids:
+            self.records.pop(chunk_id, None)
+        self._dirty = True
+
+    def flush(self) -> None:
+        if self._dirty:
+            self._write()
+        self._dirty = False
+        self._pending = 0
+
+    def _write(self) -> None:
+        if self.dtype is None:
+            _write_json_atomic(self.path, list(self.records.values()))
+            return
+        records = list(self.records.values())
+        vectors = np.array([record["embedding"] for record in records], dtype=np.float32)
+        write_store(self.path, records, vectors, dtype=self.dtype)
+
+    def close(self) -> None:
+        self.flush()
+
+
+class WeaviateSink:
+    """Upserts chunks into the configured Weaviate collection."""
+
+    def __init__(self) -> None:
+        import weaviate
+        from weaviate.classes.config import Configure, Property, DataType
+
+        self.client = weaviate.connect_to_weaviate_cloud(
+            cluster_url=settings.SUNMARKE_WEAVIATE_URL,
+            auth_credentials=weaviate.auth.AuthApiKey(settings.SUNMARKE_WEAVIATE_API_KEY),
+        )
+        name = settings.SUNMARKE_COLLECTION
+        if not self.client.collections.exists(name):
+            self.client.collections.create(
+                name=name,
+                vectorizer_config=Configure.Vectorizer.none(),
+                properties=[Property(name=key, data_type=DataType.TEXT) for key in PROPERTY_FIELDS],
+            )
+        self.collection = self.client.collections.get(name)
+
+    def upsert(self, chunks: List[Dict], vectors: List[List[float]]) -> None:
+        # Batch inserts overwrite objects that already exist under the same UUID
+        with self.collection.batch.dynamic() as batch:
+            for chunk, vector in zip(chunks, vectors):
+                batch.add_object(
+                    properties={key: chunk.get(key) for key in PROPERTY_FIELDS},
+                    uuid=chunk_uuid(chunk["chunk_id"]),
+                    vector=vector,
+                )
+        failed = self.collection.batch.failed_objects
+        if failed:
+            raise RuntimeError(f"{len(failed)} objects failed to upsert into Weaviate")
+
+    def flush(self) -> None:
+        pass
+
+    def delete(self, chunk_ids: List[str]) -> None:
+        from weaviate.classes.query import Filter
+
+        if chunk_ids:
+            self.collection.data.delete_many(
+                where=Filter.by_id().contains_any([chunk_uuid(chunk_id) for chunk_id in chunk_ids])
+            )
+
+    def close(self) -> None:
+        self.client.close()
+
+
+class IngestionPipeline:
+    """Hash-diff the source chunks against the state file and sync sinks."""
+
+    def __init__(
+        self,
+        chunks_path: str,
+        state_path: str,
+        sinks: List,
+        batch_size: int = _MAX_BATCH_SIZE,
+        concurrency: int = 4,
+        retries: int = 3,
+        full: bool = False,
+    ) -> None:
+        self.chunks_path = chunks_path
+        self.state_path = state_path
+        self.sinks = sinks
+        self.batch_size = min(batch_size, _MAX_BATCH_SIZE)
+        self.concurrency = concurrency
+        self.retries = retries
+        self.client = cohere.AsyncClientV2(settings.COHERE_API_KEY)
+        self.state = {} if full else self._load_state()
+        self._commit_lock = asyncio.Lock()
+
+    def _load_state(self) -> Dict[str, str]:
+        local = next((sink for sink in self.sinks if isinstance(sink, LocalSink)), None)
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as file:
+                state = json.load(file)["chunks"]
+            if local is not None:
+                # Batches after the corpus was last written are redone
+                known = local.known_hashes()
+                state = {chunk_id: digest for chunk_id, digest in state.items() if known.get(chunk_id) == digest}
+            return state
+
+        # No state yet: trust whatever the local corpus already holds
+        return local.known_hashes() if local is not None else {}
+
+    def _save_state(self) -> None:
+        _write_json_atomic(self.state_path, {"chunks": self.state})
+
+    async def _embed(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.retries):
+            try:
+                resp = await self.client.embed(
+                    texts=texts,
+                    model="embed-v4.0",
+                    input_type="search_document",
+                    embedding_types=["float"],
+                )
+                return resp.embeddings.float_
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                logger.exception("Embedding batch failed; retrying")
+                await asyncio.sleep(2 ** attempt)
+
+    async def _process_batch(self, batch: List[Dict], semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            vectors = await self._embed([chunk["content"] for chunk in batch])
+
+        # Sinks are written one batch at a time so the state file stays consistent
+        async with self._commit_lock:
+            for sink in self.sinks:
+                await asyncio.to_thread(sink.upsert, batch, vectors)
+            for chunk in batch:
+                self.state[chunk["chunk_id"]] = chunk["_hash"]
+            self._save_state()
+        logger.info(f"Upserted {len(batch)} chunks")
+
+    async def run(self, dry_run: bool = False) -> Dict[str, int]:
+        seen = set()
+        changed: List[Dict] = []
+        for chunk in iter_json_array(self.chunks_path):
+            if chunk["chunk_id"] in seen:
+                # Objects are keyed by chunk_id, so the last duplicate wins
+                logger.warning(f"Duplicate chunk_id {chunk['chunk_id']}; keeping the last occurrence")
+                changed = [item for item in changed if item["chunk_id"] != chunk["chunk_id"]]
+            seen.add(chunk["chunk_id"])
+            digest = chunk_hash(chunk)
+            if self.state.get(chunk["chunk_id"]) != digest:
+                changed.append({**chunk, "_hash": digest})
+        removed = [chunk_id for chunk_id in self.state if chunk_id not in seen]
+
+        summary = {"total": len(seen), "changed": len(changed), "removed": len(removed)}
+        if dry_run:
+            return summary
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        batches = [changed[i:i + self.batch_size] for i in range(0, len(changed), self.batch_size)]
+        await asyncio.gather(*(self._process_batch(batch, semaphore) for batch in batches))
+
+        if removed:
+            for sink in self.sinks:
+                await asyncio.to_thread(sink.delete, removed)
+            for chunk_id in removed:
+                self.state.pop(chunk_id, None)
+        for sink in self.sinks:
+            await asyncio.to_thread(sink.flush)
+        self._save_state()
+        if changed or removed:
+            bump_corpus_version()
+            answer_cache.invalidate()
+        return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Incrementally embed and index chunks.json")
+    parser.add_argument("--chunks", default="data/chunks.json")
+    parser.add_argument("--corpus", default=settings.LOCAL_CORPUS_PATH)
+    parser.add_argument("--state", default="data/ingestion_state.json")
+    parser.add_argument("--backend", choices=["weaviate", "local"], default=settings.SEARCH_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=_MAX_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--flush-every", type=int, default=_FLUSH_EVERY, help="Batches between rewrites of the local corpus")
+    parser.add_argument("--full", action="store_true", help="Ignore saved state and re-embed every chunk")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    sinks = [LocalSink(args.corpus, flush_every=args.flush_every)]
+    if args.backend == "weaviate" and not args.dry_run:
+        sinks.append(WeaviateSink())
+
+    pipeline = IngestionPipeline(
+        args.chunks, args.state, sinks,
+        batch_size=args.batch_size, concurrency=args.concurrency, full=args.full,
+    )
+    try:
+        summary = asyncio.run(pipeline.run(dry_run=args.dry_run))
+    finally:
+        for sink in sinks:
+            sink.close()
+    logger.info(f"Ingestion finished: {summary}")
+
+
+if __name__ == "__main__":
+    main()
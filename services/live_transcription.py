@@ -0,0 +1,186 @@
+"""Streaming speech-to-text over Deepgram's live websocket API.
+
+While the user is still speaking, the microphone chunks Gradio streams
+in are downmixed to mono, resampled to 16 kHz and sent as raw
+`linear16` PCM (about a sixth of the bytes of a 48 kHz stereo WAV)
+over one websocket per session. Interim results update the textbox as
+they arrive, and since everything said so far is already transcribed,
+the final transcript only needs the last fraction of a second flushed
+once recording stops.
+
+The endpoint is `settings.DEEPGRAM_LIVE_URL`, so the local stand-in in
+`benchmarks.fake_deepgram_live` can replace Deepgram in tests.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+import numpy as np
+from websockets.asyncio.client import ClientConnection, connect
+
+from config import settings
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = 16000
+# Seconds after recording stops during which late chunks are still dropped
+STOPPED_GRACE = 30.0
+
+_QUERY = {
+    "model": "nova-3",
+    "language": "en-US",
+    "smart_format": "true",
+    "interim_results": "true",
+    "encoding": "linear16",
+    "sample_rate": SAMPLE_RATE,
+    "channels": 1,
+}
+
+
+def to_linear16(sample_rate: int, samples: np.ndarray) -> bytes:
+    """Mono 16 kHz little-endian int16 PCM from a Gradio audio chunk."""
+    audio = np.asarray(samples)
+    if np.issubdtype(audio.dtype, np.integer):
+        audio = audio.astype(np.float32) / -np.iinfo(audio.dtype).min
+    else:
+        audio = audio.astype(np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    if sample_rate != SAMPLE_RATE and len(audio):
+        count = max(1, round(len(audio) * SAMPLE_RATE / sample_rate))
+        audio = np.interp(np.linspace(0, len(audio) - 1, count), np.arange(len(audio)), audio)
+    return (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+
+class LiveTranscription:
+    """One live transcription connection.
+
+    `transcript` is the finalized text plus the current interim guess.
+    """
+
+    def __init__(self, url: str, api_key: Optional[str]) -> None:
+        self.url = f"{url}?{urlencode(_QUERY)}"
+        self.api_key = api_key
+        self.final: List[str] = []
+        self.interim = ""
+        self.failed = False
+        self._ws: Optional[ClientConnection] = None
+        self._connected = asyncio.create_task(self._connect())
+        self._reader: Optional[asyncio.Task] = None
+
+    @property
+    def closed(self) -> bool:
+        """Whether the server has hung up (e.g. Deepgram's idle timeout)."""
+        return self._reader is not None and self._reader.done()
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(part for part in (*self.final, self.interim) if part)
+
+    async def _connect(self) -> None:
+        headers = {"Authorization": f"Token {self.api_key}"} if self.api_key else None
+        self._ws = await connect(self.url, additional_headers=headers)
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        async for message in self._ws:
+            if isinstance(message, bytes):
+                continue
+            data = json.loads(message)
+            if data.get("type") != "Results":
+                continue
+            alternatives = data.get("channel", {}).get("alternatives") or [{}]
+            text = alternatives[0].get("transcript", "").strip()
+            if data.get("is_final"):
+                if text:
+                    self.final.append(text)
+                self.interim = ""
+            else:
+                self.interim = text
+
+    async def _ready(self) -> bool:
+        if not self.failed:
+            try:
+                await self._connected
+            except Exception:
+                logger.exception("Live transcription connection failed")
+                self.failed = True
+        return not self.failed
+
+    async def send(self, audio: bytes) -> None:
+        if audio and await self._ready():
+            try:
+                await self._ws.send(audio)
+            except Exception:
+                logger.exception("Live transcription send failed")
+                self.failed = True
+
+    async def finish(self, timeout: float) -> str:
+        """Flush the remaining audio and return the final transcript."""
+        if await self._ready():
+            try:
+                await self._ws.send(json.dumps({"type": "CloseStream"}))
+                # Deepgram sends the last results, then closes the socket
+                await asyncio.wait_for(asyncio.shield(self._reader), timeout)
+            except Exception:
+                logger.warning("Live transcription did not finish cleanly", exc_info=True)
+        await self.close()
+        return self.transcript
+
+    async def close(self) -> None:
+        if not self._connected.done():
+            self._connected.cancel()
+        if self._reader is not None:
+            self._reader.cancel()
+        if self._ws is not None:
+            await self._ws.close()
+
+
+_sessions: Dict[str, LiveTranscription] = {}
+# When each session's recording stopped; chunks still in flight are dropped
+_stopped: Dict[str, float] = {}
+
+
+def start_session(session_id: str) -> None:
+    """Open the connection as soon as recording starts (idempotent)."""
+    _stopped.pop(session_id, None)
+    # Sessions whose recording never stopped (tab closed) linger until Deepgram hangs up
+    for stale_id, stale in list(_sessions.items()):
+        if stale_id != session_id and (stale.closed or stale.failed):
+            del _sessions[stale_id]
+            asyncio.create_task(stale.close())
+    if session_id not in _sessions:
+        _sessions[session_id] = LiveTranscription(settings.DEEPGRAM_LIVE_URL, settings.DEEPGRAM_API_KEY)
+
+
+async def feed(session_id: str, sample_rate: int, samples: np.ndarray) -> Optional[str]:
+    """Send one microphone chunk and return the transcript so far.
+
+    Returns None for a chunk that arrives after recording stopped.
+    """
+    if session_id in _stopped:
+        return None
+    start_session(session_id)
+    session = _sessions[session_id]
+    await session.send(to_linear16(sample_rate, samples))
+    return session.transcript
+
+
+async def finish_session(session_id: str) -> str:
+    """Final transcript once recording stops ("" if nothing was streamed)."""
+    now = time.monotonic()
+    # Insertion order is stop order, so expired entries are at the front
+    while _stopped and next(iter(_stopped.values())) < now - STOPPED_GRACE:
+        del _stopped[next(iter(_stopped))]
+    _stopped.pop(session_id, None)
+    _stopped[session_id] = now
+    session = _sessions.pop(session_id, None)
+    if session is None:
+        return ""
+    with metrics.STAGE_SECONDS.time("transcription_finalize"):
+        return await session.finish(settings.VOICE_FINALIZE_TIMEOUT)
@@ -0,0 +1,436 @@
+"""In-process hybrid search over the local chunk corpus.
+
+Keeps the chunk vectors as a contiguous float32 NumPy matrix and a
+BM25 inverted index over `content`, then fuses the two result lists
+the same way Weaviate's `HybridFusion.RELATIVE_SCORE` does. Results
+expose the same `.properties` shape as Weaviate objects so callers
+such as `rag_pipeline.get_context` work unchanged.
+
+`settings.LOCAL_CORPUS_PATH` may point either at a JSON corpus or at
+a binary corpus directory (see `corpus_store`), whose vectors are
+searched straight from the memory map.
+
+With `VECTOR_INDEX=ivf` and at least `ANN_MIN_VECTORS` chunks, the
+vector side takes its `fusion_limit` candidates from an approximate
+IVF index (see `ann_index`) instead of scanning every vector, and
+re-scores only those candidates exactly. The index is rebuilt when the
+corpus changes and, with `ANN_INDEX_PATH` (or several workers), saved
+so other processes and restarts load it instead of rebuilding.
+
+Loading, building and searching are CPU-bound: `search_provider` runs
+them in a thread, and a re-ingested corpus is reloaded in the
+background while the previous index keeps serving.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import settings
+from services.ann_index import IVFIndex
+from services.cache import shared_state_path
+from services.corpus_store import PROPERTY_FIELDS, HEADER_FILE, is_store, load_store, read_header
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Weaviate's default "en" stopword preset, applied to BM25 scoring only.
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for if in into is it no not of on or such that the their "
+    "then there these they this to was will with".split()
+)
+_TOKEN_RE = re.compile(r"[0-9a-z]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokenization matching Weaviate's `word` tokenizer."""
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS]
+
+
+@dataclass
+class SearchResult:
+    """Minimal stand-in for a Weaviate object returned by a query."""
+
+    properties: Dict
+    score: float = 0.0
+    metadata: Dict = field(default_factory=dict)
+
+
+class LocalHybridIndex:
+    """Vector + BM25 index over an in-memory chunk corpus."""
+
+    def __init__(
+        self,
+        records: List[Dict],
+        vectors: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+        scales: Optional[np.ndarray] = None,
+        normalized: bool = False,
+    ) -> None:
+        self.records = records
+        self.k1 = k1
+        self.b = b
+        # Per-row scales for int8 vectors; None for float matrices
+        self.scales = scales
+        # Approximate index over the vectors, when enabled (see `_attach_ann`)
+        self.ann: Optional[IVFIndex] = None
+
+        if normalized:
+            # Already unit length (e.g. memory-mapped from a corpus store): use as is.
+            self.vectors = vectors
+        else:
+            # Contiguous, L2-normalised float32 matrix so a dot product is cosine similarity.
+            matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            self.vectors = matrix / norms
+
+        self._build_bm25()
+
+    @classmethod
+    def from_json(cls, path: str) -> "LocalHybridIndex":
+        """Build an index from a `chunks_embeddings.json` style file."""
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+
+        records = [{key: item.get(key) for key in PROPERTY_FIELDS} for item in data]
+        vectors = np.array([item["embedding"] for item in data], dtype=np.float32)
+        return cls(records, vectors)
+
+    @classmethod
+    def from_store(cls, path: str) -> "LocalHybridIndex":
+        """Build an index over a binary corpus directory without copying vectors."""
+        store = load_store(path)
+        return cls(store.records, store.vectors, scales=store.scales, normalized=True)
+
+    @classmethod
+    def load(cls, path: str) -> "LocalHybridIndex":
+        """Build an index from either a binary corpus directory or a JSON file."""
+        return cls.from_store(path) if is_store(path) else cls.from_json(path)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _build_bm25(self) -> None:
+        """Build the inverted index: term -> (doc ids, term frequencies)."""
+        postings: Dict[str, List] = defaultdict(lambda: ([], []))
+        lengths = np.zeros(len(self.records), dtype=np.float32)
+
+        for doc_id, record in enumerate(self.records):
+            terms = tokenize(record.get("content") or "")
+            lengths[doc_id] = len(terms)
+            for term, freq in Counter(terms).items():
+                ids, freqs = postings[term]
+                ids.append(doc_id)
+                freqs.append(freq)
+
+        n_docs = max(len(self.records), 1)
+        self._doc_lengths = lengths
+        self._avg_length = float(lengths.mean()) if len(lengths) else 0.0
+        self._postings = {}
+        for term, (ids, freqs) in postings.items():
+            idf = math.log(1 + (n_docs - len(ids) + 0.5) / (len(ids) + 0.5))
+            self._postings[term] = (
+                np.array(ids, dtype=np.int32),
+                np.array(freqs, dtype=np.float32),
+                idf,
+            )
+
+    def bm25_scores(self, query_text: str) -> np.ndarray:
+        """Return a BM25 score for every document (0 where no term matches)."""
+        scores = np.zeros(len(self.records), dtype=np.float32)
+        if not self._avg_length:
+            return scores
+
+        for term in set(tokenize(query_text)):
+            posting = self._postings.get(term)
+            if posting is None:
+                continue
+            ids, freqs, idf = posting
+            norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[ids] / self._avg_length)
+            scores[ids] += idf * freqs * (self.k1 + 1) / (freqs + norm)
+        return scores
+
+    def vector_scores(self, query_vector: List[float]) -> np.ndarray:
+        """Return cosine similarity between `query_vector` and every document."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(self.records), dtype=np.float32)
+        scores = self.vectors @ (query / norm)
+        if self.scales is not None:
+            scores *= self.scales
+        return scores.astype(np.float32, copy=False)
+
+    def vector_candidates(self, query_vector: List[float], limit: int) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Vector scores and the ids to fuse from them.
+
+        Without an ANN index every document is a candidate. With one,
+        only its approximate top `limit` are, scored exactly; the
+        scores of all other documents are left at 0.
+        """
+        if self.ann is None:
+            return self.vector_scores(query_vector), None
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return np.zeros(len(self.records), dtype=np.float32), None
+        query = query / norm
+        candidates, _ = self.ann.search(query, limit, settings.ANN_NPROBE)
+        candidates = np.sort(candidates)
+        exact = np.asarray(self.vectors[candidates], dtype=np.float32) @ query
+        if self.scales is not None:
+            exact *= self.scales[candidates]
+        scores = np.zeros(len(self.records), dtype=np.float32)
+        scores[candidates] = exact
+        return scores, candidates
+
+    def hybrid(
+        self,
+        query_text: str,
+        query_vector: Optional[List[float]] = None,
+        alpha: float = 0.5,
+        limit: int = 3,
+        fusion_limit: int = 100,
+    ) -> List[SearchResult]:
+        """Relative-score fusion of vector and BM25 results.
+
+        Each sub-search keeps its top `fusion_limit` hits, min-max
+        normalises their scores to [0, 1] and the fused score is
+        `alpha * vector + (1 - alpha) * keyword`.
+        """
+        if not self.records:
+            return []
+
+        fused = np.zeros(len(self.records), dtype=np.float32)
+        matched = np.zeros(len(self.records), dtype=bool)
+
+        if query_vector is not None and len(query_vector) and alpha > 0:
+            scores, candidates = self.vector_candidates(query_vector, fusion_limit)
+            _accumulate(fused, matched, scores, alpha, fusion_limit, keep_zero=True, candidates=candidates)
+        if query_text and alpha < 1:
+            _accumulate(fused, matched, self.bm25_scores(query_text), 1 - alpha, fusion_limit, keep_zero=False)
+
+        candidates = np.flatnonzero(matched)
+        if not len(candidates):
+            return []
+        top = candidates[np.argsort(-fused[candidates], kind="stable")[:limit]]
+        return [
+            SearchResult(properties=dict(self.records[i]), score=float(fused[i]), metadata={"score": float(fused[i])})
+            for i in top
+        ]
+
+
+def _accumulate(
+    fused: np.ndarray,
+    matched: np.ndarray,
+    scores: np.ndarray,
+    weight: float,
+    fusion_limit: int,
+    keep_zero: bool,
+    candidates: Optional[np.ndarray] = None,
+) -> None:
+    """Add the min-max normalised top hits of one sub-search into `fused`.
+
+    `candidates` restricts the hits to those ids (e.g. from an ANN index).
+    """
+    if candidates is None:
+        candidates = np.arange(len(scores)) if keep_zero else np.flatnonzero(scores > 0)
+    if not len(candidates):
+        return
+    if len(candidates) > fusion_limit:
+        part = np.argpartition(-scores[candidates], fusion_limit - 1)[:fusion_limit]
+        candidates = candidates[part]
+
+    selected = scores[candidates]
+    low, high = float(selected.min()), float(selected.max())
+    normalised = (selected - low) / (high - low) if high > low else np.ones_like(selected)
+    fused[candidates] += weight * normalised
+    matched[candidates] = True
+
+
+# Lazily loaded singleton, mirroring the Weaviate client helper.
+_index: Optional[LocalHybridIndex] = None
+_index_stamp: Optional[tuple] = None
+_load_lock = threading.Lock()
+_reloading = False
+
+
+def _corpus_stamp() -> Optional[tuple]:
+    path = settings.LOCAL_CORPUS_PATH
+    if os.path.isdir(path):
+        path = os.path.join(path, HEADER_FILE)
+    try:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    except OSError:
+        return None
+
+
+def corpus_fingerprint(path: str) -> str:
+    """Identifier of the corpus data at `path`, used to match a saved ANN index.
+
+    A binary corpus records a hash of its vectors and metadata; a JSON
+    corpus falls back to its size and modification time. Unlike
+    `cache.corpus_version` this ignores `CORPUS_VERSION`, which may stay
+    pinned across re-ingestions.
+    """
+    if is_store(path):
+        header = read_header(path)
+        return f"{header['corpus_version']}:{header['count']}"
+    stat = os.stat(path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def _ann_path() -> Optional[str]:
+    # Workers share one file; the build lock makes the first of them build it
+    return settings.ANN_INDEX_PATH or (shared_state_path("ann_index.npz") if settings.WORKERS > 1 else None)
+
+
+@contextmanager
+def _build_lock(path: str) -> Iterator[None]:
+    """Hold an exclusive lock on `<path>.lock` across processes.
+
+    Without `fcntl` (Windows) processes may build the same index
+    concurrently; their per-process temporary files keep the saved
+    file intact.
+    """
+    with open(f"{path}.lock", "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _load_saved_ann(path: str, fingerprint: str, dim: int) -> Optional[IVFIndex]:
+    if not os.path.exists(path):
+        return None
+    try:
+        ann = IVFIndex.load(path)
+    except Exception:
+        logger.exception(f"Failed to load ANN index from {path}; rebuilding")
+        return None
+    if ann.fingerprint != fingerprint or ann.dim != dim:
+        return None
+    logger.info(f"Loaded ANN index with {ann.n_lists} lists from {path}.")
+    return ann
+
+
+def load_or_build_ann(vectors: np.ndarray, fingerprint: str) -> IVFIndex:
+    """The saved IVF index for `fingerprint`, or a new one (saved when a path is configured)."""
+    path = _ann_path()
+    if path:
+        with _build_lock(path):
+            # Another process may have built it while we waited for the lock
+            ann = _load_saved_ann(path, fingerprint, vectors.shape[1])
+            if ann is None:
+                ann = _build_ann(vectors, fingerprint)
+                try:
+                    ann.save(path)
+                except OSError:
+                    logger.exception(f"Failed to save ANN index to {path}")
+        return ann
+    return _build_ann(vectors, fingerprint)
+
+
+def _build_ann(vectors: np.ndarray, fingerprint: str) -> IVFIndex:
+    ann = IVFIndex.build(vectors, n_lists=settings.ANN_LISTS, nprobe=settings.ANN_NPROBE, fingerprint=fingerprint)
+    logger.info(f"Built ANN index with {ann.n_lists} lists over {len(ann)} vectors.")
+    return ann
+
+
+def prepare_ann_index(path: str) -> None:
+    """Build the shared ANN index of a binary corpus before the workers
+    start, so none of them pays for it (no-op unless enabled)."""
+    if settings.VECTOR_INDEX != "ivf" or not is_store(path):
+        return
+    fingerprint = corpus_fingerprint(path)
+    store = load_store(path)
+    if len(store.records) >= settings.ANN_MIN_VECTORS:
+        load_or_build_ann(store.vectors, fingerprint)
+
+
+def _load() -> LocalHybridIndex:
+    path = settings.LOCAL_CORPUS_PATH
+    # Fingerprint before loading: if the corpus changes in between, the
+    # index is labelled with the older version and rebuilt on the next reload
+    fingerprint = corpus_fingerprint(path)
+    index = LocalHybridIndex.load(path)
+    if settings.VECTOR_INDEX == "ivf" and len(index) >= settings.ANN_MIN_VECTORS:
+        index.ann = load_or_build_ann(index.vectors, fingerprint)
+    logger.info(f"Loaded local search index with {len(index)} chunks.")
+    return index
+
+
+def _reload(stamp: Optional[tuple]) -> None:
+    global _index, _index_stamp, _reloading
+    try:
+        _index = _load()
+    except Exception:
+        # Keep serving the previous corpus until the file changes again
+        logger.exception("Failed to reload local search corpus")
+    finally:
+        _index_stamp = stamp
+        _reloading = False
+
+
+def get_index() -> Optional[LocalHybridIndex]:
+    """Load the local corpus, reloading it after re-ingestion.
+
+    The first load blocks, so call this off the event loop. After a
+    re-ingestion the corpus (and its ANN index) is reloaded in a
+    background thread while the previous index keeps serving.
+    Returns None if the corpus is unavailable.
+    """
+    global _index, _index_stamp, _reloading
+    stamp = _corpus_stamp()
+    if _index is not None:
+        if stamp != _index_stamp and not _reloading:
+            with _load_lock:
+                if not _reloading:
+                    _reloading = True
+                    threading.Thread(target=_reload, args=(stamp,), name="local-index-reload", daemon=True).start()
+        return _index
+
+    with _load_lock:
+        if _index is None:
+            try:
+                _index = _load()
+                _index_stamp = stamp
+            except Exception:
+                logger.exception("Failed to load local search corpus")
+    return _index
+
+
+def local_hybrid_search(
+    query_text: str,
+    query_vector: List[float] = None,
+    alpha: float = 0.5,
+    limit: int = 3
+) -> List[SearchResult]:
+    """Hybrid search against the local corpus; empty list on failure."""
+    index = get_index()
+    if index is None:
+        return []
+    try:
+        return index.hybrid(query_text, query_vector, alpha=alpha, limit=limit)
+    except Exception:
+        logger.exception("Local hybrid search error")
+        return []
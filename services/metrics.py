@@ -0,0 +1,233 @@
+"""Lightweight latency and throughput instrumentation.
+
+Provides Prometheus-style counters, gauges and histograms, a text
+exposition renderer for the `/metrics` endpoint, an event-loop lag
+monitor and optional OpenTelemetry spans. With `METRICS_ENABLED` off
+every helper returns immediately (timers are a shared no-op context
+manager), so instrumented code pays close to nothing.
+"""
+
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+ENABLED = settings.METRICS_ENABLED
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+RATE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 400, 800)
+
+LabelValues = Tuple[str, ...]
+
+# Reusable no-op context manager handed out while instrumentation is off
+_NOOP = nullcontext()
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self._header() + [
+            f"{self.name}{_format_labels(self.label_names, labels)} {value}"
+            for labels, value in sorted(self._values.items())
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        # labels -> (per-bucket counts incl. +Inf, sum, count)
+        self._values: Dict[LabelValues, List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][bisect.bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def time(self, *labels: str):
+        """Context manager observing the elapsed wall time in seconds."""
+        if not ENABLED:
+            return _NOOP
+        return _Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, (counts, total, count) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "_Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+
+
+REGISTRY: List[_Metric] = []
+# Callbacks that refresh gauges from module state right before rendering
+COLLECTORS: List[Callable[[], None]] = []
+
+
+def collector(fn: Callable[[], None]) -> Callable[[], None]:
+    """Register `fn` to run before every `/metrics` scrape."""
+    COLLECTORS.append(fn)
+    return fn
+
+
+# --- Pipeline metrics ---
+STAGE_SECONDS = Histogram(
+    "sunmarke_stage_seconds", "Duration of pipeline stages", ["stage"]
+)
+PROVIDER_TTFT_SECONDS = Histogram(
+    "sunmarke_provider_ttft_seconds", "Time to first token per provider", ["provider"]
+)
+PROVIDER_STREAM_SECONDS = Histogram(
+    "sunmarke_provider_stream_seconds", "Total provider stream duration", ["provider"]
+)
+PROVIDER_TOKENS_PER_SECOND = Histogram(
+    "sunmarke_provider_tokens_per_second", "Approximate output tokens per second", ["provider"], buckets=RATE_BUCKETS
+)
+PROVIDER_ERRORS = Counter(
+    "sunmarke_provider_errors_total", "Provider streams that failed", ["provider"]
+)
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "sunmarke_event_loop_lag_seconds", "Delay of the event loop beyond the monitor interval"
+)
+IN_FLIGHT = Gauge(
+    "sunmarke_in_flight", "Requests currently being processed", ["kind"]
+)
+
+
+@contextmanager
+def in_flight(kind: str) -> Iterator[None]:
+    """Track the number of concurrently running operations of `kind`."""
+    IN_FLIGHT.inc(kind)
+    try:
+        yield
+    finally:
+        IN_FLIGHT.dec(kind)
+
+
+def render() -> str:
+    """Prometheus text exposition of every registered metric."""
+    for collect in COLLECTORS:
+        try:
+            collect()
+        except Exception as exc:
+            logger.warning(f"Metrics collector {collect.__name__} failed: {exc}")
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Tracing ---
+_tracer = None
+if settings.TRACING_ENABLED:
+    try:
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("sunmarke")
+    except ImportError:
+        logger.warning("TRACING_ENABLED is set but opentelemetry is not installed")
+
+
+def span(name: str, **attributes):
+    """OpenTelemetry span when tracing is enabled, otherwise a no-op."""
+    if _tracer is None:
+        return _NOOP
+    return _tracer.start_as_current_span(name, attributes=attributes or None)
+
+
+# --- Event loop lag ---
+_monitor_task: Optional[asyncio.Task] = None
+
+
+async def _monitor_loop_lag(interval: float) -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(loop.time() - start - interval, 0))
+
+
+def start_loop_monitor(interval: float = 0.5) -> None:
+    """Start sampling event-loop lag on the running loop (idempotent)."""
+    global _monitor_task
+    if ENABLED and (_monitor_task is None or _monitor_task.done()):
+        _monitor_task = asyncio.get_running_loop().create_task(_monitor_loop_lag(interval))
@@ -1,111 +1,286 @@
 """Model provider wrappers.
 
 Contains thin async adapters over the external model provider SDKs.
-Each function streams partial outputs and yields progressively
-concatenated text for the UI to display while the model generates.
+Each function streams partial outputs and yields text deltas as the
+model generates; the caller is responsible for accumulating them.
+Prompts are assembled by `services.prompt_builder` within a per-model
+input token budget. Streams go through `services.resilience` for
+first-token deadlines, optional hedging to a backup model and
+per-provider circuit breakers, behind the admission control in
+`services.scheduler`.
+
+Clients (and their SDKs) are created on first use through the `get_*`
+getters; `services.startup` warms them up in the background at launch.
 """
 
+import asyncio
 import logging
-from typing import AsyncGenerator, List, Dict
-from openai import AsyncOpenAI
-from groq import AsyncGroq
-from google import genai
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, List, Dict, Optional, Sequence
 from config import settings
-from services.prompts import system_prompt
+from services.prompt_builder import build_messages, build_gemini_request, count_tokens
+from services import metrics, startup
+from services.resilience import CircuitOpenError, StreamFactory, StreamOutcome, resilient_stream
+from services.scheduler import SchedulerBusy, get_scheduler
 
 logger = logging.getLogger(__name__)
 
-# Initialize Clients
+# Clients, created on first use
 # Note: Using Async versions of all clients to prevent UI blocking
-open_router = AsyncOpenAI(
-    base_url=settings.OPEN_ROUTER_URL,
-    api_key=settings.OPEN_ROUTER_API_KEY,
-)
+open_router = None
+groq_client = None
+google_client = None
+
+
+# Getters block while the SDK is imported: call them in a thread (see the async helpers)
+def get_open_router():
+    global open_router
+    with startup.client_lock("openrouter"):
+        if open_router is None:
+            openai = startup.lazy_import("openai")
+            with startup.timed("client openrouter"):
+                open_router = openai.AsyncOpenAI(
+                    base_url=settings.OPEN_ROUTER_URL,
+                    api_key=settings.OPEN_ROUTER_API_KEY,
+                    http_client=openai.DefaultAsyncHttpxClient(limits=startup.keepalive_limits()),
+                )
+    return open_router
+
+
+def get_groq_client():
+    global groq_client
+    with startup.client_lock("groq"):
+        if groq_client is None:
+            groq = startup.lazy_import("groq")
+            with startup.timed("client groq"):
+                groq_client = groq.AsyncGroq(
+                    api_key=settings.GROQ_API_KEY,
+                    base_url=settings.GROQ_BASE_URL,
+                    http_client=groq.DefaultAsyncHttpxClient(limits=startup.keepalive_limits()),
+                )
+    return groq_client
+
+
+def get_google_client():
+    global google_client
+    with startup.client_lock("gemini"):
+        if google_client is None:
+            genai = startup.lazy_import("google.genai")
+            with startup.timed("client gemini"):
+                http_options = genai.types.HttpOptions(httpx_async_client=startup.http_client())
+                # Gemini's new 2025 SDK uses .aio for async operations
+                google_client = genai.Client(api_key=settings.GEMINI_API_KEY, http_options=http_options).aio
+    return google_client
+
+
+async def open_router_client():
+    return open_router or await asyncio.to_thread(get_open_router)
+
 
-groq_client = AsyncGroq(
-    api_key=settings.GROQ_API_KEY,
-    base_url=settings.GROQ_BASE_URL,
-)
+async def groq_async_client():
+    return groq_client or await asyncio.to_thread(get_groq_client)
 
-# Gemini's new 2025 SDK uses .aio for async operations
-google_client = genai.Client(api_key=settings.GEMINI_API_KEY).aio
+
+async def google_async_client():
+    return google_client or await asyncio.to_thread(get_google_client)
+
+
+# Warm-up: SDK import and client construction run in a thread so the event
+# loop keeps serving; one cheap request then opens a pooled keep-alive connection
+async def warm_openrouter() -> None:
+    client = await open_router_client()
+    await client.models.list()
+
+
+async def warm_groq() -> None:
+    client = await groq_async_client()
+    await client.models.list()
+
+
+async def warm_gemini() -> None:
+    client = await google_async_client()
+    await client.models.list(config={"page_size": 1})
 
 _UNAVAILABLE_MSG = "Model currently unavailable, try again later."
+_BUSY_MSG = "Model is busy right now, please try again in a moment."
 
+DEEPSEEK_MODEL = "deepseek/deepseek-r1-0528:free"
+KIMI_MODEL = "moonshotai/kimi-k2-instruct-0905"
+GEMINI_MODEL = "gemini-2.5-flash"
 
-def _build_messages(query: str, context: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
-    """Helper to construct the message list with history and context."""
 
-    messages = [{"role": "system", "content": system_prompt}]
+def _unavailable(started: bool) -> str:
+    """Delta reporting a failure, separated from any partial answer."""
+    return f"\n\n{_UNAVAILABLE_MSG}" if started else _UNAVAILABLE_MSG
 
-    # SANITIZE HISTORY: Only keep 'role' and 'content' for the API calls
-    for msg in history:
-        messages.append({
-            "role": msg["role"],
-            "content": msg["content"]
-        })
 
-    messages.append({"role": "user", "content": f"CONTEXT: {context}\n\nQuery: {query}"})
-    return messages
+async def _close_upstream(stream) -> None:
+    """Close an SDK response stream so its HTTP connection is released
+    as soon as nobody reads it (OpenAI/Groq `close`, Gemini `aclose`)."""
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is not None:
+        await close()
 
 
-async def call_deepseek(query: str, context: str, history: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
-    """Stream response from DeepSeek via OpenRouter."""
+async def _openai_stream(get_client, model: str, messages: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
+    """Raw delta stream from an OpenAI-compatible chat completions API
+    (`get_client` is one of the async client helpers)."""
+    client = await get_client()
+    stream = await client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+    )
     try:
-        messages = _build_messages(query, context, history)
-        stream = await open_router.chat.completions.create(
-            model="deepseek/deepseek-r1-0528:free",
-            messages=messages,
-            stream=True,
-        )
-        full_content = ""
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                full_content += chunk.choices[0].delta.content
-                yield full_content
-    except Exception:
-        logger.exception("Deepseek streaming error")
-        yield _UNAVAILABLE_MSG
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await _close_upstream(stream)
 
 
-async def call_kimi(query: str, context: str, history: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
-    """Stream response from Kimi via Groq."""
+async def _gemini_stream(model: str, system: str, contents: List[Dict]) -> AsyncGenerator[str, None]:
+    """Raw delta stream from Google Gemini."""
+    client = await google_async_client()
+    stream = await client.models.generate_content_stream(
+        model=model,
+        contents=contents,
+        config={"system_instruction": system},
+    )
     try:
-        messages = _build_messages(query, context, history)
-        stream = await groq_client.chat.completions.create(
-            model="moonshotai/kimi-k2-instruct-0905",
-            messages=messages,
-            stream=True,
-        )
-        full_content = ""
         async for chunk in stream:
-            if chunk.choices[0].delta.content:
-                full_content += chunk.choices[0].delta.content
-                yield full_content
-    except Exception:
-        logger.exception("Kimi streaming error")
-        yield _UNAVAILABLE_MSG
+            if chunk.text:
+                yield chunk.text
+    finally:
+        await _close_upstream(stream)
 
 
-async def call_gemini(query: str, context: str, history: List[Dict[str, str]]) -> AsyncGenerator[str, None]:
-    """Stream response from Google Gemini."""
+async def _guarded_stream(
+    name: str,
+    primary: StreamFactory,
+    backup: Optional[StreamFactory],
+    first_token_timeout: float,
+    prompt: Sequence[str] = (),
+    priority: int = 1,
+    outcome: Optional[StreamOutcome] = None,
+) -> AsyncGenerator[str, None]:
+    """Run a provider stream through admission control and the resilience
+    layer; never raises.
+
+    `prompt` holds the prompt texts, counted against the provider's
+    tokens-per-minute limit; `priority` orders waiting streams;
+    `outcome` records whether the backup model served the answer.
+    """
+    scheduler = get_scheduler(name)
+    permit = None
+    if scheduler is not None:
+        try:
+            permit = await scheduler.acquire(
+                sum(map(count_tokens, prompt)) if scheduler.counts_tokens else 0, priority
+            )
+        except SchedulerBusy:
+            yield _BUSY_MSG
+            return
+    count = metrics.ENABLED or (scheduler is not None and scheduler.counts_tokens)
+
+    started = False
+    start = time.perf_counter()
+    tokens = 0
+    stream = resilient_stream(
+        name,
+        primary,
+        backup,
+        first_token_timeout=first_token_timeout,
+        hedge_delay=settings.HEDGE_DELAY,
+        outcome=outcome,
+    )
     try:
-        # Prompt construction for Gemini
-        prompt = (
-            f"Context: {context}\n\n"
-            f"History: {history}\n\n"
-            f"User Query: {query}"
-        )
-
-        stream = await google_client.models.generate_content_stream(
-            model="gemini-2.5-flash",
-            contents=prompt,
-        )
-        full_content = ""
-        async for chunk in stream:
-            if chunk.text:
-                full_content += chunk.text
-                yield full_content
+        async for delta in stream:
+            if not started:
+                started = True
+                metrics.PROVIDER_TTFT_SECONDS.observe(time.perf_counter() - start, name)
+            if count:
+                tokens += count_tokens(delta)
+            yield delta
+    except CircuitOpenError:
+        logger.warning(f"{name} skipped: circuit open")
+        metrics.PROVIDER_ERRORS.inc(name)
+        yield _unavailable(started)
     except Exception:
-        logger.exception("Gemini streaming error")
-        yield _UNAVAILABLE_MSG
+        logger.exception(f"{name} streaming error")
+        metrics.PROVIDER_ERRORS.inc(name)
+        yield _unavailable(started)
+    else:
+        elapsed = time.perf_counter() - start
+        metrics.PROVIDER_STREAM_SECONDS.observe(elapsed, name)
+        if tokens and elapsed > 0:
+            metrics.PROVIDER_TOKENS_PER_SECOND.observe(tokens / elapsed, name)
+    finally:
+        # Closing propagates down to the provider's HTTP stream
+        await stream.aclose()
+        if permit is not None:
+            permit.release(tokens)
+
+
+def _priority(history: List[Dict[str, str]]) -> int:
+    """Follow-up questions in a running conversation are admitted first."""
+    return 0 if history else 1
+
+
+async def call_deepseek(
+    query: str, context: str, history: List[Dict[str, str]], outcome: Optional[StreamOutcome] = None
+) -> AsyncGenerator[str, None]:
+    """Stream response from DeepSeek via OpenRouter."""
+    messages = build_messages(query, context, history, settings.DEEPSEEK_INPUT_TOKENS)
+    backup = settings.DEEPSEEK_BACKUP_MODEL
+    async with aclosing(_guarded_stream(
+        "Deepseek",
+        lambda: _openai_stream(open_router_client, DEEPSEEK_MODEL, messages),
+        (lambda: _openai_stream(open_router_client, backup, messages)) if backup else None,
+        settings.DEEPSEEK_TTFT_TIMEOUT,
+        [msg["content"] for msg in messages],
+        _priority(history),
+        outcome,
+    )) as stream:
+        async for delta in stream:
+            yield delta
+
+
+async def call_kimi(
+    query: str, context: str, history: List[Dict[str, str]], outcome: Optional[StreamOutcome] = None
+) -> AsyncGenerator[str, None]:
+    """Stream response from Kimi via Groq."""
+    messages = build_messages(query, context, history, settings.KIMI_INPUT_TOKENS)
+    backup = settings.KIMI_BACKUP_MODEL
+    async with aclosing(_guarded_stream(
+        "Kimi",
+        lambda: _openai_stream(groq_async_client, KIMI_MODEL, messages),
+        (lambda: _openai_stream(groq_async_client, backup, messages)) if backup else None,
+        settings.KIMI_TTFT_TIMEOUT,
+        [msg["content"] for msg in messages],
+        _priority(history),
+        outcome,
+    )) as stream:
+        async for delta in stream:
+            yield delta
+
+
+async def call_gemini(
+    query: str, context: str, history: List[Dict[str, str]], outcome: Optional[StreamOutcome] = None
+) -> AsyncGenerator[str, None]:
+    """Stream response from Google Gemini."""
+    # Gemini takes the system prompt separately and history as role-tagged contents
+    system, contents = build_gemini_request(query, context, history, settings.GEMINI_INPUT_TOKENS)
+    backup = settings.GEMINI_BACKUP_MODEL
+    async with aclosing(_guarded_stream(
+        "Gemini",
+        lambda: _gemini_stream(GEMINI_MODEL, system, contents),
+        (lambda: _gemini_stream(backup, system, contents)) if backup else None,
+        settings.GEMINI_TTFT_TIMEOUT,
+        [system] + [part["text"] for item in contents for part in item["parts"]],
+        _priority(history),
+        outcome,
+    )) as stream:
+        async for delta in stream:
+            yield delta
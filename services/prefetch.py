@@ -0,0 +1,118 @@
+"""Speculative retrieval prefetch.
+
+While a user is typing (or once a voice transcription completes) the
+UI calls `schedule` with the current text. After a short debounce the
+retrieval runs in the background and its result is kept per session,
+keyed by the normalized text. A newer schedule for the same session
+cancels the superseded prefetch. When the question is submitted,
+`take` hands back a matching in-flight or completed result so the
+pipeline does not start retrieval from scratch. A result that finished
+more than `max_age` seconds ago is discarded, like an expired entry of
+the retrieval cache.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from services.cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Prefetch:
+    key: str
+    task: asyncio.Task
+    created: float
+    # Set to skip the rest of the debounce once the question is submitted
+    go: asyncio.Event
+    finished: Optional[float] = None
+
+
+class ContextPrefetcher:
+    """Debounced, per-session background retrieval."""
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[Any]],
+        debounce: float,
+        ttl: float,
+        min_chars: int = 0,
+        max_age: float = float("inf"),
+    ) -> None:
+        self.fetch = fetch
+        self.debounce = debounce
+        self.ttl = ttl
+        self.min_chars = min_chars
+        self.max_age = max_age
+        self._entries: Dict[str, _Prefetch] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def schedule(self, session_id: str, text: str) -> None:
+        """Start (or restart) a prefetch for the session's current text."""
+        key = normalize_query(text or "")
+        self._prune()
+        current = self._entries.get(session_id)
+        if current is not None and current.key == key:
+            return
+        if current is not None:
+            current.task.cancel()
+            del self._entries[session_id]
+        if len(key) < self.min_chars:
+            return
+
+        go = asyncio.Event()
+        task = asyncio.create_task(self._run(text, go))
+        entry = self._entries[session_id] = _Prefetch(key, task, time.monotonic(), go)
+        task.add_done_callback(lambda _task: setattr(entry, "finished", time.monotonic()))
+
+    async def _run(self, text: str, go: asyncio.Event) -> Any:
+        try:
+            await asyncio.wait_for(go.wait(), self.debounce)
+        except asyncio.TimeoutError:
+            pass
+        return await self.fetch(text)
+
+    async def take(self, session_id: Optional[str], query: str) -> Optional[Any]:
+        """Return the prefetched result for `query`, waiting if in flight.
+
+        Returns None when there is no matching prefetch, it failed or
+        its result is older than `max_age`.
+        """
+        entry = self._entries.pop(session_id, None) if session_id else None
+        stale = entry is not None and entry.finished is not None and time.monotonic() - entry.finished > self.max_age
+        if entry is None or stale or entry.key != normalize_query(query):
+            if entry is not None:
+                entry.task.cancel()
+            self.misses += 1
+            return None
+
+        entry.go.set()
+        try:
+            result = await entry.task
+        except asyncio.CancelledError:
+            if entry.task.cancelled():
+                self.misses += 1
+                return None
+            raise
+        except Exception:
+            logger.exception("Prefetch failed")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return result
+
+    def _prune(self) -> None:
+        """Drop prefetches nobody picked up within the TTL."""
+        cutoff = time.monotonic() - self.ttl
+        for session_id, entry in list(self._entries.items()):
+            if entry.created < cutoff:
+                entry.task.cancel()
+                del self._entries[session_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "pending": len(self._entries)}
@@ -0,0 +1,239 @@
+"""Token-budgeted prompt assembly shared by all model providers.
+
+Context is rendered as compact `Source: <url>` + content blocks with
+repeated text from overlapping chunks removed. Messages are ordered
+system prompt -> conversation history -> context + query, so the
+system prompt and the (append-only) history form a stable prefix that
+provider-side prompt caching can reuse from turn to turn. When the
+per-model input budget is exceeded, the oldest turns are dropped in
+blocks of `HISTORY_DROP_BLOCK` turns (so the prefix only changes once
+per block) and summarised as a one-line list of earlier questions.
+The summary goes in its own message right after the system prompt, so
+the system prompt itself never changes.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config import settings
+from services.chunking import get_estimator
+from services.prompts import system_prompt
+
+_estimate = get_estimator("regex")
+_WHITESPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\S+")
+
+# Per-message framing overhead (role markers etc.) in tokens
+_MESSAGE_OVERHEAD = 4
+# The dropped-turns summary is bounded so it cannot grow with the session
+_SUMMARY_QUESTION_CHARS = 80
+_SUMMARY_MAX_QUESTIONS = 5
+
+
+def count_tokens(text: str) -> int:
+    return _estimate(text)
+
+
+def format_context(docs: Iterable, max_tokens: Optional[int] = None) -> str:
+    """Render retrieved objects as compact url + content blocks.
+
+    Chunks from the same page are merged, and lines already emitted by
+    an earlier (higher-ranked) chunk are skipped, which removes the
+    text duplicated by chunk overlap. Stops adding lines once
+    `max_tokens` is reached.
+    """
+    blocks: Dict[str, List[str]] = {}
+    seen = set()
+    used = 0
+    for item in docs:
+        props = item.properties if hasattr(item, "properties") else item
+        url = props.get("url") or ""
+        for line in (props.get("content") or "").splitlines():
+            key = _WHITESPACE_RE.sub(" ", line).strip().lower()
+            if not key or key in seen:
+                continue
+            tokens = count_tokens(line)
+            if max_tokens is not None and used + tokens > max_tokens:
+                return _render(blocks)
+            seen.add(key)
+            used += tokens
+            blocks.setdefault(url, []).append(line.strip())
+    return _render(blocks)
+
+
+def _render(blocks: Dict[str, List[str]]) -> str:
+    return "\n\n".join(f"Source: {url}\n" + "\n".join(lines) for url, lines in blocks.items())
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` so it fits in `max_tokens`, at a line boundary where possible.
+
+    The line that overflows is cut after its last word that fits (or
+    mid-word if not even one does), so a context that is one long line,
+    as scraped pages often are, still fills the budget.
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for line in text.splitlines():
+        tokens = count_tokens(line) + 1
+        if used + tokens > max_tokens:
+            partial = _cut_line(line, max_tokens - used - 1)
+            if partial:
+                kept.append(partial)
+            break
+        kept.append(line)
+        used += tokens
+    return "\n".join(kept)
+
+
+def _cut_line(line: str, max_tokens: int) -> str:
+    """Longest prefix of `line` within `max_tokens`, ending at a word if one fits."""
+    if max_tokens <= 0:
+        return ""
+    end = _longest_prefix(line, [match.end() for match in _WORD_RE.finditer(line)], max_tokens)
+    if end is None:
+        end = _longest_prefix(line, range(1, len(line) + 1), max_tokens) or 0
+    return line[:end]
+
+
+def _longest_prefix(text: str, ends, max_tokens: int) -> Optional[int]:
+    """Largest of the ascending `ends` whose prefix fits (binary search)."""
+    low, high, best = 0, len(ends) - 1, None
+    while low <= high:
+        middle = (low + high) // 2
+        if count_tokens(text[:ends[middle]]) <= max_tokens:
+            best, low = ends[middle], middle + 1
+        else:
+            high = middle - 1
+    return best
+
+
+def message_text(content) -> str:
+    """Plain text of a chat message (Gradio may send a list of blocks)."""
+    if isinstance(content, list):
+        return " ".join(
+            block.get("text", "") if isinstance(block, dict) else str(block) for block in content
+        )
+    return str(content)
+
+
+def _turns(history: List[Dict[str, str]]) -> List[List[Dict[str, str]]]:
+    """Group history into turns that each start with a user message."""
+    turns: List[List[Dict[str, str]]] = []
+    for msg in history:
+        if msg["role"] == "user" or not turns:
+            turns.append([])
+        # SANITIZE HISTORY: Only keep 'role' and 'content' for the API calls
+        turns[-1].append({"role": msg["role"], "content": message_text(msg["content"])})
+    return turns
+
+
+def _turn_tokens(turn: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(msg["content"]) + _MESSAGE_OVERHEAD for msg in turn)
+
+
+def window_history(
+    history: List[Dict[str, str]],
+    max_tokens: int,
+    max_turns: Optional[int] = None,
+    drop_block: int = 1,
+) -> Tuple[List[Dict[str, str]], List[List[Dict[str, str]]]]:
+    """Keep the most recent turns that fit in `max_tokens`.
+
+    Returns (kept messages, dropped turns). The cut point is rounded to
+    a multiple of `drop_block` turns so the kept prefix stays stable
+    across consecutive requests.
+    """
+    turns = _turns(history)
+    keep_from = len(turns)
+    used = 0
+    for index in range(len(turns) - 1, -1, -1):
+        tokens = _turn_tokens(turns[index])
+        if used + tokens > max_tokens or (max_turns is not None and len(turns) - index > max_turns):
+            break
+        used += tokens
+        keep_from = index
+
+    if keep_from and drop_block > 1:
+        keep_from = min(len(turns), -(-keep_from // drop_block) * drop_block)
+
+    kept = [msg for turn in turns[keep_from:] for msg in turn]
+    return kept, turns[:keep_from]
+
+
+def _summarise(dropped: List[List[Dict[str, str]]]) -> Optional[str]:
+    questions = [
+        turn[0]["content"][:_SUMMARY_QUESTION_CHARS]
+        for turn in dropped if turn and turn[0]["role"] == "user"
+    ]
+    if not questions:
+        return None
+    return "Earlier in this conversation the user asked: " + "; ".join(questions[-_SUMMARY_MAX_QUESTIONS:])
+
+
+def build_prompt(
+    query: str,
+    context: str,
+    history: List[Dict[str, str]],
+    budget: int,
+) -> Tuple[str, List[Dict[str, str]], str]:
+    """Fit system prompt, history, context and query into `budget` tokens.
+
+    Returns (system text, windowed history messages, final user message).
+    The history starts with a system message summarising the dropped
+    turns, if any.
+    """
+    fixed = count_tokens(system_prompt) + count_tokens(query) + 3 * _MESSAGE_OVERHEAD
+    context = truncate_to_tokens(context, max(budget - fixed, 0))
+    user_message = f"CONTEXT:\n{context}\n\nQuery: {query}"
+
+    remaining = max(budget - fixed - count_tokens(context), 0)
+    kept, dropped = window_history(
+        history, remaining, settings.HISTORY_MAX_TURNS or None, settings.HISTORY_DROP_BLOCK
+    )
+
+    summary = _summarise(dropped)
+    if summary:
+        kept = [{"role": "system", "content": summary}, *kept]
+    return system_prompt, kept, user_message
+
+
+def build_messages(
+    query: str,
+    context: str,
+    history: List[Dict[str, str]],
+    budget: int,
+) -> List[Dict[str, str]]:
+    """OpenAI-style chat messages within the input token budget."""
+    system, kept, user_message = build_prompt(query, context, history, budget)
+    return [{"role": "system", "content": system}, *kept, {"role": "user", "content": user_message}]
+
+
+def build_gemini_request(
+    query: str,
+    context: str,
+    history: List[Dict[str, str]],
+    budget: int,
+) -> Tuple[str, List[Dict]]:
+    """Gemini system instruction and `contents` within the budget.
+
+    Gemini has no system turns and expects user and model turns to
+    alternate, so the dropped-turns summary is sent as the first part
+    of the first user turn.
+    """
+    system, kept, user_message = build_prompt(query, context, history, budget)
+    summary = None
+    if kept and kept[0]["role"] == "system":
+        summary, kept = kept[0]["content"], kept[1:]
+    contents = [
+        {"role": "model" if msg["role"] == "assistant" else "user", "parts": [{"text": msg["content"]}]}
+        for msg in kept
+    ]
+    contents.append({"role": "user", "parts": [{"text": user_message}]})
+    if summary:
+        if contents[0]["role"] == "user":
+            contents[0]["parts"].insert(0, {"text": summary})
+        else:
+            contents.insert(0, {"role": "user", "parts": [{"text": summary}]})
+    return system, contents
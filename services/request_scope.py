@@ -0,0 +1,71 @@
+"""Per-request cancellation scopes.
+
+Every chat request opens a `RequestScope` for its session. The scope is
+how the rest of the app reaches a running request: the Stop button
+cancels the whole scope, a per-column stop ends only that model's
+stream, and submitting a new question cancels the session's previous
+scope so an abandoned request stops consuming provider capacity.
+
+The scope only signals; `rag_stream` reacts by cancelling its pending
+`__anext__` tasks and closing the provider generators, which in turn
+close their HTTP streams.
+"""
+
+import asyncio
+from typing import Dict, Optional, Set
+
+LABELS = ("a", "b", "c")
+
+
+class RequestScope:
+    """Cancellation state of one in-flight chat request."""
+
+    def __init__(self) -> None:
+        self.cancelled = False
+        self.stopped: Set[str] = set()
+        self._changed = asyncio.Event()
+
+    def cancel(self) -> None:
+        """Stop every column of the request."""
+        self.cancelled = True
+        self._changed.set()
+
+    def stop(self, label: str) -> None:
+        """Stop one column ('a', 'b' or 'c'); the others keep streaming."""
+        self.stopped.add(label)
+        if self.stopped.issuperset(LABELS):
+            self.cancelled = True
+        self._changed.set()
+
+    async def wait(self) -> None:
+        """Block until the scope is cancelled or a column is stopped."""
+        await self._changed.wait()
+        self._changed.clear()
+
+
+class ScopeRegistry:
+    """The current request scope of each session."""
+
+    def __init__(self) -> None:
+        self._scopes: Dict[str, RequestScope] = {}
+
+    def open(self, session_id: Optional[str]) -> RequestScope:
+        """New scope for `session_id`, cancelling the session's previous request."""
+        scope = RequestScope()
+        if session_id:
+            previous = self._scopes.get(session_id)
+            if previous is not None:
+                previous.cancel()
+            self._scopes[session_id] = scope
+        return scope
+
+    def close(self, session_id: Optional[str], scope: RequestScope) -> None:
+        # A newer request may already have replaced this one
+        if session_id and self._scopes.get(session_id) is scope:
+            del self._scopes[session_id]
+
+    def get(self, session_id: Optional[str]) -> Optional[RequestScope]:
+        return self._scopes.get(session_id) if session_id else None
+
+    def __len__(self) -> int:
+        return len(self._scopes)
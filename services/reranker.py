@@ -0,0 +1,112 @@
+"""Second retrieval stage: passage reranking within a token budget.
+
+In `two_stage` retrieval mode the hybrid search returns a larger pool
+of candidate chunks (`CANDIDATE_LIMIT`). Each chunk is split into
+passages of about `PASSAGE_TOKENS` tokens with the offline chunker,
+the passages are scored by a cheap local lexical scorer (BM25 over the
+candidate passages, blended with the rank of the chunk they came from)
+and the best ones are packed into `CONTEXT_TOKEN_BUDGET` tokens. The
+selected passages keep their original reading order, so the context
+stays coherent while being much smaller than three whole chunks.
+
+Scoring runs in a thread pool so it never blocks the event loop.
+"""
+
+import asyncio
+import math
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, List, Tuple
+
+from services.chunking import chunk_text, get_estimator
+from services.local_search import tokenize
+from services.prompt_builder import format_context
+
+# Weight of the first-stage (hybrid search) rank in the final score
+RANK_WEIGHT = 0.3
+
+_estimate = get_estimator("regex")
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="rerank")
+
+
+@dataclass
+class Passage:
+    url: str
+    content: str
+    tokens: int
+    doc_rank: int
+    start: int
+    score: float = 0.0
+
+
+@lru_cache(maxsize=4096)
+def _split(content: str, passage_tokens: int) -> Tuple[Tuple[str, int, int], ...]:
+    """(text, tokens, offset) of each passage; cached per chunk text."""
+    chunks = chunk_text(content, passage_tokens, overlap_tokens=0, estimate=_estimate)
+    return tuple((chunk.content, chunk.tokens, chunk.start) for chunk in chunks)
+
+
+def split_passages(docs: Iterable[Dict], passage_tokens: int) -> List[Passage]:
+    """Split ranked candidate chunks into passages."""
+    passages = []
+    for rank, props in enumerate(docs):
+        for content, tokens, start in _split(props.get("content") or "", passage_tokens):
+            passages.append(Passage(props.get("url") or "", content, tokens, rank, start))
+    return passages
+
+
+def bm25(query: str, passages: List[Passage], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    """BM25 of `query` against each passage, with the passages as the corpus."""
+    query_terms = set(tokenize(query))
+    if not query_terms or not passages:
+        return [0.0] * len(passages)
+    counts = [Counter(tokenize(passage.content)) for passage in passages]
+    lengths = [sum(count.values()) for count in counts]
+    avg_length = (sum(lengths) / len(lengths)) or 1.0
+    n = len(passages)
+    idf = {}
+    for term in query_terms:
+        df = sum(1 for count in counts if term in count)
+        idf[term] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    scores = []
+    for count, length in zip(counts, lengths):
+        score = 0.0
+        for term in query_terms:
+            tf = count.get(term, 0)
+            if tf:
+                score += idf[term] * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length))
+        scores.append(score)
+    return scores
+
+
+def select_passages(query: str, docs: List[Dict], budget: int, passage_tokens: int) -> List[Passage]:
+    """Best-scoring passages that fit in `budget` tokens, in reading order."""
+    passages = split_passages(docs, passage_tokens)
+    lexical = bm25(query, passages)
+    top = max(lexical, default=0.0) or 1.0
+    for passage, score in zip(passages, lexical):
+        passage.score = (1 - RANK_WEIGHT) * score / top + RANK_WEIGHT / (1 + passage.doc_rank)
+
+    selected, used = [], 0
+    for passage in sorted(passages, key=lambda p: p.score, reverse=True):
+        if used + passage.tokens > budget:
+            continue
+        selected.append(passage)
+        used += passage.tokens
+    return sorted(selected, key=lambda p: (p.doc_rank, p.start))
+
+
+def build_context(query: str, docs: List[Dict], budget: int, passage_tokens: int) -> str:
+    """Rerank candidates and render the selected passages as context."""
+    passages = select_passages(query, docs, budget, passage_tokens)
+    return format_context(({"url": p.url, "content": p.content} for p in passages), max_tokens=budget)
+
+
+async def rerank_context(query: str, docs: Iterable, budget: int, passage_tokens: int) -> str:
+    """`build_context` on the rerank thread pool."""
+    records = [dict(item.properties if hasattr(item, "properties") else item) for item in docs]
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, build_context, query, records, budget, passage_tokens)
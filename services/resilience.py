@@ -0,0 +1,247 @@
+"""Resilience helpers for streaming model providers.
+
+Wraps a provider stream with:
+
+- a time-to-first-token deadline, so a stalled endpoint fails fast
+  instead of waiting for the SDK's own timeout;
+- optional hedging: if the first token is late, a backup model is
+  started and whichever stream produces a token first wins, the other
+  is cancelled and closed;
+- a per-provider circuit breaker that skips a provider after repeated
+  failures and lets a single probe through once the reset timeout has
+  elapsed.
+
+Streams are passed as zero-argument factories returning async
+generators of text deltas that raise on failure.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from typing import AsyncGenerator, Callable, Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+StreamFactory = Callable[[], AsyncGenerator[str, None]]
+
+
+class CircuitOpenError(Exception):
+    """Raised when a provider is skipped because its circuit is open."""
+
+
+class FirstTokenTimeout(asyncio.TimeoutError):
+    """Raised when no stream produced a token before the deadline."""
+
+
+class StreamOutcome:
+    """Which stream served a request, filled in once a racer wins."""
+
+    def __init__(self) -> None:
+        # "primary" or "backup"; None until a stream produced a token or finished
+        self.served_by: Optional[str] = None
+
+    @property
+    def backup_served(self) -> bool:
+        return self.served_by == "backup"
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures;
+    half-open (one probe) after `reset_timeout` seconds."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Whether a request may be sent to the provider now."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def release(self) -> None:
+        """Give back a half-open probe that ended without a verdict."""
+        self._probing = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """Process-wide circuit breaker for a provider."""
+    if name not in _breakers:
+        _breakers[name] = CircuitBreaker(
+            name,
+            failure_threshold=settings.CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=settings.CIRCUIT_RESET_TIMEOUT,
+        )
+    return _breakers[name]
+
+
+async def _discard(task: asyncio.Task, stream: AsyncGenerator) -> None:
+    """Cancel a pending `__anext__` task and close its generator."""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    try:
+        await stream.aclose()
+    except Exception:
+        logger.debug("Error closing abandoned stream", exc_info=True)
+
+
+async def hedged_stream(
+    primary: StreamFactory,
+    backup: Optional[StreamFactory] = None,
+    first_token_timeout: float = 0,
+    hedge_delay: float = 0,
+    outcome: Optional[StreamOutcome] = None,
+) -> AsyncGenerator[str, None]:
+    """Yield deltas from whichever of `primary`/`backup` starts first.
+
+    The backup is started once `hedge_delay` passes without a first
+    token, or immediately if the primary fails before its first token.
+    Raises `FirstTokenTimeout` when no token arrives within
+    `first_token_timeout` seconds (0 disables the deadline). The
+    winner is recorded in `outcome`.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + first_token_timeout if first_token_timeout > 0 else None
+    hedge_at = loop.time() + hedge_delay
+
+    racers: Dict[asyncio.Task, Tuple[AsyncGenerator, str]] = {}
+    winner: Optional[AsyncGenerator] = None
+    first: Optional[str] = None
+    last_error: Optional[BaseException] = None
+    pending_backup = backup
+
+    def start(factory: StreamFactory, role: str) -> None:
+        stream = factory()
+        racers[asyncio.create_task(stream.__anext__())] = (stream, role)
+
+    start(primary, "primary")
+    try:
+        while winner is None:
+            if pending_backup is not None and (not racers or loop.time() >= hedge_at):
+                start(pending_backup, "backup")
+                pending_backup = None
+            if not racers:
+                raise last_error
+
+            wake = [t for t in (deadline, hedge_at if pending_backup else None) if t is not None]
+            timeout = max(min(wake) - loop.time(), 0) if wake else None
+            done, _ = await asyncio.wait(racers, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                stream, role = racers.pop(task)
+                error = task.exception()
+                if error is None:
+                    winner, first = stream, task.result()
+                elif isinstance(error, StopAsyncIteration):
+                    # Finished without output; nothing better will come from waiting
+                    winner = stream
+                if winner is not None:
+                    if outcome is not None:
+                        outcome.served_by = role
+                    break
+                last_error = error
+                logger.warning(f"Stream failed before its first token: {error!r}")
+
+            if winner is None and deadline is not None and loop.time() >= deadline:
+                raise FirstTokenTimeout(f"No first token within {first_token_timeout}s")
+    finally:
+        for task, (stream, _role) in list(racers.items()):
+            await _discard(task, stream)
+
+    try:
+        if first is None:
+            return
+        yield first
+        async for delta in winner:
+            yield delta
+    finally:
+        await winner.aclose()
+
+
+async def resilient_stream(
+    name: str,
+    primary: StreamFactory,
+    backup: Optional[StreamFactory] = None,
+    first_token_timeout: float = 0,
+    hedge_delay: float = 0,
+    outcome: Optional[StreamOutcome] = None,
+) -> AsyncGenerator[str, None]:
+    """`hedged_stream` guarded by the provider's circuit breaker.
+
+    While the circuit is open the primary is skipped: the backup serves
+    the request if configured, otherwise `CircuitOpenError` is raised.
+    The breaker only tracks the primary: a request the backup won
+    (because the primary failed or missed the hedge) counts as a
+    primary failure, and a primary that produced its first token counts
+    as a success even if the consumer stops reading early. `outcome`
+    records which model served the request.
+    """
+    breaker = get_breaker(name)
+    outcome = outcome if outcome is not None else StreamOutcome()
+    if not breaker.allow():
+        if backup is None:
+            raise CircuitOpenError(f"{name} circuit is open")
+        # Backup-only requests say nothing about the primary's health
+        outcome.served_by = "backup"
+        async with aclosing(hedged_stream(backup, None, first_token_timeout)) as stream:
+            async for delta in stream:
+                yield delta
+        return
+
+    try:
+        async with aclosing(hedged_stream(primary, backup, first_token_timeout, hedge_delay, outcome)) as stream:
+            async for delta in stream:
+                yield delta
+    except (asyncio.CancelledError, GeneratorExit):
+        # Once a racer has won, the primary's verdict is already known
+        if outcome.backup_served:
+            breaker.record_failure()
+        elif outcome.served_by == "primary":
+            breaker.record_success()
+        else:
+            breaker.release()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    if outcome.backup_served:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
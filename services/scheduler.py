@@ -0,0 +1,295 @@
+"""Admission control for model providers.
+
+Every question fans out to three provider streams, so a burst of
+users quickly exceeds free-tier rate limits and then every column
+fails at once. Each provider gets a `ProviderScheduler` that admits a
+stream only when
+
+- fewer than `max_concurrency` streams are running,
+- the requests-per-minute token bucket has a request available, and
+- the tokens-per-minute bucket covers the prompt estimate.
+
+Streams that cannot start wait in a bounded priority queue (lower
+number first, FIFO within a priority). A stream that finds the queue
+full, or whose estimated wait exceeds `max_wait` seconds, is rejected
+with `SchedulerBusy` straight away so the column can show a "busy"
+message instead of hitting the provider's rate limit. The estimate
+counts the requests and tokens already queued ahead of it and, once
+streams have finished, how long a stream usually holds its slot.
+Output tokens are charged to the token bucket when the stream's permit
+is released.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = metrics.Gauge(
+    "sunmarke_scheduler_queue_depth", "Provider streams waiting for admission", ["provider"]
+)
+WAIT_SECONDS = metrics.Histogram(
+    "sunmarke_scheduler_wait_seconds", "Time provider streams waited for admission", ["provider"]
+)
+ACTIVE = metrics.Gauge(
+    "sunmarke_scheduler_active", "Provider streams holding an admission slot", ["provider"]
+)
+REJECTED = metrics.Counter(
+    "sunmarke_scheduler_rejected_total", "Provider streams rejected as busy", ["provider", "reason"]
+)
+
+
+# Weight of the latest stream in the moving average of slot hold times
+HOLD_SMOOTHING = 0.2
+
+
+class SchedulerBusy(Exception):
+    """Raised when a stream cannot be admitted before its deadline."""
+
+    def __init__(self, provider: str, reason: str) -> None:
+        super().__init__(f"{provider} is busy ({reason})")
+        self.provider = provider
+        self.reason = reason
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to one minute's worth."""
+
+    def __init__(self, per_minute: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = float(per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self._refill()
+        # A single request larger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def backlog_delay(self, amount: float) -> float:
+        """Seconds until `amount` units (e.g. a queue's total demand) have accrued."""
+        self._refill()
+        return max(amount - self.level, 0.0) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """Take `amount` units; the level may go negative (debt)."""
+        self._refill()
+        self.level -= amount
+
+
+@dataclass(order=True)
+class _Waiter:
+    priority: int
+    seq: int
+    tokens: int = field(compare=False)
+    enqueued: float = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class Permit:
+    """Admission of one stream; `release` it when the stream ends."""
+
+    def __init__(self, scheduler: "ProviderScheduler") -> None:
+        self.scheduler = scheduler
+        self.released = False
+        self.started = time.monotonic()
+
+    def release(self, output_tokens: int = 0) -> None:
+        if not self.released:
+            self.released = True
+            self.scheduler._release(output_tokens, time.monotonic() - self.started)
+
+
+class ProviderScheduler:
+    """Concurrency, rate limits and a bounded priority queue for one provider."""
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_queue: int = 50,
+        max_wait: float = 10,
+    ) -> None:
+        self.name = name
+        self.max_concurrency = max_concurrency if max_concurrency > 0 else float("inf")
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Moving average of seconds a stream holds its slot (None until one finishes)
+        self.hold_seconds: Optional[float] = None
+
+    @property
+    def counts_tokens(self) -> bool:
+        """Whether callers need to report prompt/output token counts."""
+        return self.tokens is not None
+
+    def _delay(self, tokens: int) -> float:
+        """Seconds until the rate limits would admit a stream of `tokens`."""
+        delays = [0.0]
+        if self.requests is not None:
+            delays.append(self.requests.delay(1))
+        if self.tokens is not None:
+            delays.append(self.tokens.delay(tokens))
+        return max(delays)
+
+    def _estimated_wait(self, tokens: int, priority: int) -> Tuple[float, str]:
+        """Rough wait for a new stream behind everything queued ahead of it,
+        and which limit causes most of it."""
+        ahead = [waiter for waiter in self._waiters if waiter.priority <= priority]
+        waits = {"rate_limited": 0.0, "concurrency": 0.0}
+        if self.requests is not None:
+            waits["rate_limited"] = self.requests.backlog_delay(len(ahead) + 1)
+        if self.tokens is not None:
+            demand = sum(waiter.tokens for waiter in ahead) + min(tokens, self.tokens.capacity)
+            waits["rate_limited"] = max(waits["rate_limited"], self.tokens.backlog_delay(demand))
+        if self.hold_seconds is not None and self.max_concurrency != float("inf"):
+            # Slots free up at max_concurrency / hold_seconds per second
+            blocked = self.active + len(ahead) - self.max_concurrency + 1
+            if blocked > 0:
+                waits["concurrency"] = blocked * self.hold_seconds / self.max_concurrency
+        reason = max(waits, key=waits.get)
+        return waits[reason], reason
+
+    def _admit(self, tokens: int, waited: float) -> Permit:
+        self.active += 1
+        self.admitted += 1
+        if self.requests is not None:
+            self.requests.consume(1)
+        if self.tokens is not None:
+            self.tokens.consume(tokens)
+        WAIT_SECONDS.observe(waited, self.name)
+        return Permit(self)
+
+    def _reject(self, reason: str) -> SchedulerBusy:
+        self.rejected += 1
+        REJECTED.inc(self.name, reason)
+        logger.warning(f"{self.name} admission rejected: {reason}")
+        return SchedulerBusy(self.name, reason)
+
+    async def acquire(self, tokens: int = 0, priority: int = 1) -> Permit:
+        """Wait for admission; raises `SchedulerBusy` instead of waiting too long."""
+        if not self._waiters and self.active < self.max_concurrency and self._delay(tokens) == 0:
+            return self._admit(tokens, 0.0)
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full")
+        wait, reason = self._estimated_wait(tokens, priority)
+        if wait > self.max_wait:
+            raise self._reject(reason)
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(priority, next(self._seq), tokens, loop.time(), loop.create_future())
+        heapq.heappush(self._waiters, waiter)
+        QUEUE_DEPTH.set(len(self._waiters), self.name)
+        self._dispatch()
+        try:
+            done, _ = await asyncio.wait({waiter.future}, timeout=self.max_wait)
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        if not done:
+            self._abandon(waiter)
+            raise self._reject("timeout")
+        return waiter.future.result()
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        """Drop a waiter that gave up; hand back a permit granted meanwhile."""
+        if waiter.future.done():
+            waiter.future.result().release()
+            return
+        waiter.future.cancel()
+        self._waiters.remove(waiter)
+        heapq.heapify(self._waiters)
+        QUEUE_DEPTH.set(len(self._waiters), self.name)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit queued streams in priority order while limits allow."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        loop = asyncio.get_running_loop()
+        while self._waiters and self.active < self.max_concurrency:
+            head = self._waiters[0]
+            delay = self._delay(head.tokens)
+            if delay > 0:
+                self._timer = loop.call_later(delay, self._dispatch)
+                break
+            heapq.heappop(self._waiters)
+            head.future.set_result(self._admit(head.tokens, loop.time() - head.enqueued))
+        QUEUE_DEPTH.set(len(self._waiters), self.name)
+
+    def _release(self, output_tokens: int, held: float) -> None:
+        self.active -= 1
+        self.hold_seconds = held if self.hold_seconds is None else (
+            HOLD_SMOOTHING * held + (1 - HOLD_SMOOTHING) * self.hold_seconds
+        )
+        if self.tokens is not None and output_tokens:
+            self.tokens.consume(output_tokens)
+        if self._waiters:
+            self._dispatch()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+_schedulers: Dict[str, ProviderScheduler] = {}
+
+
+def get_scheduler(name: str) -> Optional[ProviderScheduler]:
+    """Process-wide scheduler for a provider, or None when disabled.
+
+    Limits come from `<NAME>_MAX_CONCURRENCY`, `<NAME>_RPM` and
+    `<NAME>_TPM` settings (e.g. `KIMI_RPM`).
+    """
+    if not settings.SCHEDULER_ENABLED:
+        return None
+    if name not in _schedulers:
+        prefix = name.upper()
+        _schedulers[name] = ProviderScheduler(
+            name,
+            max_concurrency=getattr(settings, f"{prefix}_MAX_CONCURRENCY", 0),
+            requests_per_minute=getattr(settings, f"{prefix}_RPM", 0),
+            tokens_per_minute=getattr(settings, f"{prefix}_TPM", 0),
+            max_queue=settings.SCHEDULER_MAX_QUEUE,
+            max_wait=settings.SCHEDULER_MAX_WAIT,
+        )
+    return _schedulers[name]
+
+
+def scheduler_stats() -> Dict[str, Dict[str, int]]:
+    return {name: scheduler.stats() for name, scheduler in _schedulers.items()}
+
+
+@metrics.collector
+def _collect() -> None:
+    for name, stats in scheduler_stats().items():
+        ACTIVE.set(stats["active"], name)
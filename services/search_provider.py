@@ -1,28 +1,50 @@
 """Search provider helpers using Weaviate.
 
 Provides an async singleton client and a hybrid search wrapper used
-by the RAG pipeline. Errors are handled gracefully and an empty
-result list is returned on failure so callers can continue.
+by the RAG pipeline. `settings.SEARCH_BACKEND` selects between
+Weaviate Cloud and the in-process index in `local_search`; with
+`SEARCH_LOCAL_FALLBACK` enabled a Weaviate failure is served from the
+local index. Errors are handled gracefully and an empty result list
+is returned on failure so callers can continue.
+
+The Weaviate SDK is imported on first use; the background warm-up
+connects the client (and loads the local index) before the first query.
 """
 
+import asyncio
 import logging
-from typing import List, Optional
-import weaviate
-from weaviate.classes.query import HybridFusion
+from typing import TYPE_CHECKING, List, Optional
 from config import settings
+from services import startup
+from services.local_search import get_index, local_hybrid_search
+
+if TYPE_CHECKING:
+    import weaviate
 
 logger = logging.getLogger(__name__)
 
 # Persistent client placeholder
-_async_client: Optional[weaviate.WeaviateAsyncClient] = None
+_async_client: Optional["weaviate.WeaviateAsyncClient"] = None
+# Concurrent first requests wait for one client instead of each connecting their own
+_client_lock = asyncio.Lock()
+
+
+def _connected() -> bool:
+    # Removed 'await' from is_connected()
+    return _async_client is not None and _async_client.is_connected()
 
 
-async def get_client() -> weaviate.WeaviateAsyncClient:
+async def get_client() -> "weaviate.WeaviateAsyncClient":
     """Singleton-style helper to get or initialize the async Weaviate client."""
     global _async_client
-    # Removed 'await' from is_connected()
-    if _async_client is None or not _async_client.is_connected():
+    if _connected():
+        return _async_client
+    async with _client_lock:
+        if _connected():
+            return _async_client
         try:
+            # The SDK import takes about a second: keep it off the loop
+            weaviate = await asyncio.to_thread(startup.lazy_import, "weaviate")
             _async_client = weaviate.use_async_with_weaviate_cloud(
                 cluster_url=settings.SUNMARKE_WEAVIATE_URL,
                 auth_credentials=weaviate.auth.AuthApiKey(settings.SUNMARKE_WEAVIATE_API_KEY),
@@ -45,11 +67,15 @@ async def hybrid_search(
 
     Returns a list of objects or an empty list on failure.
     """
+    if settings.SEARCH_BACKEND == "local":
+        return await _local_search(query_text, query_vector, alpha, limit)
+
     client = await get_client()
     if client is None:
-        return []
+        return await _fallback(query_text, query_vector, alpha, limit)
 
     try:
+        HybridFusion = (await asyncio.to_thread(startup.lazy_import, "weaviate.classes.query")).HybridFusion
         collection = client.collections.get(settings.SUNMARKE_COLLECTION)
 
         # v4 Async query syntax
@@ -63,7 +89,20 @@ async def hybrid_search(
         return response.objects
     except Exception:
         logger.exception("Hybrid search execution error")
+        return await _fallback(query_text, query_vector, alpha, limit)
+
+
+async def _local_search(query_text: str, query_vector: List[float], alpha: float, limit: int) -> List:
+    # Vector scoring (and a first load of the corpus) is CPU-bound: keep it off the loop
+    return await asyncio.to_thread(local_hybrid_search, query_text, query_vector, alpha=alpha, limit=limit)
+
+
+async def _fallback(query_text: str, query_vector: List[float], alpha: float, limit: int) -> List:
+    """Serve from the local index when Weaviate is unavailable, if enabled."""
+    if not settings.SEARCH_LOCAL_FALLBACK:
         return []
+    logger.warning("Weaviate unavailable; falling back to local search index.")
+    return await _local_search(query_text, query_vector, alpha, limit)
 
 
 async def close_search_client():
@@ -72,3 +111,18 @@ async def close_search_client():
     if _async_client:
         await _async_client.close()
         _async_client = None
+
+
+async def warm_weaviate() -> None:
+    """Import the SDK off the event loop and connect the shared client."""
+    await asyncio.to_thread(startup.lazy_import, "weaviate")
+    with startup.timed("connect weaviate"):
+        if await get_client() is None:
+            raise ConnectionError("Weaviate connection failed")
+
+
+async def warm_local_index() -> None:
+    """Load the local corpus and build its BM25 index in a thread."""
+    with startup.timed("load local index"):
+        if await asyncio.to_thread(get_index) is None:
+            raise FileNotFoundError(settings.LOCAL_CORPUS_PATH)
@@ -0,0 +1,264 @@
+"""Server-side chat sessions.
+
+The three chat histories of a session are kept here, keyed by the
+Gradio session hash, instead of travelling between browser and server
+with every request: the UI only sends the new question, and while an
+answer streams Gradio only sends the changes to the chat.
+
+A turn is stored once in compact form, as the question plus the three
+answers, rather than as three message lists that each repeat the
+question. Memory is bounded in three ways:
+
+- each session keeps only its most recent turns that fit in
+  `SESSION_MAX_BYTES`
+- sessions idle for longer than `SESSION_IDLE_TTL` seconds are evicted
+- once all sessions together exceed `SESSION_STORE_MAX_BYTES`, the
+  least recently used sessions are evicted
+
+Backends are pluggable through `BACKENDS`. `memory` keeps sessions in
+process. `sqlite` keeps them in a local file (`SESSION_STORE_PATH`) so
+they survive a restart and are shared by every worker; it is the
+default when `WORKERS` is above 1. Its queries run on the store's own
+thread: loading a session is awaited and recording a turn is queued
+behind it, so neither blocks the event loop.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services import metrics
+from services.cache import SQLiteBacked, shared_state_path
+
+logger = logging.getLogger(__name__)
+
+# [question, answer_a, answer_b, answer_c]
+Turn = List[str]
+
+SESSIONS = metrics.Gauge("sunmarke_sessions", "Chat sessions held by the session store")
+SESSION_BYTES = metrics.Gauge("sunmarke_session_store_bytes", "Bytes of chat turns held by the session store")
+
+# Seconds between idle/global-cap sweeps
+SWEEP_INTERVAL = 5.0
+
+
+def turn_size(turn: Turn) -> int:
+    return sum(len(text.encode("utf-8")) for text in turn)
+
+
+def to_messages(turns: List[Turn], column: int) -> List[Dict[str, str]]:
+    """Chat history of one model column (1-3) in messages format."""
+    messages = []
+    for turn in turns:
+        messages.append({"role": "user", "content": turn[0]})
+        messages.append({"role": "assistant", "content": turn[column]})
+    return messages
+
+
+# --- Backends ---
+class MemoryBackend:
+    """Sessions in an in-process LRU ordered by last use."""
+
+    def __init__(self) -> None:
+        self._sessions: "OrderedDict[str, Tuple[List[Turn], int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        return fn(*args)
+
+    def defer(self, fn: Callable[..., Any], *args) -> None:
+        fn(*args)
+
+    def load(self, session_id: str, now: float) -> Optional[List[Turn]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            self._sessions[session_id] = (entry[0], entry[1], now)
+            self._sessions.move_to_end(session_id)
+            return list(entry[0])
+
+    def save(self, session_id: str, turns: List[Turn], size: int, now: float) -> None:
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._sessions[session_id] = (turns, size, now)
+            self.bytes += size
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+
+    def evict(self, idle_before: float, max_bytes: int) -> int:
+        """Drop idle sessions, then the least recently used beyond `max_bytes`."""
+        evicted = 0
+        with self._lock:
+            # Oldest first, so both conditions only ever look at the front
+            while self._sessions:
+                session_id, (_turns, size, last_seen) = next(iter(self._sessions.items()))
+                if last_seen >= idle_before and self.bytes <= max_bytes:
+                    break
+                del self._sessions[session_id]
+                self.bytes -= size
+                evicted += 1
+        return evicted
+
+    def stats(self) -> Tuple[int, int]:
+        with self._lock:
+            return len(self._sessions), self.bytes
+
+
+class SQLiteBackend(SQLiteBacked):
+    """Sessions in a local SQLite file."""
+
+    def __init__(self, path: str) -> None:
+        super().__init__(path, "session-store")
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions "
+                "(id TEXT PRIMARY KEY, turns TEXT, size INTEGER, last_seen REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+
+    def load(self, session_id: str, now: float) -> Optional[List[Turn]]:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT turns FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE sessions SET last_seen = ? WHERE id = ?", (now, session_id))
+        return json.loads(row[0])
+
+    def save(self, session_id: str, turns: List[Turn], size: int, now: float) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, turns, size, last_seen) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(turns), size, now),
+            )
+
+    def delete(self, session_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def evict(self, idle_before: float, max_bytes: int) -> int:
+        with self._lock, self._conn:
+            evicted = self._conn.execute("DELETE FROM sessions WHERE last_seen < ?", (idle_before,)).rowcount
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+            if total > max_bytes:
+                victims = []
+                for session_id, size in self._conn.execute("SELECT id, size FROM sessions ORDER BY last_seen"):
+                    if total <= max_bytes:
+                        break
+                    victims.append((session_id,))
+                    total -= size
+                self._conn.executemany("DELETE FROM sessions WHERE id = ?", victims)
+                evicted += len(victims)
+        return evicted
+
+    def stats(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions").fetchone()
+
+
+SessionBackend = MemoryBackend | SQLiteBackend
+
+BACKENDS: Dict[str, Callable[[], SessionBackend]] = {
+    "memory": MemoryBackend,
+    "sqlite": lambda: SQLiteBackend(settings.SESSION_STORE_PATH or shared_state_path("sessions.sqlite3")),
+}
+
+
+# --- Store ---
+class SessionStore:
+    """Per-session chat turns with size caps and idle eviction."""
+
+    def __init__(self, backend: SessionBackend, max_session_bytes: int, max_total_bytes: int, idle_ttl: float) -> None:
+        self.backend = backend
+        self.max_session_bytes = max_session_bytes
+        self.max_total_bytes = max_total_bytes
+        self.idle_ttl = idle_ttl
+        self._next_sweep = 0.0
+
+    async def turns(self, session_id: str) -> List[Turn]:
+        return await self.backend.run(self._load, session_id)
+
+    async def histories(self, session_id: str) -> Tuple[List[Dict[str, str]], List[Dict[str, str]], List[Dict[str, str]]]:
+        """The session's three chat histories in messages format."""
+        turns = await self.turns(session_id)
+        return to_messages(turns, 1), to_messages(turns, 2), to_messages(turns, 3)
+
+    def record(self, session_id: str, query: str, answers: List[str]) -> None:
+        """Append a completed (or stopped) turn to the session.
+
+        Queued without waiting, so it also completes when called from
+        a cancelled request; later loads of the session see it.
+        """
+        self.backend.defer(self._record, session_id, query, answers)
+
+    def _load(self, session_id: str) -> List[Turn]:
+        return self.backend.load(session_id, time.time()) or []
+
+    def _record(self, session_id: str, query: str, answers: List[str]) -> None:
+        turns = self._load(session_id)
+        turns.append([query, *answers])
+        sizes = [turn_size(turn) for turn in turns]
+        size = sum(sizes)
+        # The newest turn is always kept, even when it alone exceeds the cap
+        dropped = 0
+        while size > self.max_session_bytes and dropped < len(turns) - 1:
+            size -= sizes[dropped]
+            dropped += 1
+        now = time.time()
+        self.backend.save(session_id, turns[dropped:], size, now)
+        if now >= self._next_sweep:
+            self.sweep(now)
+
+    def clear(self, session_id: str) -> None:
+        self.backend.defer(self.backend.delete, session_id)
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """Evict idle sessions and enforce the global cap."""
+        now = time.time() if now is None else now
+        self._next_sweep = now + SWEEP_INTERVAL
+        try:
+            evicted = self.backend.evict(now - self.idle_ttl, self.max_total_bytes)
+            sessions, size = self.backend.stats()
+        except Exception:
+            logger.exception("Session store sweep failed")
+            return 0
+        SESSIONS.set(sessions)
+        SESSION_BYTES.set(size)
+        return evicted
+
+    def stats(self) -> Dict[str, int]:
+        sessions, size = self.backend.stats()
+        return {"sessions": sessions, "bytes": size}
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Shared store with the backend selected by `settings.SESSION_STORE_BACKEND`
+    (`sqlite` with several workers, `memory` otherwise, when unset)."""
+    global _store
+    if _store is None:
+        name = settings.SESSION_STORE_BACKEND or ("sqlite" if settings.WORKERS > 1 else "memory")
+        try:
+            backend = BACKENDS[name]()
+        except KeyError:
+            raise ValueError(f"Unknown session store backend {name!r}; expected one of {sorted(BACKENDS)}")
+        _store = SessionStore(
+            backend,
+            settings.SESSION_MAX_BYTES,
+            settings.SESSION_STORE_MAX_BYTES,
+            settings.SESSION_IDLE_TTL,
+        )
+    return _store
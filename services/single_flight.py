@@ -0,0 +1,193 @@
+"""Single-flight deduplication of identical in-flight work.
+
+When many users ask the same question at once (e.g. right after a
+school announcement) only one retrieval and one stream per provider
+should run upstream:
+
+- `SingleFlight` shares one in-flight coroutine per key; every caller
+  awaits the same result.
+- `StreamFanout` shares one in-flight provider stream per key. The
+  stream is pumped by a background task into a buffer; a subscriber
+  that joins late first receives everything generated so far (as a
+  single delta) and then the live tail.
+
+A caller or subscriber that is cancelled or disconnects only detaches
+itself; the upstream work carries on for the others. A stream is
+cancelled once its last subscriber has gone. Keys are released as soon
+as the work finishes, so completed answers are served by the caches,
+not from here.
+"""
+
+import asyncio
+import logging
+from typing import AsyncGenerator, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from services import metrics
+from services.answer_cache import context_hash
+from services.cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+JOINS = metrics.Counter(
+    "sunmarke_single_flight_joins_total", "Requests served by an identical in-flight request", ["kind"]
+)
+
+
+def flight_key(model: str, query: str, context: str) -> str:
+    """Key for a first-turn answer stream: model, normalized query and context."""
+    return f"{model}:{context_hash(context)}:{normalize_query(query)}"
+
+
+class SingleFlight:
+    """Share one in-flight coroutine among callers with the same key."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.started = 0
+        self.joined = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._tasks.get(key)
+        if task is None:
+            self.started += 1
+            task = asyncio.create_task(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _t: self._tasks.pop(key, None))
+        else:
+            self.joined += 1
+            JOINS.inc(self.kind)
+        # Shielded so a cancelled caller does not cancel the shared work
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._tasks)}
+
+
+class _Broadcast:
+    """One upstream stream pumped into a buffer for any number of readers."""
+
+    def __init__(self, source: AsyncGenerator[str, None], on_done: Callable[[], None]) -> None:
+        self.buffer: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        # Set once the last subscriber left and the upstream is being cancelled
+        self.closing = False
+        self._on_done = on_done
+        self._changed = asyncio.get_running_loop().create_future()
+        self.task = asyncio.create_task(self._pump(source))
+
+    def _notify(self) -> None:
+        changed, self._changed = self._changed, asyncio.get_running_loop().create_future()
+        changed.set_result(None)
+
+    async def _pump(self, source: AsyncGenerator[str, None]) -> None:
+        try:
+            async for delta in source:
+                self.buffer.append(delta)
+                self._notify()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._on_done()
+            self._notify()
+            await source.aclose()
+
+    def attach(self) -> "_Subscription":
+        # Counted on attach, not on first read, so a subscriber that has not
+        # started reading yet keeps the upstream alive
+        self.subscribers += 1
+        return _Subscription(self)
+
+    def detach(self) -> None:
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self.closing = True
+            self.task.cancel()
+
+    async def _read(self) -> AsyncGenerator[str, None]:
+        position = 0
+        while True:
+            if position < len(self.buffer):
+                # Late joiners get the backlog in one delta
+                end = len(self.buffer)
+                chunk = self.buffer[position] if end - position == 1 else "".join(self.buffer[position:end])
+                position = end
+                yield chunk
+            elif self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            else:
+                await asyncio.shield(self._changed)
+
+
+class _Subscription:
+    """One reader of a `_Broadcast`.
+
+    Detaches exactly once: when the stream ends, fails or is closed.
+    Unlike an async generator's `finally`, `aclose` also detaches a
+    reader that was closed before its first read.
+    """
+
+    def __init__(self, broadcast: _Broadcast) -> None:
+        self._broadcast = broadcast
+        self._reader = broadcast._read()
+        self._attached = True
+
+    def _detach(self) -> None:
+        if self._attached:
+            self._attached = False
+            self._broadcast.detach()
+
+    def __aiter__(self) -> "_Subscription":
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            return await self._reader.__anext__()
+        except BaseException:
+            # StopAsyncIteration, an upstream error or cancellation
+            self._detach()
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._reader.aclose()
+        finally:
+            self._detach()
+
+
+class StreamFanout:
+    """Share one in-flight delta stream among subscribers with the same key."""
+
+    def __init__(self, kind: str) -> None:
+        self.kind = kind
+        self._streams: Dict[str, _Broadcast] = {}
+        self.started = 0
+        self.joined = 0
+
+    def subscribe(self, key: str, factory: Callable[[], AsyncGenerator[str, None]]) -> _Subscription:
+        """Attach to the in-flight stream for `key`, starting it if needed."""
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.closing:
+            self.started += 1
+            broadcast = _Broadcast(factory(), lambda: self._release(key, broadcast))
+            self._streams[key] = broadcast
+        else:
+            self.joined += 1
+            JOINS.inc(self.kind)
+        return broadcast.attach()
+
+    def _release(self, key: str, broadcast: _Broadcast) -> None:
+        if self._streams.get(key) is broadcast:
+            del self._streams[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"started": self.started, "joined": self.joined, "in_flight": len(self._streams)}
@@ -0,0 +1,206 @@
+"""Startup timing, lazy SDK imports and background warm-up.
+
+Provider SDKs (openai, groq, google-genai, cohere, deepgram, weaviate)
+are imported through `lazy_import` the first time a client is needed
+rather than when `app.py` is imported, so the UI is up before they
+load. At launch `start_warmup` then builds every configured client in
+the background and makes one cheap authenticated request with it, which
+leaves a pooled keep-alive (TLS) connection open, so the first user
+request does not pay for imports, client construction or handshakes.
+
+The pooled connections only help if they are still open when the first
+request arrives: clients are built on `http_client` / `keepalive_limits`,
+which keep idle connections for `KEEPALIVE_EXPIRY` seconds instead of
+httpx's 5, and `keep_warm` repeats each provider's cheap request every
+`KEEPWARM_INTERVAL` seconds so servers do not drop them as idle either.
+Client getters build their client under `client_lock`, so a request
+that arrives while warm-up is still importing an SDK waits for that
+client (in a thread) instead of building a second one.
+
+Each phase (app imports, every SDK import, client construction and
+connection) is timed; the breakdown is logged once warm-up finishes
+and served by `/readyz`, which reports ready once no warm-up target is
+still pending. A provider that fails to warm up does not block
+readiness, since every request path already degrades gracefully.
+"""
+
+import asyncio
+import importlib
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Awaitable, Callable, Dict, Iterator, Optional
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_STARTED = time.perf_counter()
+_last_mark = _STARTED
+
+# Phase name -> seconds, in the order the phases completed
+TIMINGS: Dict[str, float] = {}
+
+
+def record(name: str, seconds: float) -> None:
+    global _last_mark
+    TIMINGS[name] = TIMINGS.get(name, 0.0) + seconds
+    _last_mark = time.perf_counter()
+
+
+def mark(name: str) -> None:
+    """Record the time since the previous phase ended (or this module was
+    imported) as `name`."""
+    record(name, time.perf_counter() - _last_mark)
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import `name` on first use, recording how long the import took.
+
+    Always goes through `import_module`: a module another thread is
+    still importing is already in `sys.modules` but only partly
+    initialised, and the import lock makes this call wait for it.
+    """
+    if name in sys.modules:
+        return importlib.import_module(name)
+    with timed(f"import {name}"):
+        return importlib.import_module(name)
+
+
+# --- Clients ---
+_client_locks: Dict[str, threading.Lock] = {}
+
+
+def client_lock(name: str) -> threading.Lock:
+    """Lock held while the shared client `name` is constructed."""
+    return _client_locks.setdefault(name, threading.Lock())
+
+
+def keepalive_limits():
+    """Connection limits whose idle connections outlive the gap between
+    warm-up and the first request (httpx closes them after 5s by default)."""
+    httpx = lazy_import("httpx")
+    return httpx.Limits(max_connections=1000, max_keepalive_connections=100, keepalive_expiry=settings.KEEPALIVE_EXPIRY)
+
+
+def http_client(**kwargs):
+    """`httpx.AsyncClient` with `keepalive_limits`, for SDKs that accept one."""
+    return lazy_import("httpx").AsyncClient(limits=keepalive_limits(), **kwargs)
+
+
+def uptime() -> float:
+    return time.perf_counter() - _STARTED
+
+
+def breakdown() -> str:
+    return ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in TIMINGS.items())
+
+
+# --- Warm-up ---
+class WarmupTarget:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.state = "pending"
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        status = {"state": self.state}
+        if self.seconds is not None:
+            status["seconds"] = round(self.seconds, 3)
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+_targets: Dict[str, WarmupTarget] = {}
+_tasks = set()
+_keepers = set()
+
+
+def ready() -> bool:
+    return all(target.state != "pending" for target in _targets.values())
+
+
+def status() -> Dict:
+    return {
+        "ready": ready(),
+        "uptime": round(uptime(), 3),
+        "targets": {name: target.as_dict() for name, target in _targets.items()},
+        "timings": {name: round(seconds, 3) for name, seconds in TIMINGS.items()},
+    }
+
+
+async def _warm(target: WarmupTarget, fn: Callable[[], Awaitable[None]], timeout: float) -> None:
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(fn(), timeout)
+        target.state = "ok"
+    except Exception as e:
+        target.state = "failed"
+        target.error = repr(e)
+        logger.warning(f"Warm-up of {target.name} failed: {e!r}")
+    finally:
+        target.seconds = time.perf_counter() - start
+        record(f"warm {target.name}", target.seconds)
+
+
+def start_warmup(warmers: Dict[str, Callable[[], Awaitable[None]]], timeout: float) -> None:
+    """Run every warmer concurrently in the background; log the breakdown when done."""
+    for name, fn in warmers.items():
+        target = _targets[name] = WarmupTarget(name)
+        task = asyncio.create_task(_warm(target, fn, timeout))
+        _tasks.add(task)
+        task.add_done_callback(_finished)
+    if not warmers:
+        logger.info(f"Startup in {uptime():.2f}s: {breakdown()}")
+
+
+async def _keep_warm(name: str, fn: Callable[[], Awaitable[None]], interval: float, timeout: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.wait_for(fn(), timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Keep-warm request to {name} failed: {e!r}")
+
+
+def keep_warm(pingers: Dict[str, Callable[[], Awaitable[None]]], interval: float, timeout: float) -> None:
+    """Repeat each cheap request every `interval` seconds so idle pooled
+    connections are not closed (0 disables)."""
+    if interval <= 0:
+        return
+    for name, fn in pingers.items():
+        _keepers.add(asyncio.create_task(_keep_warm(name, fn, interval, timeout)))
+
+
+def stop_warmup() -> None:
+    """Cancel warm-up and keep-warm tasks (on shutdown)."""
+    for task in (*_tasks, *_keepers):
+        task.cancel()
+    _keepers.clear()
+
+
+def _finished(task: asyncio.Task) -> None:
+    _tasks.discard(task)
+    if not _tasks:
+        failed = [name for name, target in _targets.items() if target.state == "failed"]
+        logger.info(
+            f"Warm-up finished {uptime():.2f}s after start"
+            + (f" ({', '.join(failed)} failed)" if failed else "")
+            + f": {breakdown()}"
+        )
@@ -0,0 +1,222 @@
+"""Server-side, sentence-pipelined text-to-speech.
+
+Each model's answer is split into sentences as its deltas arrive, and
+every completed sentence is synthesized straight away (a few at a time,
+concurrently with generation), so audio for the first sentence is
+ready while the model is still writing the rest. Segments are handed
+out strictly in sentence order.
+
+Providers are pluggable through `PROVIDERS`: `deepgram` calls the
+Deepgram Speak REST API, `offline` synthesizes a placeholder tone of
+roughly the spoken duration without any network access (for tests and
+load runs).
+"""
+
+import asyncio
+import io
+import logging
+import re
+import wave
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from config import settings
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?:;])[\"')\]]*\s+|\n+")
+_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+_URL_RE = re.compile(r"https?://\S+")
+_MARKUP_RE = re.compile(r"[*_#`~]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def speakable(text: str) -> str:
+    """Strip markdown markup, links and URLs that should not be read aloud."""
+    text = _LINK_RE.sub(r"\1", text)
+    text = _URL_RE.sub("", text)
+    text = _MARKUP_RE.sub("", text)
+    return _SPACE_RE.sub(" ", text).strip()
+
+
+class SentenceSplitter:
+    """Incrementally cut a token stream into sentences.
+
+    Pieces shorter than `min_chars` are merged with the next one so
+    "Hi." or list markers are not synthesized on their own; a run with
+    no sentence boundary is cut at a space once it exceeds `max_chars`.
+    """
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 300) -> None:
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self._buffer = ""
+        self._pending = ""
+
+    def feed(self, delta: str) -> List[str]:
+        """Add a delta; return the sentences it completed."""
+        self._buffer += delta
+        sentences: List[str] = []
+        start = 0
+        for match in _SENTENCE_END_RE.finditer(self._buffer):
+            self._add(self._buffer[start:match.end()], sentences)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+
+        if len(self._buffer) > self.max_chars:
+            cut = self._buffer.rfind(" ", 0, self.max_chars)
+            cut = cut if cut > 0 else self.max_chars
+            self._add(self._buffer[:cut], sentences)
+            self._buffer = self._buffer[cut:]
+        return sentences
+
+    def _add(self, piece: str, sentences: List[str]) -> None:
+        self._pending += piece
+        text = speakable(self._pending)
+        if len(text) >= self.min_chars:
+            sentences.append(text)
+            self._pending = ""
+
+    def flush(self) -> Optional[str]:
+        """The unfinished tail once the stream has ended."""
+        text = speakable(self._pending + self._buffer)
+        self._pending = self._buffer = ""
+        return text or None
+
+
+# --- Providers ---
+class DeepgramTTSProvider:
+    """Deepgram Speak REST API (MP3 output)."""
+
+    def __init__(self) -> None:
+        self.client = httpx.AsyncClient(timeout=30)
+
+    async def synthesize(self, text: str) -> bytes:
+        response = await self.client.post(
+            settings.TTS_URL,
+            params={"model": settings.TTS_VOICE, "encoding": "mp3"},
+            headers={"Authorization": f"Token {settings.DEEPGRAM_API_KEY}"},
+            json={"text": text},
+        )
+        response.raise_for_status()
+        return response.content
+
+
+class OfflineTTSProvider:
+    """Offline stand-in: a soft tone lasting about as long as the text
+    would take to say, after a simulated synthesis latency."""
+
+    sample_rate = 16000
+
+    def __init__(self, latency: float = 0.05, seconds_per_word: float = 0.3) -> None:
+        self.latency = latency
+        self.seconds_per_word = seconds_per_word
+
+    async def synthesize(self, text: str) -> bytes:
+        await asyncio.sleep(self.latency)
+        seconds = max(len(text.split()), 1) * self.seconds_per_word
+        t = np.arange(int(seconds * self.sample_rate)) / self.sample_rate
+        fade = np.minimum(1.0, np.minimum(t, seconds - t) * 20)
+        samples = (np.sin(2 * np.pi * 220 * t) * fade * 0.1 * 32767).astype("<i2")
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as file:
+            file.setnchannels(1)
+            file.setsampwidth(2)
+            file.setframerate(self.sample_rate)
+            file.writeframes(samples.tobytes())
+        return buffer.getvalue()
+
+
+TTSProvider = DeepgramTTSProvider | OfflineTTSProvider
+
+PROVIDERS: Dict[str, Callable[[], TTSProvider]] = {
+    "deepgram": DeepgramTTSProvider,
+    "offline": OfflineTTSProvider,
+}
+
+_provider: Optional[TTSProvider] = None
+
+
+def get_tts_provider() -> TTSProvider:
+    """Shared provider selected by `settings.TTS_PROVIDER`."""
+    global _provider
+    if _provider is None:
+        try:
+            _provider = PROVIDERS[settings.TTS_PROVIDER]()
+        except KeyError:
+            raise ValueError(f"Unknown TTS provider {settings.TTS_PROVIDER!r}; expected one of {sorted(PROVIDERS)}")
+    return _provider
+
+
+# --- Pipeline ---
+class SpeechPipeline:
+    """Sentence splitting plus ordered, concurrent synthesis for one answer."""
+
+    def __init__(self, provider: TTSProvider, concurrency: int = 2) -> None:
+        self.provider = provider
+        self.splitter = SentenceSplitter()
+        self._segments: Deque[asyncio.Task] = deque()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._changed = asyncio.Event()
+        self._closed = False
+
+    @property
+    def ready(self) -> bool:
+        """Whether `take` would return a segment now."""
+        return bool(self._segments) and self._segments[0].done()
+
+    @property
+    def finished(self) -> bool:
+        """Whether the answer ended and every segment has been taken."""
+        return self._closed and not self._segments
+
+    def feed(self, delta: str) -> None:
+        for sentence in self.splitter.feed(delta):
+            self._schedule(sentence)
+
+    def close(self) -> None:
+        """Mark the answer complete and synthesize its unfinished tail."""
+        if self._closed:
+            return
+        tail = self.splitter.flush()
+        if tail:
+            self._schedule(tail)
+        self._closed = True
+        self._changed.set()
+
+    def _schedule(self, sentence: str) -> None:
+        task = asyncio.create_task(self._synthesize(sentence))
+        task.add_done_callback(lambda _task: self._changed.set())
+        self._segments.append(task)
+
+    async def _synthesize(self, sentence: str) -> Optional[bytes]:
+        async with self._slots:
+            try:
+                with metrics.STAGE_SECONDS.time("tts_synthesis"):
+                    return await self.provider.synthesize(sentence)
+            except Exception:
+                logger.exception("Speech synthesis failed")
+                return None
+
+    def take(self) -> Optional[bytes]:
+        """Next audio segment in sentence order, if it is ready."""
+        while self._segments and self._segments[0].done():
+            task = self._segments.popleft()
+            if not task.cancelled() and task.result():
+                return task.result()
+        return None
+
+    async def wait(self) -> None:
+        """Block until a segment completes or the answer ends."""
+        await self._changed.wait()
+        self._changed.clear()
+
+    def cancel(self) -> None:
+        for task in self._segments:
+            task.cancel()
+        self._segments.clear()
+        self._closed = True
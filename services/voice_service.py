@@ -3,16 +3,42 @@
 This module exposes a single async helper `transcribe_audio` that
 converts a local audio file path to text. It uses the Deepgram async
 client and returns an empty string on failure to keep the UI flow
-simple and non-blocking.
+simple and non-blocking. The client (and the Deepgram SDK) is created
+on first use or by the background warm-up.
 """
 
+import asyncio
+import logging
 import os
-from deepgram import AsyncDeepgramClient
 from config import settings
+from services import metrics, startup
+
+logger = logging.getLogger(__name__)
 
-# Initialize the ASYNC client
 DEEPGRAM_API_KEY = settings.DEEPGRAM_API_KEY
-dg_client = AsyncDeepgramClient(api_key=DEEPGRAM_API_KEY)
+# ASYNC client, created on first use
+dg_client = None
+
+
+def get_dg_client():
+    global dg_client
+    with startup.client_lock("deepgram"):
+        if dg_client is None:
+            deepgram = startup.lazy_import("deepgram")
+            with startup.timed("client deepgram"):
+                dg_client = deepgram.AsyncDeepgramClient(api_key=DEEPGRAM_API_KEY, httpx_client=startup.http_client())
+    return dg_client
+
+
+async def dg_async_client():
+    """The client, built in a thread on first use so the SDK import never blocks the loop."""
+    return dg_client or await asyncio.to_thread(get_dg_client)
+
+
+async def warm_deepgram() -> None:
+    """Create the client and open a keep-alive connection to the API."""
+    client = await dg_async_client()
+    await client.manage.v1.models.list()
 
 
 async def transcribe_audio(audio_path):
@@ -28,15 +54,17 @@ async def transcribe_audio(audio_path):
             audio_data = audio.read()
 
         # In Async v5+, use 'request=' keyword argument for the bytes buffer
-        response = await dg_client.listen.v1.media.transcribe_file(
-            request=audio_data,
-            model="nova-3",
-            smart_format=True,
-            language="en-US"
-        )
+        with metrics.STAGE_SECONDS.time("transcription"), metrics.span("transcription"):
+            client = await dg_async_client()
+            response = await client.listen.v1.media.transcribe_file(
+                request=audio_data,
+                model="nova-3",
+                smart_format=True,
+                language="en-US"
+            )
 
         return response.results.channels[0].alternatives[0].transcript
 
     except Exception as e:
-        print(f"STT Error: {e}")
+        logger.exception("STT Error")
         return f"Error: {str(e)}"
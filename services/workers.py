@@ -0,0 +1,308 @@
+"""Multi-worker mode: N app processes behind a sticky-session proxy.
+
+With `WORKERS` above 1, `python app.py` (or `python -m services.workers`)
+becomes a supervisor. It starts N copies of the app on local ports
+`PORT + 1 .. PORT + N` and serves a small reverse proxy on `PORT`. The
+proxy pins every browser to one worker with a cookie, so a Gradio
+session (its queue, streams and live transcription socket) always stays
+on the process that owns it. Sessions are spread over the workers by
+least in-flight requests. A worker that exits is restarted; its
+browsers are moved to another worker and, since chat histories live in
+the shared session store, carry on where they were.
+
+State that must agree across workers lives outside the processes:
+
+- retrieval caches, the answer cache and chat sessions use SQLite files
+  in `SHARED_STATE_DIR` (see `services.cache.shared_state_path`)
+- a JSON corpus is converted once into a binary corpus store there, so
+  every worker memory-maps the same read-only vectors instead of
+  holding its own copy; its ANN index (`VECTOR_INDEX=ivf`) is built
+  once as well, and workers load the saved file
+- per-provider concurrency and rate limits are divided between the
+  workers, so together they stay within the configured totals
+"""
+
+import argparse
+import logging
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import uvicorn
+from starlette.background import BackgroundTask
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, StreamingResponse
+
+from config import settings
+from services.cache import shared_state_path
+from services.corpus_store import is_store, json_to_store
+from services.local_search import prepare_ann_index
+
+logger = logging.getLogger(__name__)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+COOKIE = "sunmarke_worker"
+# Set in the environment of every worker process
+WORKER_ENV = "WORKER_INDEX"
+
+# Seconds a worker that refused a connection is skipped for new sessions
+UNHEALTHY_SECONDS = 5.0
+
+_HOP_BY_HOP = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade",
+}
+
+_SCHEDULER_LIMITS = [
+    f"{model}_{limit}"
+    for model in ("DEEPSEEK", "KIMI", "GEMINI")
+    for limit in ("MAX_CONCURRENCY", "RPM", "TPM")
+]
+
+
+def is_supervisor() -> bool:
+    """Whether this process should run the worker pool rather than the app."""
+    return settings.WORKERS > 1 and WORKER_ENV not in os.environ
+
+
+# --- Proxy ---
+class StickyProxy:
+    """ASGI reverse proxy pinning each browser to one upstream worker."""
+
+    def __init__(self, upstreams: List[str]) -> None:
+        self.upstreams = upstreams
+        self.in_flight = [0] * len(upstreams)
+        self._down_until = [0.0] * len(upstreams)
+        self.client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=5),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=100),
+        )
+
+    def _healthy(self, index: int) -> bool:
+        return time.monotonic() >= self._down_until[index]
+
+    def pick(self, cookie: Optional[str]) -> Tuple[int, bool]:
+        """Worker for a request and whether the browser must be (re)pinned."""
+        if cookie is not None and cookie.isdigit():
+            index = int(cookie)
+            if index < len(self.upstreams) and self._healthy(index):
+                return index, False
+        index = min(range(len(self.upstreams)), key=lambda i: (not self._healthy(i), self.in_flight[i]))
+        return index, True
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            # Gradio talks HTTP + server-sent events only
+            await send({"type": "websocket.close", "code": 1003})
+            return
+
+        request = Request(scope, receive)
+        index, pin = self.pick(request.cookies.get(COOKIE))
+        response = await self._forward(request, index)
+        if pin:
+            response.set_cookie(COOKIE, str(index), httponly=True, samesite="lax")
+        await response(scope, receive, send)
+
+    async def _forward(self, request: Request, index: int):
+        url = self.upstreams[index] + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+        headers = [(key, value) for key, value in request.headers.items() if key.lower() not in _HOP_BY_HOP]
+        client = request.client.host if request.client else ""
+        forwarded = request.headers.get("x-forwarded-for")
+        headers.append(("x-forwarded-for", f"{forwarded}, {client}" if forwarded else client))
+        headers.append(("x-forwarded-proto", request.headers.get("x-forwarded-proto", request.url.scheme)))
+
+        has_body = "content-length" in request.headers or "transfer-encoding" in request.headers
+        upstream = self.client.build_request(
+            request.method, url, headers=headers, content=request.stream() if has_body else None
+        )
+        self.in_flight[index] += 1
+        try:
+            response = await self.client.send(upstream, stream=True)
+        except httpx.ConnectError:
+            self.in_flight[index] -= 1
+            self._down_until[index] = time.monotonic() + UNHEALTHY_SECONDS
+            logger.warning(f"Worker {index} refused a connection")
+            return PlainTextResponse("Worker unavailable, please retry.\n", status_code=502)
+
+        released = False
+
+        async def release() -> None:
+            # Closing the upstream response lets the worker notice a browser
+            # that went away and cancel the request's model streams
+            nonlocal released
+            if not released:
+                released = True
+                self.in_flight[index] -= 1
+                await response.aclose()
+
+        async def body():
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            finally:
+                await release()
+
+        # Raw bytes, so compressed bodies and server-sent events pass through untouched
+        proxied = StreamingResponse(body(), status_code=response.status_code, background=BackgroundTask(release))
+        # multi_items keeps repeated headers such as Set-Cookie
+        proxied.raw_headers = [
+            (key.encode("latin-1"), value.encode("latin-1"))
+            for key, value in response.headers.multi_items()
+            if key.lower() not in _HOP_BY_HOP
+        ]
+        return proxied
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+# --- Workers ---
+def _worker_env(index: int, count: int, port: int, corpus_path: Optional[str]) -> Dict[str, str]:
+    env = dict(os.environ)
+    env[WORKER_ENV] = str(index)
+    env["HOST"] = "127.0.0.1"
+    env["PORT"] = str(port)
+    if corpus_path:
+        env["LOCAL_CORPUS_PATH"] = corpus_path
+    # Provider limits are per process; split them so the pool keeps the totals
+    for name in _SCHEDULER_LIMITS:
+        value = getattr(settings, name)
+        if value > 0:
+            share = max(1, value // count)
+            if name.endswith("_TPM"):
+                # A bucket smaller than one prompt would reject every request
+                share = max(share, getattr(settings, name.replace("_TPM", "_INPUT_TOKENS")))
+            env[name] = str(share)
+    return env
+
+
+class WorkerPool:
+    """Starts the app workers and restarts any that exit."""
+
+    def __init__(self, count: int, base_port: int, corpus_path: Optional[str]) -> None:
+        self.count = count
+        self.ports = [base_port + i for i in range(count)]
+        self.corpus_path = corpus_path
+        self.processes: List[Optional[subprocess.Popen]] = [None] * count
+        self._stopping = threading.Event()
+
+    def start(self) -> None:
+        for index in range(self.count):
+            self._spawn(index)
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+
+    def _spawn(self, index: int) -> None:
+        env = _worker_env(index, self.count, self.ports[index], self.corpus_path)
+        self.processes[index] = subprocess.Popen([sys.executable, APP_PATH], env=env)
+        logger.info(f"Started worker {index} on port {self.ports[index]} (pid {self.processes[index].pid})")
+
+    def _monitor(self) -> None:
+        while not self._stopping.wait(1.0):
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None and not self._stopping.is_set():
+                    logger.warning(f"Worker {index} exited with {process.returncode}; restarting")
+                    self._spawn(index)
+
+    def wait_ready(self, timeout: float = 120) -> None:
+        """Block until every worker accepts connections."""
+        deadline = time.monotonic() + timeout
+        for port in self.ports:
+            while True:
+                try:
+                    socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                    break
+                except OSError:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Worker on port {port} did not start within {timeout}s")
+                    time.sleep(0.2)
+
+    def stop(self) -> None:
+        self._stopping.set()
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is not None:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+
+def shared_corpus() -> Optional[str]:
+    """Binary corpus store the workers memory-map, converted from a JSON
+    corpus when needed (None if there is no local corpus)."""
+    source = settings.LOCAL_CORPUS_PATH
+    if is_store(source):
+        return source
+    if not os.path.isfile(source):
+        return None
+    target = shared_state_path("corpus")
+    header = os.path.join(target, "header.json")
+    if not os.path.exists(header) or os.path.getmtime(header) < os.path.getmtime(source):
+        logger.info(f"Converting {source} into a shared binary corpus at {target}")
+        json_to_store(source, target)
+    return target
+
+
+def serve(host: str, port: int, count: int) -> None:
+    """Run `count` workers behind the sticky proxy on `host:port`."""
+    corpus_path = shared_corpus()
+    if corpus_path:
+        # Built once here rather than by every worker at once
+        prepare_ann_index(corpus_path)
+    pool = WorkerPool(count, port + 1, corpus_path)
+    pool.start()
+    try:
+        pool.wait_ready()
+        logger.info(f"{count} workers ready; proxy listening on {host}:{port}")
+        proxy = StickyProxy([f"http://127.0.0.1:{worker_port}" for worker_port in pool.ports])
+        # The workers already send Date and Server headers
+        uvicorn.run(proxy, host=host, port=port, log_level="warning", server_header=False, date_header=False)
+    finally:
+        pool.stop()
+
+
+def run_app(host: str, port: int) -> None:
+    """Single process: the app itself."""
+    from app import create_server
+
+    uvicorn.run(create_server(), host=host, port=port)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the app, or N workers behind a sticky-session proxy")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", default=5000)))
+    parser.add_argument("--workers", type=int, default=settings.WORKERS)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    # One line per proxied request would drown the worker logs
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.workers > 1 and WORKER_ENV not in os.environ:
+        # Workers read WORKERS to pick the shared stores
+        os.environ["WORKERS"] = str(args.workers)
+        settings.WORKERS = args.workers
+        serve(args.host, args.port, args.workers)
+    else:
+        run_app(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
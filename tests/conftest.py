@@ -0,0 +1,15 @@
+"""Shared test setup.
+
+`config.settings` reads the environment once on import, so dummy
+credentials are set before any application module is imported; no
+test talks to a real provider.
+"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+for _name in ("OPEN_ROUTER_API_KEY", "GROQ_API_KEY", "GEMINI_API_KEY", "COHERE_API_KEY", "DEEPGRAM_API_KEY"):
+    os.environ.setdefault(_name, "test")
@@ -0,0 +1,106 @@
+"""The IVF index in `services.ann_index`."""
+
+import json
+
+import numpy as np
+import pytest
+
+from services.ann_index import IVFIndex, normalize, quantize
+
+
+def clustered(count: int, dim: int = 64, clusters: int = 40, noise: float = 0.3, seed: int = 0) -> np.ndarray:
+    """Unit vectors scattered around random centres, like embedding data."""
+    rng = np.random.default_rng(seed)
+    centres = normalize(rng.standard_normal((clusters, dim)))
+    points = centres[rng.integers(0, clusters, count)] + noise * rng.standard_normal((count, dim)) / np.sqrt(dim)
+    return normalize(points)
+
+
+def exact_top(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    return np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+
+
+def recall(index: IVFIndex, vectors: np.ndarray, queries: np.ndarray, k: int, nprobe: int) -> float:
+    truth = exact_top(vectors, queries, k)
+    found = [set(index.search(query, k, nprobe)[0].tolist()) for query in queries]
+    return float(np.mean([len(ids & set(row.tolist())) / k for ids, row in zip(found, truth)]))
+
+
+@pytest.fixture(scope="module")
+def data():
+    vectors = clustered(4000)
+    queries = clustered(50, seed=1)
+    return vectors, queries, IVFIndex.build(vectors, n_lists=64, nprobe=8, fingerprint="v1")
+
+
+def test_quantize_round_trips_within_one_step():
+    residuals = np.random.default_rng(0).standard_normal((10, 32)).astype(np.float32)
+    codes, scales = quantize(residuals)
+    assert codes.dtype == np.int8
+    assert np.all(np.abs(codes * scales[:, None] - residuals) <= scales[:, None] / 2 + 1e-6)
+
+
+def test_every_vector_is_indexed_once(data):
+    vectors, _queries, index = data
+    assert len(index) == len(vectors) and index.n_lists == 64
+    ids = np.concatenate([inverted.ids[:inverted.size] for inverted in index.lists])
+    assert sorted(ids.tolist()) == list(range(len(vectors)))
+
+
+def test_recall_grows_with_nprobe(data):
+    vectors, queries, index = data
+    low = recall(index, vectors, queries, 10, nprobe=2)
+    high = recall(index, vectors, queries, 10, nprobe=16)
+    everything = recall(index, vectors, queries, 10, nprobe=index.n_lists)
+    assert low <= high <= everything
+    assert high >= 0.85
+    # Probing every cell leaves only int8 rounding between it and the exact scan
+    assert everything >= 0.95
+
+
+def test_scores_approximate_inner_products(data):
+    vectors, queries, index = data
+    ids, scores = index.search(queries[0], 20, index.n_lists)
+    assert np.all(np.diff(scores) <= 0)
+    assert np.allclose(scores, vectors[ids] @ queries[0], atol=0.02)
+
+
+def test_save_and_load_round_trip(tmp_path, data):
+    vectors, queries, index = data
+    path = str(tmp_path / "ann.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert (loaded.fingerprint, loaded.n_lists, loaded.nprobe, len(loaded)) == ("v1", 64, 8, len(vectors))
+    for query in queries[:10]:
+        expected_ids, expected_scores = index.search(query, 10)
+        ids, scores = loaded.search(query, 10)
+        assert np.array_equal(ids, expected_ids) and np.allclose(scores, expected_scores)
+    # No temporary file is left behind
+    assert [entry.name for entry in tmp_path.iterdir()] == ["ann.npz"]
+
+
+def test_loaded_index_accepts_new_vectors(tmp_path, data):
+    vectors, _queries, index = data
+    path = str(tmp_path / "ann.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    extra = clustered(10, seed=2)
+    loaded.add(extra)
+    assert len(loaded) == len(vectors) + 10
+    ids, _ = loaded.search(extra[0], 1, loaded.n_lists)
+    assert ids[0] == len(vectors)
+
+
+def test_unknown_format_version_is_rejected(tmp_path, data):
+    _vectors, _queries, index = data
+    path = str(tmp_path / "ann.npz")
+    index.save(path)
+    with np.load(path) as saved:
+        arrays = dict(saved)
+    header = json.loads(str(arrays["header"]))
+    header["format_version"] = 99
+    arrays["header"] = np.array(json.dumps(header))
+    with open(path, "wb") as file:
+        np.savez(file, **arrays)
+    with pytest.raises(ValueError):
+        IVFIndex.load(path)
@@ -0,0 +1,20 @@
+"""The semantic answer cache in `services.answer_cache`."""
+
+import asyncio
+
+from services.answer_cache import SemanticAnswerCache, SQLiteAnswerStore
+
+
+def test_invalidate_empties_the_shared_store(tmp_path):
+    async def run():
+        store = SQLiteAnswerStore(str(tmp_path / "answers.sqlite3"))
+        writer = SemanticAnswerCache(threshold=0.9, maxsize=10, ttl=60, shared=store)
+        writer.store("kimi", [1.0, 0.0], "context", "answer")
+        reader = SemanticAnswerCache(threshold=0.9, maxsize=10, ttl=60, shared=store)
+        found = await reader.lookup("kimi", [1.0, 0.1], "context")
+
+        writer.invalidate()
+        fresh = SemanticAnswerCache(threshold=0.9, maxsize=10, ttl=60, shared=store)
+        return found, await fresh.lookup("kimi", [1.0, 0.1], "context"), await writer.lookup("kimi", [1.0, 0.0], "context")
+
+    assert asyncio.run(run()) == ("answer", None, None)
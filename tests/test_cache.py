@@ -0,0 +1,38 @@
+"""Retrieval caches in `services.cache`."""
+
+import pytest
+
+from config import settings
+from services import cache, metrics
+
+
+@pytest.fixture
+def versioned(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "CORPUS_VERSION", None)
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "LOCAL_CORPUS_PATH", str(tmp_path / "missing.json"))
+    monkeypatch.setattr(cache, "_version", None)
+    return tmp_path
+
+
+def test_corpus_version_is_cached_between_checks(monkeypatch, versioned):
+    first = cache.corpus_version()
+    (versioned / cache.VERSION_FILE).write_text("elsewhere")
+    # Another process bumped it; this worker notices after the check interval
+    assert cache.corpus_version() == first
+    monkeypatch.setattr(cache, "VERSION_CHECK_INTERVAL", 0)
+    assert cache.corpus_version() == "elsewhere:unversioned"
+
+
+def test_bump_changes_the_version_and_the_search_keys(versioned):
+    before = cache.search_key("What are the fees?", 0.5, 3)
+    cache.bump_corpus_version()
+    after = cache.search_key("What are the fees?", 0.5, 3)
+    assert before != after
+    cache.bump_corpus_version()
+    assert cache.search_key("What are the fees?", 0.5, 3) not in (before, after)
+
+
+def test_cache_stats_are_exported_to_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    assert 'sunmarke_retrieval_cache{cache="search",stat="misses"}' in metrics.render()
@@ -0,0 +1,63 @@
+"""Incremental ingestion in `services.ingestion`."""
+
+import asyncio
+import json
+
+import pytest
+
+from config import settings
+from services.ingestion import IngestionPipeline, LocalSink
+
+
+def _chunks(count: int):
+    return [{"chunk_id": f"c{index}", "url": "https://example.com", "content": f"chunk {index}"} for index in range(count)]
+
+
+@pytest.fixture
+def paths(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "SHARED_STATE_DIR", str(tmp_path / "state"))
+    chunks = tmp_path / "chunks.json"
+    chunks.write_text(json.dumps(_chunks(5)))
+    return str(chunks), str(tmp_path / "corpus.json"), str(tmp_path / "ingestion_state.json")
+
+
+def _pipeline(chunks: str, corpus: str, state: str, sink: LocalSink) -> IngestionPipeline:
+    pipeline = IngestionPipeline(chunks, state, [sink], batch_size=1, concurrency=1)
+    embedded = pipeline.embedded = []
+
+    async def embed(texts):
+        embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+    pipeline._embed = embed
+    return pipeline
+
+
+def test_corpus_is_written_every_n_batches_and_at_the_end(monkeypatch, paths):
+    chunks, corpus, state = paths
+    writes = []
+    write = LocalSink._write
+    monkeypatch.setattr(LocalSink, "_write", lambda sink: (writes.append(len(sink.records)), write(sink)))
+
+    pipeline = _pipeline(chunks, corpus, state, LocalSink(corpus, flush_every=2))
+    summary = asyncio.run(pipeline.run())
+    assert summary == {"total": 5, "changed": 5, "removed": 0}
+    assert writes == [2, 4, 5]
+    with open(corpus, encoding="utf-8") as file:
+        assert len(json.load(file)) == 5
+
+
+def test_resume_redoes_batches_missing_from_the_corpus(paths):
+    chunks, corpus, state = paths
+    asyncio.run(_pipeline(chunks, corpus, state, LocalSink(corpus, flush_every=2)).run())
+
+    # Interrupted after the state checkpoint but before the corpus was rewritten
+    with open(corpus, encoding="utf-8") as file:
+        records = json.load(file)
+    with open(corpus, "w", encoding="utf-8") as file:
+        json.dump(records[:4], file)
+
+    pipeline = _pipeline(chunks, corpus, state, LocalSink(corpus))
+    summary = asyncio.run(pipeline.run())
+    assert summary["changed"] == 1
+    assert pipeline.embedded == ["chunk 4"]
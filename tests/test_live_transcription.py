@@ -0,0 +1,96 @@
+"""Live transcription against the local Deepgram stand-in."""
+
+import asyncio
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from benchmarks.fake_deepgram_live import FakeDeepgramLive, start_server
+from config import settings
+from services import live_transcription
+
+TRANSCRIPT = "What are the school fees for Year 7?"
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(monkeypatch):
+    # app.py reads assets/ relative to the working directory
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(settings, "PREFETCH_ENABLED", False)
+    import app
+    return app
+
+
+def _chunk(seconds: float, sample_rate: int = 48000):
+    """A Gradio streaming chunk: (sample rate, int16 stereo samples)."""
+    return sample_rate, np.zeros((int(seconds * sample_rate), 2), dtype=np.int16)
+
+
+async def _serve(monkeypatch, fake: FakeDeepgramLive):
+    server = await start_server(fake)
+    port = server.sockets[0].getsockname()[1]
+    monkeypatch.setattr(settings, "DEEPGRAM_LIVE_URL", f"ws://127.0.0.1:{port}/v1/listen")
+    return server
+
+
+def test_chunks_update_the_textbox_then_stop_returns_the_final_transcript(monkeypatch, app):
+    async def run():
+        fake = FakeDeepgramLive(TRANSCRIPT, words_per_second=4, interim_every=0.25, final_every=10)
+        server = await _serve(monkeypatch, fake)
+        request = SimpleNamespace(session_hash="voice-1")
+        try:
+            updates = []
+            for _ in range(3):
+                updates.append(await app.stream_voice_chunk(_chunk(0.5), request))
+                # Let the interim result for this chunk arrive
+                await asyncio.sleep(0.05)
+            final = await app.finish_voice_stream(request)
+            late = await live_transcription.feed(request.session_hash, *_chunk(0.5))
+        finally:
+            server.close()
+            await server.wait_closed()
+        return fake, updates, final, late
+
+    fake, updates, final, late = asyncio.run(run())
+
+    texts = [update for update in updates if isinstance(update, str) and update]
+    # Interim guesses grow with the audio and are prefixes of the transcript
+    assert texts and all(TRANSCRIPT.startswith(text) for text in texts)
+    assert len(texts[-1]) > len(texts[0])
+    assert texts[-1] != TRANSCRIPT
+    assert final == TRANSCRIPT
+    # 48 kHz stereo is sent as 16 kHz mono int16
+    assert fake.bytes_received == 3 * 16000
+    assert fake.connections == 1
+    # A chunk still in flight after the recording stopped is dropped
+    assert late is None
+
+
+def test_sessions_transcribe_concurrently(monkeypatch, app):
+    async def speak(session_id: str) -> str:
+        request = SimpleNamespace(session_hash=session_id)
+        for _ in range(2):
+            await app.stream_voice_chunk(_chunk(0.5), request)
+        return await app.finish_voice_stream(request)
+
+    async def run():
+        fake = FakeDeepgramLive(TRANSCRIPT, finalize_latency=0.3)
+        server = await _serve(monkeypatch, fake)
+        try:
+            started = asyncio.get_running_loop().time()
+            finals = await asyncio.gather(*(speak(f"voice-many-{i}") for i in range(5)))
+            elapsed = asyncio.get_running_loop().time() - started
+        finally:
+            server.close()
+            await server.wait_closed()
+        return fake, finals, elapsed
+
+    fake, finals, elapsed = asyncio.run(run())
+
+    assert finals == [TRANSCRIPT] * 5
+    assert fake.connections == 5
+    # The five final flushes overlap instead of queueing behind each other
+    assert elapsed < 5 * 0.3
@@ -0,0 +1,78 @@
+"""Hybrid search in `services.local_search`."""
+
+import numpy as np
+import pytest
+
+from config import settings
+from services.ann_index import IVFIndex
+from services.local_search import LocalHybridIndex, tokenize
+from tests.test_ann_index import clustered
+
+TOPICS = ["fees", "admissions", "transport", "sports", "curriculum", "uniform", "canteen", "library"]
+
+
+@pytest.fixture(scope="module")
+def corpus():
+    vectors = clustered(3000, clusters=len(TOPICS) * 4)
+    rng = np.random.default_rng(3)
+    records = [
+        {
+            "url": f"https://example.com/{index}",
+            "content": " ".join(rng.choice(TOPICS, 5)) + f" page {index}",
+        }
+        for index in range(len(vectors))
+    ]
+    return records, vectors
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("What are the Fees, for Year-7?") == ["what", "fees", "year", "7"]
+
+
+def test_bm25_prefers_documents_with_the_query_terms():
+    index = LocalHybridIndex(
+        [{"content": "school fees and payment"}, {"content": "bus routes"}, {"content": "fees fees fees"}],
+        np.eye(3, dtype=np.float32),
+    )
+    scores = index.bm25_scores("fees")
+    assert scores[1] == 0
+    assert scores[2] > scores[0] > 0
+
+
+def test_alpha_selects_vector_or_keyword_ranking():
+    records = [{"content": "bus routes"}, {"content": "school fees"}]
+    index = LocalHybridIndex(records, np.array([[1, 0], [0, 1]], dtype=np.float32))
+    assert index.hybrid("fees", [1.0, 0.0], alpha=1, limit=1)[0].properties == records[0]
+    assert index.hybrid("fees", [1.0, 0.0], alpha=0, limit=1)[0].properties == records[1]
+
+
+@pytest.mark.parametrize("alpha", [0.25, 0.5, 0.75, 1.0])
+def test_ann_fusion_matches_the_exact_search(monkeypatch, corpus, alpha):
+    records, vectors = corpus
+    exact = LocalHybridIndex(records, vectors)
+    approximate = LocalHybridIndex(records, vectors)
+    approximate.ann = IVFIndex.build(approximate.vectors, n_lists=32)
+    # Probing every cell: the candidates are the exact top hits up to int8 rounding
+    monkeypatch.setattr(settings, "ANN_NPROBE", 32)
+
+    queries = clustered(40, clusters=len(TOPICS) * 4, seed=5)
+    rng = np.random.default_rng(7)
+    matches = []
+    for query in queries:
+        text = " ".join(rng.choice(TOPICS, 2))
+        expected = [result.properties["url"] for result in exact.hybrid(text, query, alpha=alpha, limit=5)]
+        found = [result.properties["url"] for result in approximate.hybrid(text, query, alpha=alpha, limit=5)]
+        matches.append(len(set(expected) & set(found)) / 5)
+    assert np.mean(matches) >= 0.95
+
+
+def test_ann_candidates_are_rescored_exactly(monkeypatch, corpus):
+    records, vectors = corpus
+    index = LocalHybridIndex(records, vectors)
+    index.ann = IVFIndex.build(index.vectors, n_lists=32)
+    monkeypatch.setattr(settings, "ANN_NPROBE", 4)
+    query = clustered(1, clusters=len(TOPICS) * 4, seed=9)[0]
+    scores, candidates = index.vector_candidates(query, 50)
+    assert len(candidates) == 50
+    assert np.allclose(scores[candidates], index.vectors[candidates] @ query, atol=1e-5)
+    assert np.count_nonzero(scores) == 50
@@ -0,0 +1,37 @@
+"""Speculative retrieval in `services.prefetch`."""
+
+import asyncio
+
+from services.prefetch import ContextPrefetcher
+
+
+def _prefetcher(**kwargs) -> ContextPrefetcher:
+    async def fetch(text: str) -> str:
+        return f"context for {text}"
+
+    return ContextPrefetcher(fetch, debounce=0, ttl=60, **kwargs)
+
+
+def test_take_returns_the_matching_prefetch():
+    async def run():
+        prefetcher = _prefetcher()
+        prefetcher.schedule("session", "What are the fees")
+        return await prefetcher.take("session", "what are the fees?"), prefetcher.stats()
+
+    result, stats = asyncio.run(run())
+    assert result == "context for What are the fees"
+    assert stats == {"hits": 1, "misses": 0, "pending": 0}
+
+
+def test_take_discards_a_result_older_than_max_age():
+    async def run():
+        prefetcher = _prefetcher(max_age=30)
+        prefetcher.schedule("session", "What are the fees")
+        await asyncio.sleep(0.01)
+        # Finished 31 seconds ago
+        prefetcher._entries["session"].finished -= 31
+        return await prefetcher.take("session", "What are the fees"), prefetcher.stats()
+
+    result, stats = asyncio.run(run())
+    assert result is None
+    assert stats == {"hits": 0, "misses": 1, "pending": 0}
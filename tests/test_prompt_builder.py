@@ -0,0 +1,117 @@
+"""Token budgeting in `services.prompt_builder`."""
+
+import pytest
+
+from config import settings
+from services.prompt_builder import (
+    build_gemini_request,
+    build_messages,
+    count_tokens,
+    format_context,
+    truncate_to_tokens,
+    window_history,
+)
+from services.prompts import system_prompt
+
+
+def _history(turns: int, words: int = 50):
+    history = []
+    for index in range(turns):
+        history.append({"role": "user", "content": f"question {index} " + "word " * words})
+        history.append({"role": "assistant", "content": f"answer {index} " + "word " * words})
+    return history
+
+
+def test_truncate_keeps_text_that_fits():
+    text = "first line\nsecond line"
+    assert truncate_to_tokens(text, 100) == text
+
+
+def test_truncate_cuts_at_a_line_boundary_within_the_budget():
+    text = "\n".join(f"line {index} with a few words" for index in range(100))
+    cut = truncate_to_tokens(text, 50)
+    assert count_tokens(cut) <= 50
+    assert text.startswith(cut)
+    assert cut.splitlines()[-1] in text.splitlines()
+
+
+def test_truncate_cuts_inside_a_line_longer_than_the_budget():
+    line = " ".join(f"word{index}" for index in range(2000))
+    cut = truncate_to_tokens(f"Source: https://example.com\n{line}", 500)
+    assert 480 <= count_tokens(cut) <= 500
+    # Cut after a whole word
+    assert f"{line}\n".startswith(cut.split("\n", 1)[1] + " ")
+
+
+def test_truncate_cuts_a_single_huge_word():
+    cut = truncate_to_tokens("x" * 10000, 20)
+    assert cut and count_tokens(cut) <= 20
+
+
+def test_format_context_merges_pages_and_drops_repeated_lines():
+    docs = [
+        {"url": "https://example.com/fees", "content": "Fees are listed here.\nYear 7: 50,000"},
+        {"url": "https://example.com/fees", "content": "Year 7: 50,000\nYear 8: 52,000"},
+        {"url": "https://example.com/bus", "content": "Fees are listed here."},
+    ]
+    assert format_context(docs) == (
+        "Source: https://example.com/fees\nFees are listed here.\nYear 7: 50,000\nYear 8: 52,000"
+    )
+
+
+def test_window_keeps_the_most_recent_turns_that_fit():
+    history = _history(10)
+    turn_tokens = count_tokens(history[0]["content"]) + count_tokens(history[1]["content"]) + 8
+    kept, dropped = window_history(history, max_tokens=3 * turn_tokens + 2)
+    assert kept == history[-6:]
+    assert len(dropped) == 7
+    assert dropped[0][0]["content"] == history[0]["content"]
+
+
+def test_window_honours_max_turns():
+    kept, dropped = window_history(_history(5), max_tokens=10**6, max_turns=2)
+    assert len(kept) == 4 and len(dropped) == 3
+
+
+def test_window_drops_whole_blocks_so_the_prefix_stays_put():
+    history = _history(10)
+    turn_tokens = count_tokens(history[0]["content"]) + count_tokens(history[1]["content"]) + 8
+    starts = set()
+    for turns in range(6, 11):
+        kept, dropped = window_history(history[:2 * turns], max_tokens=5 * turn_tokens, drop_block=4)
+        assert len(dropped) % 4 == 0 or len(dropped) == turns
+        starts.add(kept[0]["content"] if kept else None)
+    # Five consecutive requests share at most two different first kept messages
+    assert len(starts) <= 2
+
+
+def test_messages_keep_the_system_prompt_fixed_and_summarise_dropped_turns(monkeypatch):
+    monkeypatch.setattr(settings, "HISTORY_MAX_TURNS", 2)
+    monkeypatch.setattr(settings, "HISTORY_DROP_BLOCK", 1)
+    messages = build_messages("What are the fees?", "Source: x\nFees", _history(5), budget=10**5)
+    assert messages[0] == {"role": "system", "content": system_prompt}
+    assert messages[1]["role"] == "system"
+    assert "question 0" in messages[1]["content"] and "question 3" not in messages[1]["content"]
+    assert [message["role"] for message in messages[2:]] == ["user", "assistant"] * 2 + ["user"]
+    assert messages[-1]["content"].endswith("Query: What are the fees?")
+
+
+@pytest.mark.parametrize("turns", [0, 1, 5])
+def test_gemini_contents_alternate_roles(monkeypatch, turns):
+    monkeypatch.setattr(settings, "HISTORY_MAX_TURNS", 2)
+    system, contents = build_gemini_request("What are the fees?", "Fees", _history(turns), budget=10**5)
+    assert system == system_prompt
+    roles = [content["role"] for content in contents]
+    assert roles[0] == "user" and roles[-1] == "user"
+    assert all(first != second for first, second in zip(roles, roles[1:]))
+    if turns > 2:
+        # The summary leads the first user turn
+        assert contents[0]["parts"][0]["text"].startswith("Earlier in this conversation")
+
+
+def test_budget_bounds_the_prompt():
+    context = "\n".join(f"Fact number {index} about the school." for index in range(2000))
+    messages = build_messages("What are the fees?", context, _history(20), budget=2000)
+    total = sum(count_tokens(message["content"]) for message in messages)
+    # Framing overhead aside, everything fits in the budget
+    assert total <= 2000
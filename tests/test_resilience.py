@@ -0,0 +1,190 @@
+"""Hedging and the circuit breaker in `services.resilience`."""
+
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from services import resilience
+from services.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    FirstTokenTimeout,
+    StreamOutcome,
+    hedged_stream,
+    resilient_stream,
+)
+
+
+class FakeStream:
+    """Factory of a stream that waits `delay`, then yields `deltas` or raises `error`."""
+
+    def __init__(self, deltas=("hello", " world"), delay: float = 0.0, error: BaseException = None) -> None:
+        self.deltas = deltas
+        self.delay = delay
+        self.error = error
+        self.started = 0
+        self.closed = 0
+
+    def __call__(self):
+        self.started += 1
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+            for delta in self.deltas:
+                yield delta
+        finally:
+            self.closed += 1
+
+
+async def _collect(stream) -> str:
+    return "".join([delta async for delta in stream])
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(settings, "CIRCUIT_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(settings, "CIRCUIT_RESET_TIMEOUT", 0.1)
+
+
+def test_primary_serves_when_it_starts_in_time():
+    primary, backup = FakeStream(), FakeStream(("backup",))
+    outcome = StreamOutcome()
+    text = asyncio.run(_collect(hedged_stream(primary, backup, hedge_delay=0.5, outcome=outcome)))
+    assert text == "hello world"
+    assert outcome.served_by == "primary"
+    assert backup.started == 0
+
+
+def test_backup_wins_a_late_primary_and_the_primary_is_closed():
+    primary, backup = FakeStream(delay=1.0), FakeStream(("backup",))
+    outcome = StreamOutcome()
+    text = asyncio.run(_collect(hedged_stream(primary, backup, hedge_delay=0.05, outcome=outcome)))
+    assert text == "backup"
+    assert outcome.backup_served
+    assert primary.closed == 1
+
+
+def test_backup_starts_at_once_when_the_primary_fails():
+    primary, backup = FakeStream(error=RuntimeError("down")), FakeStream(("backup",))
+    started = time.monotonic()
+    text = asyncio.run(_collect(hedged_stream(primary, backup, hedge_delay=10)))
+    assert text == "backup"
+    assert time.monotonic() - started < 1
+
+
+def test_first_token_deadline():
+    async def run():
+        await _collect(hedged_stream(FakeStream(delay=1.0), first_token_timeout=0.05))
+
+    with pytest.raises(FirstTokenTimeout):
+        asyncio.run(run())
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open"
+    # A single probe at a time
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_release_returns_the_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_resilient_stream_opens_the_circuit_after_repeated_failures():
+    failing = FakeStream(error=RuntimeError("down"))
+
+    async def run():
+        for _ in range(2):
+            with pytest.raises(RuntimeError):
+                await _collect(resilient_stream("failing", failing))
+        with pytest.raises(CircuitOpenError):
+            await _collect(resilient_stream("failing", failing))
+
+    asyncio.run(run())
+    assert failing.started == 2
+
+
+def test_open_circuit_is_served_by_the_backup():
+    failing, backup = FakeStream(error=RuntimeError("down")), FakeStream(("backup",))
+    resilience.get_breaker("flaky").opened_at = time.monotonic()
+    outcome = StreamOutcome()
+    text = asyncio.run(_collect(resilient_stream("flaky", failing, backup, outcome=outcome)))
+    assert text == "backup"
+    assert outcome.backup_served
+    assert failing.started == 0
+
+
+def test_backup_wins_count_against_the_primary():
+    async def run():
+        for _ in range(2):
+            primary, backup = FakeStream(delay=1.0), FakeStream(("backup",))
+            assert await _collect(resilient_stream("slow", primary, backup, hedge_delay=0.02)) == "backup"
+
+    asyncio.run(run())
+    assert resilience.get_breaker("slow").state == "open"
+
+
+def test_success_resets_the_failure_count():
+    async def run():
+        with pytest.raises(RuntimeError):
+            await _collect(resilient_stream("recovering", FakeStream(error=RuntimeError("down"))))
+        await _collect(resilient_stream("recovering", FakeStream()))
+
+    asyncio.run(run())
+    assert resilience.get_breaker("recovering").failures == 0
+
+
+def test_primary_closed_after_its_first_token_counts_as_a_success():
+    async def run():
+        breaker = resilience.get_breaker("closing")
+        breaker.record_failure()
+        # Half-open: this request is the probe
+        breaker.opened_at = time.monotonic() - 1
+        stream = resilient_stream("closing", FakeStream(("hello", " world", "!")))
+        assert await stream.__anext__() == "hello"
+        await stream.aclose()
+        return breaker
+
+    breaker = asyncio.run(run())
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_primary_cancelled_before_its_first_token_leaves_no_verdict():
+    async def run():
+        breaker = resilience.get_breaker("cancelled")
+        breaker.record_failure()
+        task = asyncio.create_task(_collect(resilient_stream("cancelled", FakeStream(delay=1.0))))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return breaker
+
+    breaker = asyncio.run(run())
+    assert breaker.failures == 1 and not breaker._probing
@@ -0,0 +1,166 @@
+"""Admission control in `services.scheduler`."""
+
+import asyncio
+import time
+
+import pytest
+
+from config import settings
+from services import metrics
+from services import scheduler as scheduler_module
+from services.scheduler import ProviderScheduler, SchedulerBusy, TokenBucket
+from services.workers import _worker_env
+
+
+def test_token_bucket_delay_and_debt():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.delay(60) == 0
+    bucket.consume(90)
+    # 30 units of debt plus 10 more at one unit per second
+    assert bucket.delay(10) == pytest.approx(40, abs=0.1)
+    assert bucket.backlog_delay(70) == pytest.approx(100, abs=0.1)
+
+
+def test_admits_straight_away_under_the_limits():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=2)
+        first = await scheduler.acquire()
+        second = await scheduler.acquire()
+        stats = scheduler.stats()
+        first.release()
+        first.release()  # idempotent
+        second.release()
+        return stats, scheduler.stats()
+
+    during, after = asyncio.run(run())
+    assert during == {"active": 2, "queued": 0, "admitted": 2, "rejected": 0}
+    assert after["active"] == 0
+
+
+def test_queued_streams_are_admitted_by_priority_then_arrival():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=1)
+        holder = await scheduler.acquire()
+        order = []
+
+        async def wait(label: str, priority: int) -> None:
+            permit = await scheduler.acquire(priority=priority)
+            order.append(label)
+            permit.release()
+
+        tasks = []
+        for label, priority in (("low", 2), ("high-1", 0), ("normal", 1), ("high-2", 0)):
+            tasks.append(asyncio.create_task(wait(label, priority)))
+            await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 4
+        holder.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(run()) == ["high-1", "high-2", "normal", "low"]
+
+
+def test_rejects_when_the_queue_is_full():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=1, max_queue=1)
+        holder = await scheduler.acquire()
+        waiting = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerBusy) as busy:
+            await scheduler.acquire()
+        holder.release()
+        (await waiting).release()
+        return busy.value
+
+    busy = asyncio.run(run())
+    assert busy.reason == "queue_full"
+
+
+def test_rejects_from_the_rate_limit_estimate_without_waiting():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=10, tokens_per_minute=600, max_wait=5)
+        (await scheduler.acquire(tokens=600)).release()
+        started = time.monotonic()
+        with pytest.raises(SchedulerBusy) as busy:
+            # Needs a full minute of refill
+            await scheduler.acquire(tokens=600)
+        return busy.value, time.monotonic() - started
+
+    busy, elapsed = asyncio.run(run())
+    assert busy.reason == "rate_limited"
+    assert elapsed < 0.5
+
+
+def test_rejects_from_the_concurrency_estimate_once_hold_times_are_known():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=1, max_wait=5)
+        finished = await scheduler.acquire()
+        # A stream that held its slot for 30 seconds
+        finished.started -= 30
+        finished.release()
+        holder = await scheduler.acquire()
+        hold_seconds = scheduler.hold_seconds
+        with pytest.raises(SchedulerBusy) as busy:
+            await scheduler.acquire()
+        holder.release()
+        return busy.value, hold_seconds
+
+    busy, hold_seconds = asyncio.run(run())
+    assert busy.reason == "concurrency"
+    assert hold_seconds == pytest.approx(30, abs=1)
+
+
+def test_waiter_times_out_and_leaves_the_queue():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=1, max_wait=0.05)
+        holder = await scheduler.acquire()
+        with pytest.raises(SchedulerBusy) as busy:
+            await scheduler.acquire()
+        stats = scheduler.stats()
+        holder.release()
+        return busy.value, stats
+
+    busy, stats = asyncio.run(run())
+    assert busy.reason == "timeout"
+    assert stats["queued"] == 0
+
+
+def test_cancelled_waiter_does_not_keep_a_slot():
+    async def run():
+        scheduler = ProviderScheduler("test", max_concurrency=1)
+        holder = await scheduler.acquire()
+        waiting = asyncio.create_task(scheduler.acquire())
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        holder.release()
+        # The slot is free again for the next stream
+        permit = await asyncio.wait_for(scheduler.acquire(), 1)
+        permit.release()
+        return scheduler.stats()
+
+    stats = asyncio.run(run())
+    assert stats["active"] == 0 and stats["queued"] == 0
+
+
+def test_active_streams_are_exported_to_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    monkeypatch.setattr(scheduler_module, "_schedulers", {})
+
+    async def run():
+        scheduler = scheduler_module._schedulers["test"] = ProviderScheduler("test", max_concurrency=2)
+        permit = await scheduler.acquire()
+        text = metrics.render()
+        permit.release()
+        return text
+
+    assert 'sunmarke_scheduler_active{provider="test"} 1' in asyncio.run(run())
+
+
+def test_worker_token_budget_still_fits_one_prompt(monkeypatch):
+    monkeypatch.setattr(settings, "KIMI_TPM", 10000)
+    monkeypatch.setattr(settings, "KIMI_INPUT_TOKENS", 3000)
+    monkeypatch.setattr(settings, "DEEPSEEK_TPM", 60000)
+    env = _worker_env(0, 4, 8001, None)
+    assert env["KIMI_TPM"] == "3000"
+    assert env["DEEPSEEK_TPM"] == "15000"
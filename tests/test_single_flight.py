@@ -0,0 +1,183 @@
+"""Request deduplication in `services.single_flight`."""
+
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight, StreamFanout
+
+
+class Source:
+    """Upstream stream that yields each delta once `release` lets it."""
+
+    def __init__(self) -> None:
+        self.released = asyncio.Queue()
+        self.closed = False
+        self.cancelled = False
+
+    def release(self, *deltas: str) -> None:
+        for delta in deltas:
+            self.released.put_nowait(delta)
+
+    def finish(self) -> None:
+        self.released.put_nowait(None)
+
+    async def stream(self):
+        try:
+            while (delta := await self.released.get()) is not None:
+                yield delta
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        finally:
+            self.closed = True
+
+
+async def _settle() -> None:
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_single_flight_shares_one_call():
+    calls = []
+
+    async def run():
+        flight = SingleFlight("test")
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return results, flight.stats()
+
+    results, stats = asyncio.run(run())
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert stats == {"started": 1, "joined": 4, "in_flight": 0}
+
+
+def test_single_flight_survives_a_cancelled_caller():
+    async def run():
+        flight = SingleFlight("test")
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "result"
+
+        first = asyncio.create_task(flight.do("key", work))
+        second = asyncio.create_task(flight.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "result"
+
+
+def test_late_subscriber_gets_the_backlog_then_the_live_tail():
+    async def run():
+        fanout = StreamFanout("test")
+        source = Source()
+        early = fanout.subscribe("key", source.stream)
+        source.release("Hel")
+        assert await early.__anext__() == "Hel"
+        source.release("lo")
+        assert await early.__anext__() == "lo"
+
+        late = fanout.subscribe("key", source.stream)
+        # Everything so far arrives as one delta
+        assert await late.__anext__() == "Hello"
+
+        source.release(" world")
+        assert await early.__anext__() == " world"
+        assert await late.__anext__() == " world"
+        source.finish()
+        for subscriber in (early, late):
+            with pytest.raises(StopAsyncIteration):
+                await subscriber.__anext__()
+        await _settle()
+        return fanout.stats()
+
+    assert asyncio.run(run()) == {"started": 1, "joined": 1, "in_flight": 0}
+
+
+def test_detaching_one_subscriber_keeps_the_stream_for_the_others():
+    async def run():
+        fanout = StreamFanout("test")
+        source = Source()
+        leaving = fanout.subscribe("key", source.stream)
+        staying = fanout.subscribe("key", source.stream)
+        source.release("a")
+        assert await leaving.__anext__() == "a"
+        await leaving.aclose()
+        await _settle()
+        assert not source.cancelled
+
+        source.release("b")
+        source.finish()
+        return "".join([delta async for delta in staying]), source
+
+    text, source = asyncio.run(run())
+    assert text == "ab"
+    assert not source.cancelled
+
+
+def test_last_subscriber_leaving_cancels_the_upstream():
+    async def run():
+        fanout = StreamFanout("test")
+        source = Source()
+        subscriber = fanout.subscribe("key", source.stream)
+        source.release("a")
+        assert await subscriber.__anext__() == "a"
+        await subscriber.aclose()
+        await _settle()
+        return source, fanout.stats()
+
+    source, stats = asyncio.run(run())
+    assert source.cancelled and source.closed
+    assert stats["in_flight"] == 0
+
+
+def test_subscriber_closed_before_reading_still_detaches():
+    async def run():
+        fanout = StreamFanout("test")
+        source = Source()
+        subscriber = fanout.subscribe("key", source.stream)
+        # The upstream is already running while this subscriber has not read
+        await _settle()
+        await subscriber.aclose()
+        await _settle()
+        # A new subscriber starts a fresh stream instead of joining the closing one
+        again = Source()
+        fresh = fanout.subscribe("key", again.stream)
+        again.release("x")
+        again.finish()
+        return source, [delta async for delta in fresh], fanout.stats()
+
+    source, deltas, stats = asyncio.run(run())
+    assert source.cancelled
+    assert deltas == ["x"]
+    assert stats["started"] == 2
+
+
+def test_upstream_errors_reach_every_subscriber():
+    async def run():
+        fanout = StreamFanout("test")
+
+        async def failing():
+            yield "partial"
+            raise RuntimeError("provider failed")
+
+        first = fanout.subscribe("key", failing)
+        second = fanout.subscribe("key", failing)
+        outcomes = []
+        for subscriber in (first, second):
+            received = []
+            with pytest.raises(RuntimeError):
+                async for delta in subscriber:
+                    received.append(delta)
+            outcomes.append("".join(received))
+        return outcomes
+
+    assert asyncio.run(run()) == ["partial", "partial"]